@@ -3,6 +3,7 @@ import os
 from dotenv import load_dotenv
 from waitress import serve
 
+from app import metrics
 from app.app import create_app
 
 load_dotenv()
@@ -18,4 +19,6 @@ if __name__ == "__main__":
         debug = os.getenv("DEBUG", "False").lower() == "true"
         app.run(debug=debug, host=host, port=port)
     else:
-        serve(app, host=host, port=port)
+        threads = int(os.getenv("WAITRESS_THREADS", 4))
+        metrics.set_worker_threads(threads)
+        serve(app, host=host, port=port, threads=threads)
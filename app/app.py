@@ -1,21 +1,25 @@
+import atexit
 import os
 import logging
+import time
 import traceback
 from time import strftime
 
 from dotenv import load_dotenv
 from flask import (Flask, make_response, render_template,
-                   send_from_directory, request, flash, redirect, url_for)
+                   send_from_directory, request, flash, redirect, url_for, g)
 from flask_login import LoginManager, current_user
-from flask_pymongo import PyMongo
 from flask_wtf.csrf import CSRFProtect
 from flask_cors import CORS
 
+from app import metrics
 from app.auth.auth_utils import UserManager
+from app.db_monitor import command_monitor, monitoring_enabled
+from app.log_pipeline import log_fields
+from app.migrations import run_migrations
 from app.utils import limiter, get_mongodb_instance, close_mongodb_connection
 
 csrf = CSRFProtect()
-mongo = PyMongo()
 login_manager = LoginManager()
 
 # Global variable to control notification thread
@@ -45,10 +49,11 @@ def create_app():
     else:
         app.logger.info("VAPID keys configured properly.")
 
-    mongo.init_app(app)
-    app.mongo = mongo
     # csrf.init_app(app)
     limiter.init_app(app)
+    metrics.init_app(app, limiter)
+    if monitoring_enabled():
+        command_monitor.init_app(app)
     CORS(app, resources={r"/*": {"origins": "*", "methods": ["GET", "POST", "PUT", "DELETE"]}})
     # Initialize db_managers dictionary to store all database managers for proper cleanup
     app.db_managers = {}
@@ -58,17 +63,8 @@ def create_app():
         mongodb = get_mongodb_instance(app.config["MONGO_URI"])
         db = mongodb.get_db()
         
-        # Initialize collections
-        if "users" not in db.list_collection_names():
-            db.create_collection("users")
-        if "teams" not in db.list_collection_names():
-            db.create_collection("teams")
-        if "team_data" not in db.list_collection_names():
-            db.create_collection("team_data")
-        if "assignments" not in db.list_collection_names():
-            db.create_collection("assignments")
-        if "assignment_subscriptions" not in db.list_collection_names():
-            db.create_collection("assignment_subscriptions")
+        # Create collections/indexes and apply pending schema migrations
+        run_migrations(db)
             
     login_manager.init_app(app)
     login_manager.login_view = "auth.login"
@@ -98,11 +94,13 @@ def create_app():
     from app.scout.routes import scouting_bp
     from app.team.routes import team_bp
     from app.notifications.routes import notifications_bp
+    from app.media.routes import media_bp
 
     app.register_blueprint(auth_bp, url_prefix="/auth")
     app.register_blueprint(scouting_bp, url_prefix="/")
     app.register_blueprint(team_bp, url_prefix="/team")
     app.register_blueprint(notifications_bp, url_prefix="/notifications")
+    app.register_blueprint(media_bp, url_prefix="/media")
 
     @app.route("/")
     def index():
@@ -137,6 +135,7 @@ def create_app():
         if request.path.startswith('/static') or \
            request.path == '/' or \
            request.path == '/service-worker.js' or \
+           request.path == '/metrics' or \
            request.path.startswith('/auth/login') or \
            request.path.startswith('/auth/register') or \
            request.path.startswith('/auth/forgot-password'):
@@ -147,9 +146,21 @@ def create_app():
             return redirect(url_for('auth.login'))
 
     @app.after_request
-    def after_request(response): 
-        timestamp = strftime('[%Y-%b-%d %H:%M]')
-        logger.info('%s %s User: %s %s %s %s %s', timestamp, request.remote_addr, current_user.username if current_user.is_authenticated else 'Anonymous', request.method, request.scheme, request.full_path, response.status)
+    def after_request(response):
+        # Only name the user if the request already loaded it, never load it
+        # just to log (the loader hits the database)
+        user = g.get("_login_user")
+        started = g.get("metrics_started")
+        logger.info("request", extra=log_fields(
+            remote=request.remote_addr,
+            user=user.username if user is not None and user.is_authenticated else "-",
+            method=request.method,
+            path=request.path,
+            status=response.status_code,
+            # Payload size instead of the payload
+            bytes=response.content_length if not response.is_streamed else "-",
+            ms=round((time.perf_counter() - started) * 1000, 1) if started is not None else "-",
+        ))
         return response
 
     @app.route('/static/manifest.json')
@@ -176,14 +187,9 @@ def create_app():
     def offline():
         return render_template('offline.html')
 
-    # Handle application shutdown to close the singleton MongoDB connection
-    @app.teardown_appcontext
-    def teardown_db_connection(exception=None):
-        """Close the singleton MongoDB connection only during application shutdown"""
-        if exception is not None and isinstance(exception, Exception):
-            # Only close during actual application shutdown, not regular request teardown
-            close_mongodb_connection()
-            logger.info("Closed singleton MongoDB connection during application shutdown")
+    # Close the singleton MongoDB connection on process exit only; a request
+    # raising must not tear down the client shared by every other request
+    atexit.register(close_mongodb_connection)
 
     return app
 
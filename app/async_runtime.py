@@ -0,0 +1,177 @@
+"""Shared async execution layer for the async routes and background coroutines.
+
+- ``run(coro)`` runs a coroutine to completion on a long-lived event loop
+  owned by the calling thread. Each waitress/gunicorn worker thread creates
+  its loop once and reuses it for every request instead of building and
+  tearing one down per request like ``asyncio.run`` does. The WSGI thread
+  waits for its coroutine anyway, and a loop can only be run by one thread
+  at a time, so each thread drives its own; the AsyncMongoClient is kept
+  per loop (see ``MongoDB.get_async_db`` in app.utils).
+- ``spawn(coro)`` schedules a fire-and-forget coroutine on a single
+  background loop thread, so it runs to completion even after the request
+  that started it has returned. The caller's contextvars are copied into
+  the task, except that its MongoDB calls are not nested in the caller's
+  (``app.retry.leave_operation``).
+
+``get_runtime_stats()`` reports dispatch and task counts and the background
+loop's lag.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import concurrent.futures
+import contextvars
+import logging
+import os
+import threading
+import time
+
+from app.retry import leave_operation
+
+logger = logging.getLogger(__name__)
+
+# How often the background loop measures its own scheduling lag
+LAG_PROBE_INTERVAL = 1.0
+
+_local = threading.local()
+
+_background_loop = None
+_background_pid = None
+_background_lock = threading.Lock()
+
+_stats = {
+    "route_loops": 0,
+    "routes_dispatched": 0,
+    "routes_in_flight": 0,
+    "tasks_spawned": 0,
+    "tasks_completed": 0,
+    "tasks_failed": 0,
+    "loop_lag_seconds": 0.0,
+    "loop_lag_max_seconds": 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def _incr(counter, amount=1):
+    with _stats_lock:
+        _stats[counter] += amount
+
+
+# ============ Route Dispatch ============
+
+def _thread_loop():
+    """Get the calling thread's long-lived event loop"""
+    loop = getattr(_local, "loop", None)
+    if loop is None or loop.is_closed() or getattr(_local, "pid", None) != os.getpid():
+        loop = asyncio.new_event_loop()
+        _local.loop = loop
+        _local.pid = os.getpid()
+        _incr("route_loops")
+    return loop
+
+
+def run(coro):
+    """Run a coroutine to completion on the calling thread's event loop"""
+    loop = _thread_loop()
+    _incr("routes_dispatched")
+    _incr("routes_in_flight")
+    try:
+        return loop.run_until_complete(coro)
+    finally:
+        _incr("routes_in_flight", -1)
+
+
+# ============ Background Tasks ============
+
+async def _probe_lag():
+    loop = asyncio.get_running_loop()
+    while True:
+        scheduled = loop.time() + LAG_PROBE_INTERVAL
+        await asyncio.sleep(LAG_PROBE_INTERVAL)
+        lag = max(0.0, loop.time() - scheduled)
+        with _stats_lock:
+            _stats["loop_lag_seconds"] = lag
+            _stats["loop_lag_max_seconds"] = max(_stats["loop_lag_max_seconds"], lag)
+        if lag > 0.5:
+            logger.warning(f"Background event loop lagging by {lag:.2f}s")
+
+
+def _get_background_loop():
+    """Get the background loop, starting its thread on first use in this process"""
+    global _background_loop, _background_pid
+    if _background_loop is None or _background_pid != os.getpid():
+        with _background_lock:
+            if _background_loop is None or _background_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                ready = threading.Event()
+
+                def run_loop():
+                    asyncio.set_event_loop(loop)
+                    loop.create_task(_probe_lag())
+                    loop.call_soon(ready.set)
+                    loop.run_forever()
+
+                threading.Thread(target=run_loop, name="async-background", daemon=True).start()
+                ready.wait()
+                _background_loop = loop
+                _background_pid = os.getpid()
+                logger.info("Background event loop started")
+    return _background_loop
+
+
+def _on_task_done(task):
+    if task.cancelled():
+        _incr("tasks_failed")
+    elif (error := task.exception()) is not None:
+        _incr("tasks_failed")
+        logger.error(f"Background task {task.get_name()} failed: {error}", exc_info=error)
+    else:
+        _incr("tasks_completed")
+
+
+def spawn(coro, name=None):
+    """Run a coroutine in the background without waiting for it
+
+    Returns:
+        concurrent.futures.Future: Resolves with the coroutine's result
+    """
+    loop = _get_background_loop()
+    context = contextvars.copy_context()
+    # The task outlives the caller, its MongoDB calls go through the breaker
+    context.run(leave_operation)
+    future = concurrent.futures.Future()
+    _incr("tasks_spawned")
+
+    def copy_result(task):
+        if task.cancelled():
+            future.cancel()
+        elif (error := task.exception()) is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(task.result())
+
+    def create_task():
+        # Tasks copy the context current at creation, so create it inside ours
+        task = context.run(loop.create_task, coro, name=name)
+        task.add_done_callback(_on_task_done)
+        task.add_done_callback(copy_result)
+
+    loop.call_soon_threadsafe(create_task)
+    return future
+
+
+# ============ Metrics ============
+
+def get_runtime_stats():
+    """Get dispatch/task counters and the background loop's lag"""
+    with _stats_lock:
+        stats = dict(_stats)
+    loop = _background_loop
+    if loop is not None and _background_pid == os.getpid() and loop.is_running():
+        # Excludes the lag probe itself
+        stats["tasks_pending"] = max(0, len(asyncio.all_tasks(loop)) - 1)
+    else:
+        stats["tasks_pending"] = 0
+    stats["probed_at"] = time.time()
+    return stats
@@ -1,12 +1,17 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 from datetime import datetime, timezone
 
 from flask_login import current_user
 from werkzeug.security import generate_password_hash
 
+from app.auth.user_cache import invalidate_user, user_cache
+from app.media.image_pipeline import store_image
+from app.media.media_utils import delete_gridfs_file
 from app.models import User
+from app.scout.scouting_utils import sync_scouter_fields
 from app.utils import DatabaseManager, allowed_file, with_mongodb_retry, get_database_connection, get_gridfs
 
 logging.basicConfig(level=logging.INFO)
@@ -25,13 +30,6 @@ async def check_password_strength(password):
 class UserManager(DatabaseManager):
     def __init__(self, mongo_uri=None):
         super().__init__(mongo_uri)
-        self._ensure_collections()
-
-    def _ensure_collections(self):
-        """Ensure required collections exist"""
-        if "users" not in self.db.list_collection_names():
-            self.db.create_collection("users")
-            logger.info("Created users collection")
 
     @with_mongodb_retry(retries=3, delay=2)
     async def create_user(
@@ -45,11 +43,11 @@ class UserManager(DatabaseManager):
         
         try:
             # Check for existing email
-            if self.db.users.find_one({"email": email}):
+            if await self.async_db.users.find_one({"email": email}):
                 return False, "Email already registered"
 
             # Check for existing username
-            if self.db.users.find_one({"username": username}):
+            if await self.async_db.users.find_one({"username": username}):
                 return False, "Username already taken"
 
             # Check password strength
@@ -69,7 +67,7 @@ class UserManager(DatabaseManager):
                 "profile_picture_id": None,
             }
 
-            self.db.users.insert_one(user_data)
+            await self.async_db.users.insert_one(user_data)
             logger.info(f"Created new user: {username}")
             return True, "User created successfully"
 
@@ -82,13 +80,13 @@ class UserManager(DatabaseManager):
         """Authenticate user with retry mechanism"""
         
         try:
-            if user_data := self.db.users.find_one(
+            if user_data := await self.async_db.users.find_one(
                 {"$or": [{"email": login}, {"username": login}]}
             ):
                 user = User.create_from_db(user_data)
                 if user and user.check_password(password):
                     # Update last login
-                    self.db.users.update_one(
+                    await self.async_db.users.update_one(
                         {"_id": user._id},
                         {"$set": {"last_login": datetime.now(timezone.utc)}},
                     )
@@ -107,7 +105,11 @@ class UserManager(DatabaseManager):
         try:
             from bson.objectid import ObjectId
 
-            user_data = self.db.users.find_one({"_id": ObjectId(user_id)})
+            # Called by the user loader on every request, so served from cache
+            if (user_data := user_cache.get(user_id)) is None:
+                user_data = self.db.users.find_one({"_id": ObjectId(user_id)})
+                if user_data:
+                    user_cache.set(user_id, user_data)
             return User.create_from_db(user_data) if user_data else None
         except Exception as e:
             logger.error(f"Error loading user: {str(e)}")
@@ -125,7 +127,7 @@ class UserManager(DatabaseManager):
 
             # Check if username is being updated and is unique
             if 'username' in valid_updates:
-                if existing_user := self.db.users.find_one(
+                if existing_user := await self.async_db.users.find_one(
                     {
                         "username": valid_updates['username'],
                         "_id": {"$ne": ObjectId(user_id)},
@@ -133,12 +135,15 @@ class UserManager(DatabaseManager):
                 ):
                     return False, "Username already taken"
 
-            result = self.db.users.update_one(
+            result = await self.async_db.users.update_one(
                 {"_id": ObjectId(user_id)},
                 {"$set": valid_updates}
             )
+            invalidate_user(user_id)
 
             if result.modified_count > 0:
+                if 'username' in valid_updates:
+                    await asyncio.to_thread(sync_scouter_fields, self.db, user_id, scouter_name=valid_updates['username'])
                 return True, "Profile updated successfully"
             return False, "No changes made"
 
@@ -164,20 +169,21 @@ class UserManager(DatabaseManager):
             from bson.objectid import ObjectId
 
             # Get the old profile picture ID first
-            user_data = self.db.users.find_one({"_id": ObjectId(user_id)})
+            user_data = await self.async_db.users.find_one({"_id": ObjectId(user_id)})
             old_picture_id = user_data.get('profile_picture_id') if user_data else None
             
             # Update the profile picture ID
-            result = self.db.users.update_one(
+            result = await self.async_db.users.update_one(
                 {"_id": ObjectId(user_id)},
                 {"$set": {"profile_picture_id": file_id}}
             )
+            invalidate_user(user_id)
             
             # If update was successful and there was an old picture, delete it
             if result.modified_count > 0 and old_picture_id:
                 try:
-                    if get_gridfs().exists(ObjectId(old_picture_id)):
-                        get_gridfs().delete(ObjectId(old_picture_id))
+                    if await asyncio.to_thread(get_gridfs().exists, ObjectId(old_picture_id)):
+                        await asyncio.to_thread(delete_gridfs_file, old_picture_id)
                         logger.info(f"Deleted old profile picture: {old_picture_id}")
                 except Exception as e:
                     logger.error(f"Error deleting old profile picture: {str(e)}")
@@ -207,21 +213,24 @@ class UserManager(DatabaseManager):
             from bson.objectid import ObjectId
 
             # Get user data first
-            user_data = self.db.users.find_one({"_id": ObjectId(user_id)})
+            user_data = await self.async_db.users.find_one({"_id": ObjectId(user_id)})
             if not user_data:
                 return False, "User not found"
 
             # Delete profile picture if exists
             if user_data.get('profile_picture_id'):
                 try:
-                    get_gridfs().delete(ObjectId(user_data['profile_picture_id']))
+                    await asyncio.to_thread(delete_gridfs_file, user_data['profile_picture_id'])
                 except Exception as e:
                     logger.error(f"Error deleting profile picture: {str(e)}")
 
             # Delete user document
-            result = self.db.users.delete_one({"_id": ObjectId(user_id)})
+            result = await self.async_db.users.delete_one({"_id": ObjectId(user_id)})
+            invalidate_user(user_id)
             
             if result.deleted_count > 0:
+                # Hide the deleted scouter's entries from team views and leaderboards
+                await asyncio.to_thread(sync_scouter_fields, self.db, user_id, scouter_team=None, scouter_name=None)
                 return True, "Account deleted successfully"
             return False, "Failed to delete account"
 
@@ -240,7 +249,7 @@ class UserManager(DatabaseManager):
             if new_username := form_data.get('username'):
                 if new_username != current_user.username:
                     # Check if username is taken
-                    if self.db.users.find_one({"username": new_username}):
+                    if await self.async_db.users.find_one({"username": new_username}):
                         return False
                     updates['username'] = new_username
 
@@ -253,10 +262,10 @@ class UserManager(DatabaseManager):
                 from werkzeug.utils import secure_filename
                 if profile_picture and allowed_file(profile_picture.filename):
                     filename = secure_filename(profile_picture.filename)
-                    file_id = get_gridfs().put(
+                    file_id = await asyncio.to_thread(
+                        store_image,
                         profile_picture.stream.read(),
-                        filename=filename,
-                        content_type=profile_picture.content_type
+                        filename,
                     )
                     updates['profile_picture_id'] = file_id
 
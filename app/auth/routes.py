@@ -1,8 +1,6 @@
 from __future__ import annotations
 
-import asyncio
 import os
-from functools import wraps
 from urllib.parse import urljoin, urlparse
 import hashlib
 
@@ -10,14 +8,15 @@ from bson import ObjectId
 from flask import (Blueprint, current_app, flash, jsonify, redirect,
                    render_template, request, send_file, url_for)
 from flask_login import current_user, login_required, login_user, logout_user
-from flask_pymongo import PyMongo
 from werkzeug.utils import secure_filename
 
 from app.auth.auth_utils import UserManager
+from app.media.image_pipeline import store_image
+from app.media.media_utils import serve_gridfs_file
 from app.utils import (async_route, handle_route_errors, is_safe_url, limiter,
-                       send_gridfs_file, get_gridfs)
+                       get_gridfs)
 
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 def allowed_file(filename):
     return '.' in filename and \
@@ -26,11 +25,7 @@ def allowed_file(filename):
 def save_profile_picture(file):
     """Save profile picture to GridFS"""
     if file and allowed_file(file.filename):
-        return get_gridfs().put(
-            file.stream.read(),
-            filename=secure_filename(file.filename),
-            content_type=file.content_type,
-        )
+        return store_image(file.stream.read(), secure_filename(file.filename))
     return None
 
 def send_profile_picture(file_id):
@@ -54,33 +49,14 @@ def send_profile_picture(file_id):
         return send_file("static/images/default_profile.png")
 
 
-def run_async(coro):
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        return loop.run_until_complete(coro)
-    finally:
-        loop.close()
-
-
-def async_route(f):
-    @wraps(f)
-    def wrapper(*args, **kwargs):
-        return run_async(f(*args, **kwargs))
-
-    return wrapper
-
-
 auth_bp = Blueprint("auth", __name__)
 user_manager = None
-mongo = None
 
 
 @auth_bp.record
 def on_blueprint_init(state):
-    global user_manager, mongo
+    global user_manager
     app = state.app
-    mongo = PyMongo(app)
     
     # Create the UserManager with the singleton connection
     user_manager = UserManager(app.config["MONGO_URI"])
@@ -248,10 +224,10 @@ def profile_picture(user_id):
     if not user or not user.profile_picture_id:
         return send_file(os.path.join(current_app.root_path, "static", "images", "default_profile.png"))
     
-    return send_gridfs_file(
+    return serve_gridfs_file(
         user.profile_picture_id,
-        user_manager.db,
-        "static/images/default_profile.png"
+        "static/images/default_profile.png",
+        size=request.args.get("size")
     )
 
 
@@ -0,0 +1,59 @@
+"""Per-process cache of user documents for the Flask-Login user loader.
+
+``load_user`` runs on every authenticated request, so ``get_user_by_id``
+serves the user document from memory for ``USER_CACHE_TTL`` seconds
+(default 30) instead of querying ``users`` each time. Every write to a user
+document (profile, picture, team membership, deletion) calls
+``invalidate_user`` so this process sees the change on its next request;
+other workers pick it up when their entry expires.
+
+Hits, misses and invalidations are reported under ``users.by_id`` in
+``app.cache.get_cache_stats()`` (and so in /metrics).
+"""
+
+from __future__ import annotations
+
+import os
+import time
+
+from app.cache import CacheEntry, CacheStore, count_event
+
+STATS_NAME = "users.by_id"
+
+
+class UserCache:
+    """TTL cache of user documents keyed by user id"""
+
+    def __init__(self, ttl=None, maxsize=None):
+        self.ttl = ttl if ttl is not None else float(os.getenv("USER_CACHE_TTL", 30))
+        self._store = CacheStore(maxsize or int(os.getenv("USER_CACHE_SIZE", 1024)))
+
+    def get(self, user_id):
+        """Get a copy of the cached user document, or None"""
+        entry = self._store.get(str(user_id))
+        if entry is not None and entry.expires_at > time.monotonic():
+            count_event(STATS_NAME, "hits")
+            # Callers build a User from it, keep the cached one pristine
+            return dict(entry.value)
+        count_event(STATS_NAME, "misses")
+        return None
+
+    def set(self, user_id, user_data):
+        expires_at = time.monotonic() + self.ttl
+        self._store.set(str(user_id), CacheEntry(dict(user_data), expires_at, expires_at))
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            if self._store.delete(str(user_id)):
+                count_event(STATS_NAME, "invalidations")
+
+    def clear(self):
+        self._store.clear()
+
+
+user_cache = UserCache()
+
+
+def invalidate_user(*user_ids):
+    """Drop users from this process's cache after writing their documents"""
+    user_cache.invalidate(*user_ids)
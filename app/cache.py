@@ -0,0 +1,496 @@
+"""TTL caching for the external API clients.
+
+``ttl_cache`` replaces ``functools.lru_cache`` on the FTCScout/TBA client
+methods. Each method gets a ``CachePolicy``:
+
+- fresh entries (younger than ``ttl``) are returned directly
+- stale entries (younger than ``stale_ttl``) are returned immediately while a
+  single background refresh fetches the new value
+- ``None`` results (the clients return None on any API error) are cached for
+  ``negative_ttl`` only, so a transient failure is retried soon instead of
+  being remembered for the life of the worker
+- concurrent misses for the same arguments are collapsed into one upstream
+  call (single-flight) whose result every waiting caller shares
+
+Entries live on the client instance (not in a module-level cache keyed by
+``self``), and hit/miss/refresh counters per method are available from
+``get_cache_stats()``.
+
+A client can also set ``cache_backend`` to a shared backend
+(``MongoCacheBackend`` or ``SQLiteCacheBackend``, see ``create_cache_backend``)
+so every worker, and the next restart, reuses the same responses. The
+in-memory entries stay in front of it as a first level.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from functools import wraps
+from typing import NamedTuple
+
+from app import lifecycle
+
+logger = logging.getLogger(__name__)
+
+
+class CachePolicy(NamedTuple):
+    ttl: float
+    stale_ttl: float
+    negative_ttl: float = 15
+    maxsize: int = 256
+
+
+# Matches, rankings and team status change every few minutes on event day
+LIVE_DATA = CachePolicy(ttl=30, stale_ttl=300)
+# Season stats and team event lists
+STATS = CachePolicy(ttl=600, stale_ttl=3600)
+# Event catalogs and event details
+CATALOG = CachePolicy(ttl=6 * 3600, stale_ttl=24 * 3600)
+# Team info (name, location) practically never changes
+STATIC = CachePolicy(ttl=24 * 3600, stale_ttl=7 * 24 * 3600)
+
+
+class CacheEntry:
+    __slots__ = ("value", "expires_at", "stale_until", "negative")
+
+    def __init__(self, value, expires_at, stale_until, negative=False):
+        self.value = value
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+        self.negative = negative
+
+
+class Flight:
+    """An in-progress upstream call that concurrent callers wait on"""
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+_stores = weakref.WeakSet()
+
+
+class CacheStore:
+    """Thread-safe LRU store of cache entries"""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._refreshing = set()
+        self._flights = {}
+        self._lock = threading.Lock()
+        _stores.add(self)
+
+    def _reset_after_fork(self):
+        # Refreshes and flights in progress ran on the parent's threads
+        self._refreshing = set()
+        self._flights = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def start_refresh(self, key):
+        """Mark a key as refreshing; False if a refresh is already running"""
+        with self._lock:
+            if key in self._refreshing:
+                return False
+            self._refreshing.add(key)
+            return True
+
+    def finish_refresh(self, key):
+        with self._lock:
+            self._refreshing.discard(key)
+
+    def join_flight(self, key):
+        """Get the in-flight call for a key, and whether the caller leads it"""
+        with self._lock:
+            if flight := self._flights.get(key):
+                return flight, False
+            flight = self._flights[key] = Flight()
+            return flight, True
+
+    def land_flight(self, key, flight):
+        with self._lock:
+            self._flights.pop(key, None)
+        flight.done.set()
+
+    def delete(self, key):
+        with self._lock:
+            return self._entries.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# ============ Counters ============
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+COUNTERS = (
+    "hits", "stale_hits", "negative_hits", "shared_hits", "collapsed",
+    "misses", "refreshes", "refresh_failures", "flight_timeouts", "invalidations",
+)
+
+# How long a collapsed caller waits on the in-flight call before fetching itself
+FLIGHT_WAIT = 30
+
+
+def count_event(name, counter):
+    """Increment one of a cache's counters"""
+    with _stats_lock:
+        stats = _stats.setdefault(name, dict.fromkeys(COUNTERS, 0))
+        stats[counter] += 1
+
+
+def get_cache_stats():
+    """Get the counters of every cached method, with the fresh-or-stale hit ratio"""
+    with _stats_lock:
+        report = {}
+        for name, stats in _stats.items():
+            served = sum(stats[counter] for counter in ("hits", "stale_hits", "negative_hits", "shared_hits", "collapsed"))
+            lookups = served + stats["misses"]
+            report[name] = {**stats, "hit_ratio": served / lookups if lookups else 0.0}
+        return report
+
+
+# ============ Shared Backends ============
+
+class MongoCacheBackend:
+    """Cache entries in a MongoDB collection shared by every worker
+
+    Expired documents are purged by the TTL index on ``purge_at`` (declared in
+    app.migrations), so the collection only ever holds live entries.
+    """
+
+    def __init__(self, get_collection, max_entry_bytes=4 * 1024 * 1024):
+        # Resolved on every call so a forked worker uses its own client
+        self._get_collection = get_collection
+        # Stay well clear of the 16MB BSON document limit
+        self.max_entry_bytes = max_entry_bytes
+
+    @property
+    def collection(self):
+        return self._get_collection()
+
+    def get(self, key):
+        doc = self.collection.find_one({"_id": key})
+        if not doc:
+            return None
+        return json.loads(doc["value"]), doc["expires_at"], doc["purge_at"].replace(tzinfo=timezone.utc).timestamp()
+
+    def set(self, key, value, ttl, stale_ttl):
+        payload = json.dumps(value)
+        size = len(payload.encode())
+        if size > self.max_entry_bytes:
+            logger.warning(f"Not sharing cache entry {key}: {size} bytes over the {self.max_entry_bytes} byte limit")
+            return
+        now = time.time()
+        self.collection.replace_one(
+            {"_id": key},
+            {
+                "value": payload,
+                "size": size,
+                "expires_at": now + ttl,
+                "purge_at": datetime.now(timezone.utc) + timedelta(seconds=stale_ttl),
+            },
+            upsert=True,
+        )
+
+    def stats(self):
+        totals = list(self.collection.aggregate([
+            {"$group": {"_id": None, "entries": {"$sum": 1}, "bytes": {"$sum": "$size"}}}
+        ]))
+        return {"entries": totals[0]["entries"], "bytes": totals[0]["bytes"]} if totals else {"entries": 0, "bytes": 0}
+
+
+class SQLiteCacheBackend:
+    """Cache entries in a local SQLite file shared by the workers on one host
+
+    The file is capped at ``max_bytes`` of payload; the entries written
+    longest ago are evicted first.
+    """
+
+    def __init__(self, path, max_bytes=64 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    def _connection(self):
+        # Connections must not cross a fork, so reopen in every new process
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS api_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "expires_at REAL NOT NULL, purge_at REAL NOT NULL, written_at REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS api_cache_written_at ON api_cache (written_at)")
+            self._pid = os.getpid()
+        return self._conn
+
+    def get(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT value, expires_at, purge_at FROM api_cache WHERE key = ? AND purge_at > ?",
+                (key, time.time())
+            ).fetchone()
+        if not row:
+            return None
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, key, value, ttl, stale_ttl):
+        payload = json.dumps(value)
+        size = len(payload.encode())
+        if size > self.max_bytes:
+            return
+        now = time.time()
+        with self._lock:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM api_cache WHERE purge_at <= ?", (now,))
+                conn.execute(
+                    "INSERT OR REPLACE INTO api_cache VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, payload, size, now + ttl, now + stale_ttl, now)
+                )
+                total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM api_cache").fetchone()[0]
+                while total > self.max_bytes:
+                    oldest = conn.execute(
+                        "SELECT key, size FROM api_cache ORDER BY written_at LIMIT 1"
+                    ).fetchone()
+                    conn.execute("DELETE FROM api_cache WHERE key = ?", (oldest[0],))
+                    total -= oldest[1]
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._connection().execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM api_cache"
+            ).fetchone()
+        return {"entries": entries, "bytes": size}
+
+
+def create_cache_backend(db_manager=None):
+    """Create the shared backend configured by API_CACHE_BACKEND
+
+    API_CACHE_BACKEND: "mongo", "sqlite" or unset for in-memory only
+    API_CACHE_PATH: SQLite file (default api_cache.sqlite3 in the project root)
+    API_CACHE_MAX_BYTES: SQLite payload cap in bytes (default 64MB)
+    """
+    backend = os.getenv("API_CACHE_BACKEND", "").lower()
+    if backend == "mongo" and db_manager is not None:
+        return MongoCacheBackend(lambda: db_manager.db.api_cache)
+    if backend == "sqlite":
+        default_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "api_cache.sqlite3")
+        return SQLiteCacheBackend(
+            os.getenv("API_CACHE_PATH", default_path),
+            max_bytes=int(os.getenv("API_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+        )
+    if backend:
+        logger.warning(f"Unknown or unavailable API_CACHE_BACKEND {backend!r}, using in-memory cache only")
+    return None
+
+
+def _shared_get(backend, key, name):
+    try:
+        return backend.get(key)
+    except Exception as e:
+        logger.error(f"Error reading shared cache for {name}: {str(e)}")
+        return None
+
+
+def _shared_set(backend, key, name, value, policy):
+    try:
+        backend.set(key, value, policy.ttl, policy.stale_ttl)
+    except Exception as e:
+        logger.error(f"Error writing shared cache for {name}: {str(e)}")
+
+
+# ============ Background Refresh ============
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="cache-refresh")
+    return _executor
+
+
+@lifecycle.on_fork
+def _reset_after_fork():
+    global _stats_lock, _executor, _executor_lock
+    _stats_lock = threading.Lock()
+    _executor = None
+    _executor_lock = threading.Lock()
+    for store in list(_stores):
+        store._reset_after_fork()
+
+
+def _make_entry(value, policy, now):
+    if value is None:
+        return CacheEntry(None, now + policy.negative_ttl, now + policy.negative_ttl, negative=True)
+    return CacheEntry(value, now + policy.ttl, now + policy.stale_ttl)
+
+
+def _refresh(store, key, name, func, args, kwargs, policy, stale, backend=None):
+    try:
+        value = func(*args, **kwargs)
+        now = time.monotonic()
+        if value is None:
+            # Keep serving the stale value, but back off before retrying
+            count_event(name, "refresh_failures")
+            stale.expires_at = now + policy.negative_ttl
+        else:
+            store.set(key, _make_entry(value, policy, now))
+            if backend is not None:
+                _shared_set(backend, _shared_key(name, key), name, value, policy)
+            count_event(name, "refreshes")
+    except Exception as e:
+        count_event(name, "refresh_failures")
+        logger.error(f"Error refreshing cached {name}: {str(e)}")
+    finally:
+        store.finish_refresh(key)
+
+
+# ============ Decorator ============
+
+def _get_store(instance, name, policy):
+    stores = instance.__dict__.setdefault("_cache_stores", {})
+    store = stores.get(name)
+    if store is None:
+        store = stores.setdefault(name, CacheStore(policy.maxsize))
+    return store
+
+
+def _shared_key(name, key):
+    args, kwargs = key
+    return f"{name}:{json.dumps([args, kwargs], default=str)}"
+
+
+def _from_shared(backend, name, key):
+    """Load a shared entry into an in-memory entry (wall clock -> monotonic)"""
+    shared = _shared_get(backend, _shared_key(name, key), name)
+    if shared is None:
+        return None
+    value, expires_at, stale_until = shared
+    offset = time.monotonic() - time.time()
+    return CacheEntry(value, expires_at + offset, stale_until + offset)
+
+
+def ttl_cache(policy):
+    """Cache a client method's results per instance according to a CachePolicy"""
+    def decorator(func):
+        name = func.__qualname__
+
+        @wraps(func)
+        def wrapper(self, *args, **kwargs):
+            store = _get_store(self, name, policy)
+            key = (args, tuple(sorted(kwargs.items())))
+            now = time.monotonic()
+
+            entry = store.get(key)
+            if entry is not None and now < entry.expires_at:
+                count_event(name, "negative_hits" if entry.negative else "hits")
+                return entry.value
+
+            backend = getattr(self, "cache_backend", None)
+            if backend is not None:
+                # Another worker may already have refreshed it
+                if (shared := _from_shared(backend, name, key)) is not None:
+                    store.set(key, shared)
+                    if now < shared.expires_at:
+                        count_event(name, "shared_hits")
+                        return shared.value
+                    entry = shared
+
+            if entry is not None and not entry.negative and now < entry.stale_until:
+                count_event(name, "stale_hits")
+                if store.start_refresh(key):
+                    _get_executor().submit(
+                        _refresh, store, key, name, func, (self, *args), kwargs, policy, entry, backend
+                    )
+                return entry.value
+
+            flight, leader = store.join_flight(key)
+            if not leader:
+                if flight.done.wait(FLIGHT_WAIT):
+                    count_event(name, "collapsed")
+                    if flight.error is not None:
+                        raise flight.error
+                    return flight.value
+                count_event(name, "flight_timeouts")
+                return func(self, *args, **kwargs)
+
+            try:
+                # The previous flight may have landed between the lookup and now
+                entry = store.get(key)
+                if entry is not None and time.monotonic() < entry.expires_at:
+                    count_event(name, "negative_hits" if entry.negative else "hits")
+                    flight.value = entry.value
+                    return entry.value
+
+                count_event(name, "misses")
+                value = func(self, *args, **kwargs)
+                store.set(key, _make_entry(value, policy, time.monotonic()))
+                # Errors stay local to the worker, only real responses are shared
+                if backend is not None and value is not None:
+                    _shared_set(backend, _shared_key(name, key), name, value, policy)
+                flight.value = value
+                return value
+            except Exception as e:
+                flight.error = e
+                raise
+            finally:
+                store.land_flight(key, flight)
+
+        def cache_clear(instance):
+            _get_store(instance, name, policy).clear()
+
+        def cache_put(instance, value, *args, **kwargs):
+            """Swap a freshly fetched value in for the given arguments"""
+            key = (args, tuple(sorted(kwargs.items())))
+            _get_store(instance, name, policy).set(key, _make_entry(value, policy, time.monotonic()))
+            backend = getattr(instance, "cache_backend", None)
+            if backend is not None and value is not None:
+                _shared_set(backend, _shared_key(name, key), name, value, policy)
+
+        wrapper.cache_clear = cache_clear
+        wrapper.cache_put = cache_put
+        wrapper.cache_policy = policy
+        return wrapper
+    return decorator
@@ -0,0 +1,312 @@
+"""MongoDB command monitoring and slow-query profiling.
+
+``command_monitor`` is a pymongo ``CommandListener`` registered on every
+client (see ``MONGO_CLIENT_OPTIONS`` in app.utils). For each command it
+records the duration, collection, operation, documents returned and the
+Flask endpoint that issued it, and aggregates them per endpoint and per
+collection/operation so regressions show up after a deploy.
+
+- commands slower than ``MONGO_SLOW_QUERY_MS`` are logged with the shape of
+  their filter/pipeline (values replaced by their type)
+- with ``MONGO_EXPLAIN_QUERIES`` on (debug only: it re-runs the query), the
+  first slow command of each shape is explained on a background thread to
+  count the documents it examined and flag collection scans (COLLSCAN)
+
+Configured through the environment:
+    MONGO_MONITOR_ENABLED: Set to False to disable monitoring (default True)
+    MONGO_SLOW_QUERY_MS: Slow command threshold in milliseconds (default 100)
+    MONGO_EXPLAIN_QUERIES: Explain slow commands (default False)
+
+``get_query_stats()`` reports the aggregates.
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import g, has_request_context, request
+from pymongo import monitoring
+
+from app import lifecycle
+
+logger = logging.getLogger(__name__)
+
+# Commands that read or write a collection named by their first field
+COLLECTION_COMMANDS = {
+    "find", "aggregate", "count", "distinct", "insert", "update", "delete",
+    "findAndModify", "createIndexes", "listIndexes",
+}
+EXPLAINABLE_COMMANDS = {"find", "aggregate", "count", "distinct"}
+# Session/transport fields explain does not accept
+UNEXPLAINABLE_FIELDS = {"lsid", "txnNumber", "autocommit", "startTransaction"}
+# Not worth recording: handshakes, heartbeats, the explains themselves
+IGNORED_COMMANDS = {"hello", "isMaster", "ismaster", "ping", "saslStart", "saslContinue", "endSessions", "explain"}
+
+
+def command_collection(name, command):
+    """Get the collection a command runs against, or None"""
+    if name == "getMore":
+        return command.get("collection")
+    if name in COLLECTION_COMMANDS:
+        collection = command.get(name)
+        return collection if isinstance(collection, str) else None
+    return None
+
+
+def query_shape(value):
+    """Replace the literal values of a filter/pipeline with their type names"""
+    if isinstance(value, dict):
+        return {key: query_shape(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        # A list of operators keeps its shape, a list of values collapses
+        shapes = [query_shape(item) for item in value]
+        if shapes and not any(isinstance(item, (dict, list)) for item in shapes):
+            return [shapes[0]]
+        return shapes
+    return type(value).__name__
+
+
+def _command_shape(name, command):
+    if name == "aggregate":
+        return query_shape(command.get("pipeline", []))
+    if name in ("find", "count", "distinct"):
+        return query_shape(command.get("filter") or command.get("query") or {})
+    if name in ("update", "delete"):
+        statements = command.get("updates" if name == "update" else "deletes") or []
+        return query_shape(statements[0].get("q", {})) if statements else {}
+    if name == "findAndModify":
+        return query_shape(command.get("query", {}))
+    return None
+
+
+def _docs_returned(name, reply):
+    cursor = reply.get("cursor")
+    if isinstance(cursor, dict):
+        return len(cursor.get("firstBatch") or cursor.get("nextBatch") or [])
+    if name == "findAndModify":
+        return 1 if reply.get("value") else 0
+    if name == "distinct":
+        return len(reply.get("values") or [])
+    return reply.get("n", 0)
+
+
+def _find_plan_stages(plan, stages=None):
+    """Collect every ``stage`` name in an explain output"""
+    stages = set() if stages is None else stages
+    if isinstance(plan, dict):
+        if isinstance(plan.get("stage"), str):
+            stages.add(plan["stage"])
+        for value in plan.values():
+            _find_plan_stages(value, stages)
+    elif isinstance(plan, list):
+        for value in plan:
+            _find_plan_stages(value, stages)
+    return stages
+
+
+def _sum_field(plan, field):
+    """Sum every occurrence of a counter in an explain output"""
+    if isinstance(plan, dict):
+        return sum(
+            value if key == field and isinstance(value, int) else _sum_field(value, field)
+            for key, value in plan.items()
+        )
+    if isinstance(plan, list):
+        return sum(_sum_field(value, field) for value in plan)
+    return 0
+
+
+def _new_totals():
+    return {"commands": 0, "failures": 0, "slow": 0, "total_ms": 0.0, "max_ms": 0.0, "docs_returned": 0}
+
+
+class CommandMonitor(monitoring.CommandListener):
+    """Records timings of every MongoDB command"""
+
+    def __init__(self):
+        self.configure()
+        # (request id, connection) -> details of commands in flight
+        self._pending = {}
+        self._endpoints = {}
+        self._operations = {}
+        self._requests = {}
+        self._explained = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def configure(self, slow_ms=None, explain=None):
+        """Set the slow threshold and explain mode, from the environment by default"""
+        self.slow_ms = slow_ms if slow_ms is not None else float(os.getenv("MONGO_SLOW_QUERY_MS", 100))
+        self.explain = explain if explain is not None else os.getenv("MONGO_EXPLAIN_QUERIES", "False").lower() == "true"
+
+    def _reset_after_fork(self):
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def init_app(self, app):
+        """Count requests per endpoint so commands per request can be derived"""
+        # The .env file is loaded by now
+        self.configure()
+
+        @app.teardown_request
+        def record_request_commands(exception=None):
+            endpoint = request.endpoint or "unknown"
+            commands = g.get("db_commands", 0)
+            with self._lock:
+                totals = self._requests.setdefault(endpoint, {"requests": 0, "commands": 0, "max_commands": 0})
+                totals["requests"] += 1
+                totals["commands"] += commands
+                totals["max_commands"] = max(totals["max_commands"], commands)
+
+    # ============ Listener Callbacks ============
+
+    def started(self, event):
+        name = event.command_name
+        if name in IGNORED_COMMANDS:
+            return
+        endpoint = "background"
+        if has_request_context():
+            endpoint = request.endpoint or "unknown"
+            g.db_commands = g.get("db_commands", 0) + 1
+        command = event.command
+        self._pending[(event.request_id, event.connection_id)] = {
+            "name": name,
+            "collection": command_collection(name, command),
+            "endpoint": endpoint,
+            "database": event.database_name,
+            # Kept only while in flight, for the slow log and explain
+            "command": command,
+        }
+
+    def succeeded(self, event):
+        info = self._pending.pop((event.request_id, event.connection_id), None)
+        if info is not None:
+            self._record(info, event.duration_micros / 1000, _docs_returned(info["name"], event.reply))
+
+    def failed(self, event):
+        info = self._pending.pop((event.request_id, event.connection_id), None)
+        if info is not None:
+            self._record(info, event.duration_micros / 1000, 0, failure=event.failure)
+
+    # ============ Aggregation ============
+
+    def _record(self, info, duration_ms, docs, failure=None):
+        slow = duration_ms >= self.slow_ms
+        operation = f"{info['collection'] or info['database']}.{info['name']}"
+        with self._lock:
+            for totals in (
+                self._endpoints.setdefault(info["endpoint"], _new_totals()),
+                self._operations.setdefault(operation, _new_totals()),
+            ):
+                totals["commands"] += 1
+                totals["total_ms"] += duration_ms
+                totals["max_ms"] = max(totals["max_ms"], duration_ms)
+                totals["docs_returned"] += docs
+                if failure is not None:
+                    totals["failures"] += 1
+                if slow:
+                    totals["slow"] += 1
+
+        if failure is not None:
+            logger.warning(f"MongoDB {operation} failed after {duration_ms:.1f}ms from {info['endpoint']}: {failure}")
+        if slow:
+            shape = _command_shape(info["name"], info["command"])
+            logger.warning(
+                f"Slow MongoDB {operation} took {duration_ms:.1f}ms from {info['endpoint']}, "
+                f"returned {docs} docs, shape {json.dumps(shape, default=str)}"
+            )
+            if self.explain and info["name"] in EXPLAINABLE_COMMANDS:
+                self._schedule_explain(operation, shape, info)
+
+    # ============ Explain ============
+
+    def _schedule_explain(self, operation, shape, info):
+        key = f"{operation}:{json.dumps(shape, sort_keys=True, default=str)}"
+        with self._lock:
+            # One explain per shape is enough
+            if key in self._explained:
+                return
+            self._explained[key] = None
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="mongo-explain")
+        self._executor.submit(self._explain, key, operation, info)
+
+    def _explain(self, key, operation, info):
+        # Imported here: app.utils registers this monitor on its clients
+        from app.utils import get_mongodb_instance
+
+        command = {
+            field: value for field, value in info["command"].items()
+            if not field.startswith("$") and field not in UNEXPLAINABLE_FIELDS
+        }
+        try:
+            client = get_mongodb_instance().get_client()
+            plan = client[info["database"]].command({"explain": command, "verbosity": "executionStats"})
+        except Exception as e:
+            logger.error(f"Error explaining {operation}: {str(e)}")
+            return
+
+        stages = _find_plan_stages(plan)
+        result = {
+            "collscan": "COLLSCAN" in stages,
+            "docs_examined": _sum_field(plan, "totalDocsExamined"),
+            "keys_examined": _sum_field(plan, "totalKeysExamined"),
+            "endpoint": info["endpoint"],
+        }
+        with self._lock:
+            self._explained[key] = result
+        if result["collscan"]:
+            logger.warning(
+                f"COLLSCAN in {operation} from {info['endpoint']}: "
+                f"examined {result['docs_examined']} docs, {result['keys_examined']} keys"
+            )
+        else:
+            logger.info(
+                f"Explained {operation}: examined {result['docs_examined']} docs, "
+                f"{result['keys_examined']} keys, stages {sorted(stages)}"
+            )
+
+    # ============ Metrics ============
+
+    def get_stats(self):
+        with self._lock:
+            def finish(totals):
+                return {
+                    **totals,
+                    "avg_ms": totals["total_ms"] / totals["commands"] if totals["commands"] else 0.0,
+                }
+            endpoints = {}
+            for endpoint, totals in self._endpoints.items():
+                endpoints[endpoint] = finish(totals)
+                if requests := self._requests.get(endpoint):
+                    endpoints[endpoint]["requests"] = requests["requests"]
+                    endpoints[endpoint]["commands_per_request"] = requests["commands"] / requests["requests"]
+                    endpoints[endpoint]["max_commands_per_request"] = requests["max_commands"]
+            return {
+                "endpoints": endpoints,
+                "operations": {operation: finish(totals) for operation, totals in self._operations.items()},
+                "explained": {key: result for key, result in self._explained.items() if result is not None},
+                "in_flight": len(self._pending),
+            }
+
+
+command_monitor = CommandMonitor()
+
+
+@lifecycle.on_fork
+def _reset_after_fork():
+    command_monitor._reset_after_fork()
+
+
+def monitoring_enabled():
+    return os.getenv("MONGO_MONITOR_ENABLED", "True").lower() != "false"
+
+
+def get_query_stats():
+    """Get command counts and latencies per endpoint and per collection/operation"""
+    return command_monitor.get_stats()
@@ -0,0 +1,167 @@
+"""Shared HTTP session for the outbound API clients (FTCScout, TBA).
+
+One pooled ``requests.Session`` per process keeps TLS connections to the
+APIs alive between calls, retries 429/5xx responses with backoff and records
+how long every call took per host.
+
+Configured through the environment:
+    HTTP_POOL_SIZE: Connections kept alive per host (default 10)
+    HTTP_MAX_RETRIES: Retries on connection errors, 429 and 5xx (default 2)
+    HTTP_RETRY_BACKOFF: Backoff factor in seconds between retries (default 0.3)
+    HTTP_FANOUT_WORKERS: Threads issuing independent calls concurrently (default 8)
+
+``fan_out`` issues independent calls concurrently under one deadline.
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app import lifecycle
+
+logger = logging.getLogger(__name__)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+@lifecycle.on_fork
+def _reset_after_fork():
+    # Pooled sockets and executor threads belong to the parent
+    global _session, _session_lock, _stats_lock, _executor, _executor_lock
+    _session = None
+    _session_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+def _record_timing(response, *args, **kwargs):
+    """Response hook recording per-host call timings"""
+    host = urlparse(response.url).netloc
+    elapsed = response.elapsed.total_seconds()
+    with _stats_lock:
+        stats = _stats.setdefault(host, {
+            "count": 0,
+            "errors": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+        })
+        stats["count"] += 1
+        stats["total_seconds"] += elapsed
+        stats["max_seconds"] = max(stats["max_seconds"], elapsed)
+        if response.status_code >= 400:
+            stats["errors"] += 1
+    logger.debug(f"{response.request.method} {response.url} -> {response.status_code} in {elapsed * 1000:.0f}ms")
+
+
+def create_session(pool_size=None, max_retries=None, backoff=None):
+    """Create a pooled session with the retry policy applied to http and https"""
+    pool_size = pool_size or int(os.getenv("HTTP_POOL_SIZE", 10))
+    max_retries = max_retries if max_retries is not None else int(os.getenv("HTTP_MAX_RETRIES", 2))
+    backoff = backoff if backoff is not None else float(os.getenv("HTTP_RETRY_BACKOFF", 0.3))
+
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUSES,
+        # GraphQL queries go out as POST but are safe to repeat
+        allowed_methods=frozenset({"GET", "POST"}),
+        # Calls run on the request path: a Retry-After of minutes would park
+        # the worker, so 429s back off like any other retried status
+        respect_retry_after_header=False,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Accept-Encoding": "gzip, deflate"})
+    session.hooks["response"].append(_record_timing)
+    return session
+
+
+def get_session():
+    """Get the process-wide shared session"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+def get_request_stats():
+    """Get call count, error count and timings per host"""
+    with _stats_lock:
+        return {
+            host: {
+                **stats,
+                "avg_seconds": stats["total_seconds"] / stats["count"] if stats["count"] else 0.0,
+            }
+            for host, stats in _stats.items()
+        }
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("HTTP_FANOUT_WORKERS", 8)),
+                    thread_name_prefix="http-fanout",
+                )
+    return _executor
+
+
+def fan_out(calls, deadline, executor=None):
+    """Run independent calls concurrently until a deadline
+
+    Args:
+        calls: Dict of name -> (function, *args)
+        deadline: time.monotonic() value to stop waiting at
+        executor: Pool to run them on instead of the shared request-path one
+
+    Returns:
+        tuple: (results by name, names of the calls that missed the deadline).
+        Calls that raised or missed the deadline are left out of the results.
+    """
+    executor = executor or _get_executor()
+    futures = {
+        executor.submit(call[0], *call[1:]): name
+        for name, call in calls.items()
+    }
+    done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+
+    results = {}
+    for future in done:
+        name = futures[future]
+        try:
+            results[name] = future.result()
+        except Exception as e:
+            logger.error(f"Concurrent call {name} failed: {str(e)}")
+
+    # Late calls keep running in the background (and warm the API cache)
+    timed_out = [futures[future] for future in not_done]
+    if timed_out:
+        logger.warning(f"Calls missed the deadline: {', '.join(map(str, timed_out))}")
+    return results, timed_out
@@ -0,0 +1,74 @@
+"""Process lifecycle: background services and fork safety.
+
+Gunicorn with ``--preload`` imports the app (and runs ``create_app``) once in
+the master and then forks the workers. Threads do not survive a fork and
+clients holding sockets (MongoClient, requests sessions) must not be shared
+with the children, so:
+
+- modules register ``on_fork`` handlers that drop their per-process state in
+  the child (it is recreated lazily on next use)
+- background threads are registered with ``register_service`` and started
+  once per process: immediately, unless ``CASTLE_DEFER_SERVICES`` is set (see
+  gunicorn.conf.py), in which case the ``post_fork`` hook starts them in each
+  worker through ``start_services``
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+_services = {}
+_fork_handlers = []
+_started_pid = None
+_lock = threading.Lock()
+
+
+def on_fork(handler):
+    """Register a function to reset per-process state in a forked child"""
+    _fork_handlers.append(handler)
+    return handler
+
+
+def _after_fork_in_child():
+    global _lock
+    _lock = threading.Lock()
+    for handler in _fork_handlers:
+        try:
+            handler()
+        except Exception as e:
+            logger.error(f"Error in fork handler {handler.__qualname__}: {str(e)}")
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def _deferred():
+    return os.getenv("CASTLE_DEFER_SERVICES", "").lower() in ("1", "true")
+
+
+def register_service(name, start):
+    """Register a background service, starting it now unless startup is deferred"""
+    with _lock:
+        _services[name] = start
+        start_now = _started_pid == os.getpid() or not _deferred()
+    if start_now:
+        start()
+
+
+def start_services():
+    """Start every registered service in this process (called after fork)"""
+    global _started_pid
+    with _lock:
+        _started_pid = os.getpid()
+        services = list(_services.items())
+    for name, start in services:
+        try:
+            start()
+            logger.info(f"Started {name} in process {os.getpid()}")
+        except Exception as e:
+            logger.error(f"Failed to start {name}: {str(e)}")
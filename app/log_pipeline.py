@@ -0,0 +1,222 @@
+"""Asynchronous, structured and sampled logging.
+
+Every record is handed to a ``QueueHandler`` on the root logger, so a
+request thread only pays for putting the record on a queue. A background
+``QueueListener`` formats and writes it to:
+
+- the console, colored
+- ``logs/app.log`` as key/value lines, rotated at ``LOG_MAX_BYTES`` into
+  gzip-compressed backups (``LOG_BACKUP_COUNT`` kept)
+
+Records carry extra key/value pairs through ``extra={"fields": {...}}``.
+
+INFO and lower records of a request are sampled per route: ``LOG_SAMPLE_RATES``
+maps endpoints to the share of their requests that log, e.g.
+``scouting.get_ftc_matches=0.1,scouting.compare_teams=0.25`` (everything else
+uses ``LOG_SAMPLE_DEFAULT``, 1.0). The decision is made once per request, so a
+sampled request keeps all its lines. Warnings and errors are never dropped.
+
+Configured through the environment:
+    LOG_LEVEL: Root log level (default INFO)
+    LOG_FILE: Log file path (default logs/app.log in the project root)
+    LOG_MAX_BYTES: Size at which the file is rotated (default 10MB)
+    LOG_BACKUP_COUNT: Compressed backups kept (default 5)
+    LOG_SAMPLE_RATES / LOG_SAMPLE_DEFAULT: See above
+"""
+
+from __future__ import annotations
+
+import atexit
+import gzip
+import logging
+import os
+import queue
+import random
+import shutil
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+import colorlog
+from flask import g, has_request_context, request
+
+from app import lifecycle
+
+_queue_handler = None
+_listener = None
+
+
+# ============ Formatting ============
+
+def _format_value(value):
+    text = str(value)
+    if not text or any(char in text for char in ' ="\n'):
+        return '"' + text.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+    return text
+
+
+class KeyValueFormatter(logging.Formatter):
+    """Formats records as ``key=value`` pairs, one record per line"""
+
+    def format(self, record):
+        pairs = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "src": f"{record.module}:{record.lineno}",
+            "msg": record.getMessage(),
+        }
+        pairs.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            pairs["exc"] = self.formatException(record.exc_info)
+        return " ".join(f"{key}={_format_value(value)}" for key, value in pairs.items())
+
+
+# ============ Rotation ============
+
+def _gzip_namer(name):
+    return f"{name}.gz"
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as src, gzip.open(dest, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    os.remove(source)
+
+
+class CompressedRotatingFileHandler(RotatingFileHandler):
+    """Size-rotated log file with gzip backups, shared by several processes
+
+    Under gunicorn every worker writes the same file. When one of them rotates
+    it, the others follow the new file instead of rotating again.
+    """
+
+    def __init__(self, filename, max_bytes, backup_count):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding="utf-8", delay=True)
+        self.namer = _gzip_namer
+        self.rotator = _gzip_rotator
+
+    def _rotated_elsewhere(self):
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def shouldRollover(self, record):
+        if self.stream is not None and self._rotated_elsewhere():
+            self.stream.close()
+            self.stream = self._open()
+        return super().shouldRollover(record)
+
+
+# ============ Sampling ============
+
+def _parse_rates(spec):
+    rates = {}
+    for item in spec.split(","):
+        endpoint, _, rate = item.partition("=")
+        if endpoint.strip() and rate.strip():
+            rates[endpoint.strip()] = float(rate)
+    return rates
+
+
+class RouteSamplingFilter(logging.Filter):
+    """Keeps the INFO records of a sampled share of each route's requests"""
+
+    def __init__(self, rates=None, default=None):
+        super().__init__()
+        self.rates = rates if rates is not None else _parse_rates(os.getenv("LOG_SAMPLE_RATES", ""))
+        self.default = default if default is not None else float(os.getenv("LOG_SAMPLE_DEFAULT", 1.0))
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or not has_request_context():
+            return True
+        sampled = g.get("log_sampled")
+        if sampled is None:
+            rate = self.rates.get(request.endpoint, self.default)
+            sampled = g.log_sampled = rate >= 1.0 or random.random() < rate
+        return sampled
+
+
+# ============ Setup ============
+
+def _console_handler(level):
+    handler = logging.StreamHandler()
+    handler.setLevel(level)
+    handler.setFormatter(colorlog.ColoredFormatter(
+        '%(log_color)s%(asctime)s - %(levelname)s - %(message)s',
+        log_colors={
+            'DEBUG': 'cyan',
+            'INFO': 'green',
+            'WARNING': 'yellow',
+            'ERROR': 'red',
+            'CRITICAL': 'red,bg_white',
+        },
+        datefmt='%Y-%m-%d %H:%M:%S'
+    ))
+    return handler
+
+
+def _file_handler(level):
+    default_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "logs", "app.log")
+    path = os.getenv("LOG_FILE", default_path)
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    handler = CompressedRotatingFileHandler(
+        path,
+        max_bytes=int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024)),
+        backup_count=int(os.getenv("LOG_BACKUP_COUNT", 5)),
+    )
+    handler.setLevel(level)
+    handler.setFormatter(KeyValueFormatter())
+    return handler
+
+
+def setup_logging():
+    """Route the root logger through the queue to the console and log file
+
+    Returns:
+        str: Path of the log file
+    """
+    global _queue_handler, _listener
+    level = getattr(logging, os.getenv("LOG_LEVEL", "INFO").upper(), logging.INFO)
+
+    root_logger = logging.getLogger()
+    root_logger.setLevel(level)
+    # Clear any existing handlers (in case of app restart)
+    if _listener is not None:
+        _listener.stop()
+    root_logger.handlers.clear()
+
+    file_handler = _file_handler(level)
+    _queue_handler = QueueHandler(queue.SimpleQueue())
+    _queue_handler.addFilter(RouteSamplingFilter())
+    _listener = QueueListener(
+        _queue_handler.queue, _console_handler(level), file_handler, respect_handler_level=True
+    )
+    _listener.start()
+    root_logger.addHandler(_queue_handler)
+    return file_handler.baseFilename
+
+
+def _stop_listener():
+    # Flush what is still queued
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+
+
+atexit.register(_stop_listener)
+
+
+@lifecycle.on_fork
+def _restart_listener_after_fork():
+    # The writer thread stays in the parent: give the child its own queue and writer
+    global _listener
+    if _listener is None:
+        return
+    _queue_handler.queue = queue.SimpleQueue()
+    _listener = QueueListener(_queue_handler.queue, *_listener.handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def log_fields(**fields):
+    """Build the ``extra`` argument attaching key/value fields to a record"""
+    return {"fields": fields}
@@ -0,0 +1,5 @@
+from .image_pipeline import store_image
+from .media_utils import delete_gridfs_file, serve_gridfs_file
+from .routes import media_bp
+
+__all__ = ["media_bp", "serve_gridfs_file", "delete_gridfs_file", "store_image"]
@@ -0,0 +1,333 @@
+"""Resized, metadata-free variants of uploaded images.
+
+Uploads are checked to be an actual image (``validate_image``, which parses
+the headers without decoding the pixels) and parked as they came in by
+``store_image``, with the content type of their decoded format (the
+client's content type is never trusted). Parked uploads have
+``metadata.upload_of`` set to the id handed back to the caller, and are
+never served. Everything else happens on a small background pool: the
+upload is re-encoded in its own format without EXIF (GPS included), ICC,
+XMP or text metadata and stored as the original under that id, the parked
+copy is deleted, and for each size in ``VARIANT_SIZES`` the image gets a
+WebP file and a PNG (transparent images) or JPEG fallback. Variants are
+re-encoded without EXIF/ICC data too, after applying the EXIF orientation.
+Until the original exists, its id serves nothing (see
+app.media.media_utils).
+
+Variants are ordinary GridFS files with ``metadata.variant_of`` pointing at
+the original; the original's ``metadata.variants`` maps size -> format ->
+variant id, so serving a size is a single lookup (cached per process).
+Images uploaded before this existed, and uploads whose processing was lost
+with their worker, are processed on first request.
+
+Configured through the environment:
+    IMAGE_WORKERS: Threads processing uploads (default 2)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from bson import ObjectId
+from gridfs.errors import FileExists, NoFile
+from PIL import Image, ImageOps
+
+from app import lifecycle
+from app.cache import CacheEntry, CacheStore
+from app.utils import get_gridfs, get_mongodb_instance
+
+logger = logging.getLogger(__name__)
+
+# Longest edge in pixels; "full" is what a bare URL serves
+VARIANT_SIZES = {
+    "thumb": 96,
+    "medium": 256,
+    "full": 1024,
+}
+DEFAULT_SIZE = "full"
+# Formats accepted for uploads
+UPLOAD_FORMATS = ("PNG", "JPEG", "GIF", "WEBP")
+ORIENTATION_TAG = 0x0112
+
+_executor = None
+_executor_lock = threading.Lock()
+_processing = set()
+_processing_lock = threading.Lock()
+# original id -> variants map ({} when it is served as is); unset while unprocessed
+_variants = CacheStore(4096)
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=int(os.getenv("IMAGE_WORKERS", 2)),
+                    thread_name_prefix="image-pipeline",
+                )
+    return _executor
+
+
+@lifecycle.on_fork
+def _reset_after_fork():
+    global _executor, _executor_lock, _processing, _processing_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _processing = set()
+    _processing_lock = threading.Lock()
+
+
+def _fs_files():
+    return get_mongodb_instance().get_db().fs.files
+
+
+# ============ Processing ============
+
+def _encode(image, image_format, **options):
+    buffer = BytesIO()
+    # Nothing but pixels is written: no exif/icc_profile passed
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
+
+
+def _render_variants(data):
+    """Encode every size/format of an image
+
+    Returns:
+        dict: size -> format -> (bytes, content type, extension)
+    """
+    with Image.open(BytesIO(data)) as source:
+        image = ImageOps.exif_transpose(source)
+        transparent = image.mode in ("RGBA", "LA", "PA") or (image.mode == "P" and "transparency" in image.info)
+        image = image.convert("RGBA" if transparent else "RGB")
+
+    rendered = {}
+    for size, edge in VARIANT_SIZES.items():
+        resized = image.copy()
+        resized.thumbnail((edge, edge), Image.LANCZOS)
+        if transparent:
+            fallback = (_encode(resized, "PNG", optimize=True), "image/png", "png")
+        else:
+            fallback = (_encode(resized, "JPEG", quality=85, optimize=True, progressive=True), "image/jpeg", "jpg")
+        rendered[size] = {
+            "webp": (_encode(resized, "WEBP", quality=80, method=4), "image/webp", "webp"),
+            "default": fallback,
+        }
+    return rendered
+
+
+def strip_metadata(data):
+    """Re-encode an upload in its own format with nothing but its pixels
+
+    The EXIF orientation is applied first so the image still shows upright.
+
+    Returns:
+        bytes: The re-encoded image
+    """
+    with Image.open(BytesIO(data)) as source:
+        image_format = source.format
+        options = {}
+        if "transparency" in source.info and image_format in ("PNG", "GIF"):
+            options["transparency"] = source.info["transparency"]
+
+        if getattr(source, "n_frames", 1) > 1:
+            # Keep animations as they are, only their timing is carried over
+            return _encode(
+                source, image_format, save_all=True,
+                duration=source.info.get("duration", 100), loop=source.info.get("loop", 0), **options
+            )
+
+        upright = source.getexif().get(ORIENTATION_TAG, 1) == 1
+        image = source if upright else ImageOps.exif_transpose(source)
+        if image_format == "JPEG":
+            # An unrotated JPEG keeps its quantization, so it is not degraded further
+            options.update({"quality": "keep", "subsampling": "keep"} if upright else {"quality": 90})
+        elif image_format == "PNG":
+            options["optimize"] = True
+        elif image_format == "WEBP":
+            options["quality"] = 90
+        return _encode(image, image_format, **options)
+
+
+def _store_original(fs, file_id):
+    """Store the metadata-free original of a parked upload under its id
+
+    Returns:
+        tuple: (image bytes, filename), None when the upload is gone or
+        another worker stored it first
+    """
+    upload = fs.find_one({"metadata.upload_of": file_id})
+    if upload is None:
+        return None
+    data = strip_metadata(upload.read())
+    try:
+        fs.put(data, _id=file_id, filename=upload.filename, content_type=upload.content_type)
+    except FileExists:
+        return None
+    if _fs_files().delete_one({"_id": upload._id}).deleted_count == 0:
+        # Deleted (delete_gridfs_file) while we worked
+        fs.delete(file_id)
+        return None
+    fs.delete(upload._id)
+    return data, upload.filename
+
+
+def process_image(file_id):
+    """Store the original of an upload and create and link its variants (idempotent)"""
+    fs = get_gridfs()
+    try:
+        original = fs.get(file_id)
+    except NoFile:
+        if (stored := _store_original(fs, file_id)) is None:
+            return
+        data, filename = stored
+    else:
+        metadata = original.metadata or {}
+        if metadata.get("variants") or metadata.get("variant_of") or metadata.get("variants_error"):
+            return
+        data, filename = original.read(), original.filename
+
+    rendered = _render_variants(data)
+    stem = os.path.splitext(filename or str(file_id))[0]
+    variants = {}
+    for size, formats in rendered.items():
+        variants[size] = {}
+        for image_format, (data, content_type, extension) in formats.items():
+            variants[size][image_format] = fs.put(
+                data,
+                filename=f"{stem}_{size}.{extension}",
+                content_type=content_type,
+                metadata={"variant_of": file_id, "variant": f"{size}.{image_format}"},
+            )
+
+    result = _fs_files().update_one({"_id": file_id}, {"$set": {"metadata.variants": variants}})
+    if result.matched_count == 0:
+        # The original was deleted while we worked
+        for formats in variants.values():
+            for variant_id in formats.values():
+                fs.delete(variant_id)
+        return
+    logger.info(f"Created {sum(len(formats) for formats in variants.values())} variants of image {file_id}")
+
+
+def _process_in_background(file_id):
+    try:
+        process_image(file_id)
+    except Exception as e:
+        logger.error(f"Error processing image {file_id}: {str(e)}")
+        try:
+            # Serve the original (if stored) from now on instead of retrying on every request
+            _fs_files().update_many(
+                {"$or": [{"_id": file_id}, {"metadata.upload_of": file_id}]},
+                {"$set": {"metadata.variants_error": str(e)}},
+            )
+        except Exception as record_error:
+            logger.error(f"Could not record the processing error of image {file_id}: {str(record_error)}")
+    finally:
+        with _processing_lock:
+            _processing.discard(file_id)
+
+
+def schedule_processing(file_id):
+    """Queue an image for processing unless it already is"""
+    if isinstance(file_id, str):
+        file_id = ObjectId(file_id)
+    with _processing_lock:
+        if file_id in _processing:
+            return
+        _processing.add(file_id)
+    _get_executor().submit(_process_in_background, file_id)
+
+
+def validate_image(data):
+    """Check that uploaded bytes decode as an image in UPLOAD_FORMATS
+
+    Returns:
+        str: Content type of the decoded format
+
+    Raises:
+        ValueError: The data is not a (supported) image
+    """
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image_format = image.format
+            image.verify()
+    except Exception as e:
+        raise ValueError(f"Not a valid image: {str(e)}") from e
+    if image_format not in UPLOAD_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    return Image.MIME[image_format]
+
+
+def store_image(data, filename):
+    """Validate and park an uploaded image and queue its processing
+
+    Returns:
+        ObjectId: Id the original is stored under once processed, which is
+        what callers keep
+
+    Raises:
+        ValueError: The data is not a (supported) image
+    """
+    content_type = validate_image(data)
+    file_id = ObjectId()
+    get_gridfs().put(data, filename=filename, content_type=content_type, metadata={"upload_of": file_id})
+    schedule_processing(file_id)
+    return file_id
+
+
+# ============ Lookup ============
+
+def get_variants(file_id):
+    """Get an original's variants map, or None while it is unprocessed"""
+    entry = _variants.get(file_id)
+    if entry is not None:
+        return entry.value
+    doc = _fs_files().find_one({"_id": file_id}, {"metadata": 1})
+    if doc is None:
+        # Parked upload whose processing was lost with its worker
+        if _fs_files().find_one(
+            {"metadata.upload_of": file_id, "metadata.variants_error": {"$exists": False}}, {"_id": 1}
+        ):
+            schedule_processing(file_id)
+        return None
+    metadata = doc.get("metadata") or {}
+    if metadata.get("variant_of") or metadata.get("variants_error"):
+        # Served as is, remember that too
+        _variants.set(file_id, CacheEntry({}, float("inf"), float("inf")))
+        return None
+    if variants := metadata.get("variants"):
+        _variants.set(file_id, CacheEntry(variants, float("inf"), float("inf")))
+        return variants
+    # Uploaded before the pipeline existed, or still being processed
+    schedule_processing(file_id)
+    return None
+
+
+def resolve_variant(file_id, size=None, webp=False):
+    """Get the id of the file to serve for a size, the original when not ready"""
+    variants = get_variants(file_id)
+    if not variants:
+        return file_id
+    formats = variants.get(size if size in VARIANT_SIZES else DEFAULT_SIZE) or {}
+    return formats.get("webp" if webp else "default") or file_id
+
+
+def variant_ids(file_id):
+    """Get the ids of every variant of an original, and of its upload if still parked"""
+    return [
+        doc["_id"]
+        for doc in _fs_files().find(
+            {"$or": [{"metadata.variant_of": file_id}, {"metadata.upload_of": file_id}]},
+            {"_id": 1},
+        )
+    ]
+
+
+def forget_variants(file_id):
+    _variants.delete(file_id)
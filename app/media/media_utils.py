@@ -0,0 +1,197 @@
+"""Serving GridFS files (profile pictures, team logos) over HTTP.
+
+GridFS files never change once written (a new upload gets a new id), so the
+file id is a strong ETag on its own: a request whose ``If-None-Match``
+matches is answered 304 without touching GridFS at all.
+
+Everything else is streamed chunk by chunk from GridFS with range support,
+except small files, which are kept in a byte-bounded in-memory LRU so the
+hottest logos and avatars are served without a database read.
+
+Images are served through their resized, metadata-free variants (see
+app.media.image_pipeline): ``size`` picks one and WebP is sent to browsers
+that accept it. An upload serves nothing (its default, or a 404) until its
+metadata-free original is stored.
+
+Configured through the environment:
+    MEDIA_CACHE_BYTES: Total size of the in-memory LRU (default 16MB)
+    MEDIA_CACHE_MAX_FILE_BYTES: Largest file kept in the LRU (default 256KB)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from typing import NamedTuple
+
+from bson import ObjectId
+from flask import current_app, request, send_file
+from gridfs.errors import NoFile
+from werkzeug.wsgi import wrap_file
+
+from app.cache import count_event
+from app.media.image_pipeline import forget_variants, resolve_variant, variant_ids
+from app.utils import error_response, get_gridfs
+
+logger = logging.getLogger(__name__)
+
+STATS_NAME = "media.lru"
+# Served under /media/<file_id>: the content behind an id never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+
+
+class CachedFile(NamedTuple):
+    data: bytes
+    content_type: str
+    filename: str
+    upload_date: object
+
+
+class MediaCache:
+    """Thread-safe LRU of small files, bounded by their total size"""
+
+    def __init__(self, max_bytes=None, max_file_bytes=None):
+        self.max_bytes = max_bytes or int(os.getenv("MEDIA_CACHE_BYTES", 16 * 1024 * 1024))
+        self.max_file_bytes = max_file_bytes or int(os.getenv("MEDIA_CACHE_MAX_FILE_BYTES", 256 * 1024))
+        self._files = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, file_id):
+        with self._lock:
+            cached = self._files.get(file_id)
+            if cached is not None:
+                self._files.move_to_end(file_id)
+        count_event(STATS_NAME, "hits" if cached is not None else "misses")
+        return cached
+
+    def put(self, file_id, cached):
+        size = len(cached.data)
+        if size > self.max_file_bytes:
+            return
+        with self._lock:
+            if file_id in self._files:
+                return
+            self._files[file_id] = cached
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._files.popitem(last=False)
+                self._bytes -= len(evicted.data)
+
+    def discard(self, file_id):
+        with self._lock:
+            if (cached := self._files.pop(file_id, None)) is not None:
+                self._bytes -= len(cached.data)
+                count_event(STATS_NAME, "invalidations")
+
+    def stats(self):
+        with self._lock:
+            return {"files": len(self._files), "bytes": self._bytes}
+
+
+media_cache = MediaCache()
+
+
+def _etag(file_id):
+    return str(file_id)
+
+
+def _cache_headers(response, file_id, immutable):
+    response.set_etag(_etag(file_id))
+    # The variant (WebP or not) depends on Accept
+    response.vary.add("Accept")
+    if immutable:
+        response.cache_control.private = True
+        response.cache_control.max_age = IMMUTABLE_MAX_AGE
+        response.cache_control.immutable = True
+    else:
+        # The URL can point at a new file after an upload: revalidate (cheap 304)
+        response.cache_control.private = True
+        response.cache_control.no_cache = True
+    return response
+
+
+def _finish(response, file_id, length, upload_date, immutable):
+    _cache_headers(response, file_id, immutable)
+    # Uploaded bytes are only ever served as the stored type
+    response.headers["X-Content-Type-Options"] = "nosniff"
+    if upload_date is not None:
+        response.last_modified = upload_date
+    # Answers If-None-Match/If-Modified-Since with 304 and Range with 206
+    return response.make_conditional(request, accept_ranges=True, complete_length=length)
+
+
+def _send_default(default_path):
+    if not os.path.isabs(default_path):
+        default_path = os.path.join(current_app.root_path, default_path)
+    return send_file(default_path)
+
+
+def serve_gridfs_file(file_id, default_path: str = None, immutable: bool = False, size: str = None):
+    """Stream a GridFS file with an ETag, conditional and range request support
+
+    Args:
+        file_id: GridFS file id (str or ObjectId)
+        default_path: File sent instead when the id is missing or unreadable
+        immutable: Whether the URL always names this exact file (long-lived
+            caching); only honoured once a variant is served
+        size: Image variant to send (thumb, medium, full), see VARIANT_SIZES
+    """
+    try:
+        if isinstance(file_id, str):
+            file_id = ObjectId(file_id)
+        # Listed explicitly by browsers that decode it; */* alone does not count
+        webp = "image/webp" in request.headers.get("Accept", "")
+        original_id = file_id
+        file_id = resolve_variant(file_id, size, webp=webp)
+        if file_id == original_id:
+            # Not processed yet (or processing failed): the same URL will send
+            # a variant later, so it must not be cached for good
+            immutable = False
+
+        # The id is the ETag: revalidations never reach GridFS
+        if request.if_none_match.contains(_etag(file_id)) and not request.range:
+            return _cache_headers(current_app.response_class(status=304), file_id, immutable)
+
+        if (cached := media_cache.get(file_id)) is not None:
+            response = current_app.response_class(cached.data, mimetype=cached.content_type)
+            return _finish(response, file_id, len(cached.data), cached.upload_date, immutable)
+
+        grid_out = get_gridfs().get(file_id)
+        content_type = grid_out.content_type or "application/octet-stream"
+        if grid_out.length <= media_cache.max_file_bytes:
+            cached = CachedFile(grid_out.read(), content_type, grid_out.filename, grid_out.upload_date)
+            media_cache.put(file_id, cached)
+            response = current_app.response_class(cached.data, mimetype=content_type)
+        else:
+            response = current_app.response_class(
+                wrap_file(request.environ, grid_out),
+                mimetype=content_type,
+                direct_passthrough=True,
+            )
+            response.content_length = grid_out.length
+        return _finish(response, file_id, grid_out.length, grid_out.upload_date, immutable)
+    except NoFile:
+        # Deleted, or an upload whose original is not stored yet
+        if default_path:
+            return _send_default(default_path)
+        return error_response("File not found", 404)
+    except Exception as e:
+        logger.error(f"Error retrieving file: {str(e)}")
+        if default_path:
+            return _send_default(default_path)
+        return error_response("An internal error has occurred.", 500)
+
+
+def delete_gridfs_file(file_id):
+    """Delete a GridFS file with its image variants and drop them from memory"""
+    if isinstance(file_id, str):
+        file_id = ObjectId(file_id)
+    for variant_id in variant_ids(file_id):
+        get_gridfs().delete(variant_id)
+        media_cache.discard(variant_id)
+    get_gridfs().delete(file_id)
+    media_cache.discard(file_id)
+    forget_variants(file_id)
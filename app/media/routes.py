@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+from flask import Blueprint, request, url_for
+from flask_login import login_required
+
+from app.media.media_utils import serve_gridfs_file
+
+media_bp = Blueprint("media", __name__)
+
+
+@media_bp.route("/<file_id>")
+@login_required
+def file(file_id):
+    """Serve an uploaded image by its GridFS id, cacheable for good"""
+    return serve_gridfs_file(file_id, immutable=True, size=request.args.get("size"))
+
+
+@media_bp.app_template_global()
+def profile_picture_url(user, size=None):
+    """Immutable URL of a user's picture when known, else the per-user route"""
+    if getattr(user, "profile_picture_id", None):
+        return url_for("media.file", file_id=str(user.profile_picture_id), size=size)
+    return url_for("auth.profile_picture", user_id=user.get_id(), size=size)
+
+
+@media_bp.app_template_global()
+def team_logo_url(team, size=None):
+    """Immutable URL of a team's logo when known, else the per-team route"""
+    if getattr(team, "logo_id", None):
+        return url_for("media.file", file_id=str(team.logo_id), size=size)
+    return url_for("team.team_logo", team_number=team.team_number, size=size)
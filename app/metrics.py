@@ -0,0 +1,344 @@
+"""Prometheus metrics for the HTTP layer, caches and background workers.
+
+``init_app`` times every request and serves ``/metrics`` in the Prometheus
+text format. Only localhost and the users listed in ``METRICS_ADMIN_USERS``
+(comma-separated usernames) may read it.
+
+Request counters are kept in per-thread shards: each worker thread only ever
+writes its own dicts, so the hot path takes no lock. A scrape sums the
+shards. The rest of the exposition is collected at scrape time from the
+stats the other modules already keep (outbound HTTP, API cache, MongoDB
+retries/commands/health, async runtime, notification queue, Web Push).
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+
+from flask import Response, current_app, g, jsonify, request
+from flask_login import current_user
+
+from app import lifecycle
+from app.async_runtime import get_runtime_stats
+from app.cache import get_cache_stats
+from app.db_monitor import get_query_stats
+from app.http_session import get_request_stats
+from app.retry import OPEN, get_retry_stats
+
+logger = logging.getLogger(__name__)
+
+# Request latency histogram buckets, in seconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+LOCAL_ADDRESSES = {"127.0.0.1", "::1"}
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# ============ Per-thread Counters ============
+
+_local = threading.local()
+_shards = []
+_shards_lock = threading.Lock()
+_worker_threads = None
+
+
+def _shard():
+    """Get the calling thread's counters, registering them on first use"""
+    shard = getattr(_local, "shard", None)
+    if shard is None:
+        shard = _local.shard = {"counters": {}, "histograms": {}}
+        with _shards_lock:
+            _shards.append(shard)
+    return shard
+
+
+def inc(name, labels=(), amount=1):
+    """Increment a counter owned by the calling thread"""
+    counters = _shard()["counters"]
+    key = (name, labels)
+    counters[key] = counters.get(key, 0) + amount
+
+
+def observe(name, labels, value, buckets=LATENCY_BUCKETS):
+    """Record a histogram observation in the calling thread's shard"""
+    histograms = _shard()["histograms"]
+    key = (name, labels)
+    histogram = histograms.get(key)
+    if histogram is None:
+        # Bucket counts, then sum and count
+        histogram = histograms[key] = [0] * len(buckets) + [0.0, 0]
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            histogram[i] += 1
+            break
+    histogram[-2] += value
+    histogram[-1] += 1
+
+
+def _collect():
+    """Sum every thread's counters and histograms"""
+    with _shards_lock:
+        shards = list(_shards)
+    counters, histograms = {}, {}
+    for shard in shards:
+        # dict.copy() is atomic under the GIL, the owner may keep writing
+        for key, value in shard["counters"].copy().items():
+            counters[key] = counters.get(key, 0) + value
+        for key, value in shard["histograms"].copy().items():
+            value = list(value)
+            total = histograms.setdefault(key, [0] * len(value[:-2]) + [0.0, 0])
+            for i, item in enumerate(value):
+                total[i] += item
+    return counters, histograms
+
+
+def set_worker_threads(threads):
+    """Record how many threads serve requests in this process (waitress/gunicorn)"""
+    global _worker_threads
+    _worker_threads = threads
+
+
+@lifecycle.on_fork
+def _reset_after_fork():
+    # The child starts its own counts; the parent's belong to the master
+    global _local, _shards, _shards_lock
+    _local = threading.local()
+    _shards = []
+    _shards_lock = threading.Lock()
+
+
+# ============ Request Instrumentation ============
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    inc("requests_started")
+
+
+def _after_request(response):
+    started = g.get("metrics_started")
+    if started is not None:
+        labels = (request.endpoint or "unmatched", request.method)
+        observe("castle_http_request_duration_seconds", labels, time.perf_counter() - started)
+        inc("castle_http_requests_total", labels + (str(response.status_code),))
+    return response
+
+
+def _teardown_request(exception=None):
+    if g.get("metrics_started") is not None:
+        inc("requests_finished")
+
+
+# ============ Exposition ============
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(names, values):
+    if not names:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values)) + "}"
+
+
+class _Writer:
+    """Accumulates the text exposition, one HELP/TYPE header per metric"""
+
+    def __init__(self):
+        self.lines = []
+
+    def metric(self, name, kind, help_text, samples):
+        """Write a metric from (labels dict, value) samples"""
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            self.lines.append(f"{name}{_labels(tuple(labels), tuple(labels.values()))} {value}")
+
+    def histogram(self, name, help_text, label_names, series, buckets=LATENCY_BUCKETS):
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} histogram")
+        for labels, values in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(buckets, values):
+                cumulative += count
+                self.lines.append(f"{name}_bucket{_labels(label_names + ('le',), labels + (bound,))} {cumulative}")
+            self.lines.append(f"{name}_bucket{_labels(label_names + ('le',), labels + ('+Inf',))} {values[-1]}")
+            self.lines.append(f"{name}_sum{_labels(label_names, labels)} {values[-2]}")
+            self.lines.append(f"{name}_count{_labels(label_names, labels)} {values[-1]}")
+
+    def text(self):
+        return "\n".join(self.lines) + "\n"
+
+
+def _write_http(writer):
+    counters, histograms = _collect()
+    writer.metric(
+        "castle_http_requests_total", "counter", "HTTP requests by endpoint, method and status",
+        [
+            ({"endpoint": labels[0], "method": labels[1], "status": labels[2]}, value)
+            for (name, labels), value in sorted(counters.items())
+            if name == "castle_http_requests_total"
+        ],
+    )
+    writer.histogram(
+        "castle_http_request_duration_seconds", "HTTP request latency by endpoint and method",
+        ("endpoint", "method"),
+        {labels: values for (name, labels), values in histograms.items() if name == "castle_http_request_duration_seconds"},
+    )
+    in_flight = max(0, counters.get(("requests_started", ()), 0) - counters.get(("requests_finished", ()), 0))
+    writer.metric("castle_http_requests_in_flight", "gauge", "Requests being handled", [({}, in_flight)])
+    if _worker_threads:
+        writer.metric("castle_worker_threads", "gauge", "Threads serving requests", [({}, _worker_threads)])
+        writer.metric(
+            "castle_worker_thread_utilization", "gauge", "Share of request threads busy",
+            [({}, round(min(in_flight, _worker_threads) / _worker_threads, 4))],
+        )
+    writer.metric("castle_process_threads", "gauge", "Live threads in this process", [({}, threading.active_count())])
+
+
+def _write_outbound(writer):
+    stats = get_request_stats()
+    writer.metric(
+        "castle_outbound_requests_total", "counter", "Outbound API calls by host",
+        [({"host": host}, host_stats["count"]) for host, host_stats in sorted(stats.items())],
+    )
+    writer.metric(
+        "castle_outbound_errors_total", "counter", "Outbound API calls answered with 4xx/5xx by host",
+        [({"host": host}, host_stats["errors"]) for host, host_stats in sorted(stats.items())],
+    )
+    writer.metric(
+        "castle_outbound_request_seconds_total", "counter", "Time spent in outbound API calls by host",
+        [({"host": host}, host_stats["total_seconds"]) for host, host_stats in sorted(stats.items())],
+    )
+    writer.metric(
+        "castle_outbound_request_max_seconds", "gauge", "Slowest outbound API call by host",
+        [({"host": host}, host_stats["max_seconds"]) for host, host_stats in sorted(stats.items())],
+    )
+
+
+def _write_cache(writer):
+    stats = get_cache_stats()
+    samples = []
+    for method, method_stats in sorted(stats.items()):
+        for result, value in method_stats.items():
+            if result != "hit_ratio":
+                samples.append(({"method": method, "result": result}, value))
+    writer.metric("castle_cache_events_total", "counter", "API cache lookups and refreshes by result", samples)
+    writer.metric(
+        "castle_cache_hit_ratio", "gauge", "Share of API cache lookups served without a fetch",
+        [({"method": method}, round(method_stats["hit_ratio"], 4)) for method, method_stats in sorted(stats.items())],
+    )
+
+
+def _write_mongo(writer):
+    from app.utils import get_mongodb_instance
+
+    health = get_mongodb_instance().get_health()
+    if health["healthy"] is not None:
+        writer.metric("castle_mongo_up", "gauge", "Whether the last MongoDB ping succeeded", [({}, int(health["healthy"]))])
+        writer.metric("castle_mongo_ping_seconds", "gauge", "Latency of the last MongoDB ping", [({}, health["latency_ms"] / 1000)])
+
+    retry = get_retry_stats()
+    for counter in ("retries", "recovered", "failed", "rejected", "circuit_opens"):
+        writer.metric(f"castle_mongo_{counter}_total", "counter", f"MongoDB operations {counter.replace('_', ' ')}", [({}, retry[counter])])
+    writer.metric("castle_mongo_circuit_open", "gauge", "Whether the MongoDB circuit breaker is open", [({}, int(retry["circuit_state"] == OPEN))])
+    writer.metric("castle_mongo_circuit_open_seconds_total", "counter", "Time the circuit breaker spent open", [({}, retry["open_seconds"])])
+
+    endpoints = get_query_stats()["endpoints"]
+    writer.metric(
+        "castle_mongo_commands_total", "counter", "MongoDB commands by issuing endpoint",
+        [({"endpoint": endpoint}, totals["commands"]) for endpoint, totals in sorted(endpoints.items())],
+    )
+    writer.metric(
+        "castle_mongo_slow_commands_total", "counter", "MongoDB commands over the slow threshold by endpoint",
+        [({"endpoint": endpoint}, totals["slow"]) for endpoint, totals in sorted(endpoints.items())],
+    )
+    writer.metric(
+        "castle_mongo_command_seconds_total", "counter", "Time spent in MongoDB commands by endpoint",
+        [({"endpoint": endpoint}, totals["total_ms"] / 1000) for endpoint, totals in sorted(endpoints.items())],
+    )
+
+
+def _write_runtime(writer):
+    stats = get_runtime_stats()
+    writer.metric("castle_async_tasks_pending", "gauge", "Background coroutines not finished yet", [({}, stats["tasks_pending"])])
+    writer.metric(
+        "castle_async_tasks_total", "counter", "Background coroutines by outcome",
+        [({"outcome": outcome}, stats[f"tasks_{outcome}"]) for outcome in ("spawned", "completed", "failed")],
+    )
+    writer.metric("castle_async_loop_lag_seconds", "gauge", "Scheduling lag of the background event loop", [({}, stats["loop_lag_seconds"])])
+
+
+def _write_notifications(writer):
+    notification_manager = current_app.db_managers.get("notification")
+    if notification_manager is None:
+        return
+    depth = notification_manager.get_queue_depth()
+    writer.metric(
+        "castle_notification_queue_depth", "gauge", "Notifications waiting to be sent",
+        [({"state": state}, count) for state, count in depth.items()],
+    )
+
+
+def _write_push(writer):
+    from app.notifications.push_delivery import get_push_stats
+
+    stats = get_push_stats()
+    origins = sorted(stats["origins"].items())
+    writer.metric(
+        "castle_push_total", "counter", "Web Push sends by push service and result",
+        [
+            ({"origin": origin, "result": result}, origin_stats[result])
+            for origin, origin_stats in origins
+            for result in ("sent", "failed", "gone")
+        ],
+    )
+    writer.metric(
+        "castle_push_seconds_total", "counter", "Time spent in Web Push sends by push service",
+        [({"origin": origin}, origin_stats["total_seconds"]) for origin, origin_stats in origins],
+    )
+    writer.metric(
+        "castle_push_max_seconds", "gauge", "Slowest Web Push send by push service",
+        [({"origin": origin}, origin_stats["max_seconds"]) for origin, origin_stats in origins],
+    )
+    # Pushes per second of batch time is the delivery throughput
+    writer.metric("castle_push_batches_total", "counter", "Web Push batches delivered", [({}, stats["batches"])])
+    writer.metric("castle_push_batch_seconds_total", "counter", "Wall time spent delivering Web Push batches", [({}, stats["batch_seconds"])])
+    writer.metric("castle_push_vapid_signatures_total", "counter", "VAPID tokens signed (one per push service until expiry)", [({}, stats["vapid_signatures"])])
+
+
+def render_metrics():
+    """Render every metric in the Prometheus text format"""
+    writer = _Writer()
+    for section in (_write_http, _write_outbound, _write_cache, _write_mongo, _write_runtime, _write_notifications, _write_push):
+        try:
+            section(writer)
+        except Exception as e:
+            # One failing source must not hide the others
+            logger.error(f"Error collecting {section.__name__[7:]} metrics: {str(e)}")
+    return writer.text()
+
+
+def _allowed():
+    # A local reverse proxy forwards remote clients from 127.0.0.1 too
+    if request.remote_addr in LOCAL_ADDRESSES and "X-Forwarded-For" not in request.headers:
+        return True
+    admins = {name.strip() for name in os.getenv("METRICS_ADMIN_USERS", "").split(",") if name.strip()}
+    return current_user.is_authenticated and current_user.username in admins
+
+
+def metrics():
+    """Prometheus scrape endpoint"""
+    if not _allowed():
+        return jsonify({"error": "Forbidden"}), 403
+    return Response(render_metrics(), content_type=CONTENT_TYPE)
+
+
+def init_app(app, limiter=None):
+    """Instrument every request and register the /metrics endpoint"""
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule("/metrics", "metrics", metrics)
+    if limiter is not None:
+        limiter.exempt(metrics)
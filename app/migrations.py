@@ -0,0 +1,575 @@
+"""Versioned schema and index migrations.
+
+Every collection's indexes are declared in ``INDEXES`` and created when
+missing; one-shot data migrations are listed in ``MIGRATIONS`` and recorded
+in the ``schema_migrations`` collection once applied. ``run_migrations`` is
+called from ``create_app`` and is safe to run from several workers at once.
+
+A migration whose worker died mid-way stays claimed ("running") until
+``MIGRATION_LEASE_SECONDS`` (default 1800) after it started, then the next
+start takes it over.
+
+Run ``python -m app.migrations`` to apply migrations by hand,
+``--status`` to print the applied schema version, ``--explain`` to print
+the query plans of the hot queries and ``--rebuild-stats`` to recompute the
+materialized team stats from team_data.
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import os
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo import ASCENDING, IndexModel, ReturnDocument, UpdateMany, UpdateOne
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_COLLECTION = "schema_migrations"
+# How long a "running" claim is honoured before another worker takes it over
+MIGRATION_LEASE_SECONDS = float(os.getenv("MIGRATION_LEASE_SECONDS", 1800))
+
+# ============ Index Declarations ============
+
+INDEXES = {
+    "users": [
+        # Login looks users up by either email or username
+        IndexModel([("email", ASCENDING)]),
+        IndexModel([("username", ASCENDING)]),
+        IndexModel([("teamNumber", ASCENDING)]),
+    ],
+    "teams": [
+        IndexModel([("team_number", ASCENDING)]),
+        IndexModel([("team_join_code", ASCENDING)]),
+    ],
+    "team_data": [
+        IndexModel([("team_number", ASCENDING)]),
+        IndexModel([("scouter_id", ASCENDING)]),
+        # Live event detection looks for recent writes
+        IndexModel([("created_at", ASCENDING), ("event_code", ASCENDING)]),
+        # Team-access filters on the denormalized scouter team
+        IndexModel([("scouter_team", ASCENDING), ("team_number", ASCENDING)]),
+        IndexModel([("scouter_team", ASCENDING), ("event_code", ASCENDING)]),
+        IndexModel([
+            ("event_code", ASCENDING),
+            ("match_number", ASCENDING),
+            ("team_number", ASCENDING),
+        ]),
+        # A team can only scout a robot once per match; scouters without a
+        # team are not covered since they only ever see their own entries
+        IndexModel(
+            [
+                ("scouter_team", ASCENDING),
+                ("event_code", ASCENDING),
+                ("match_number", ASCENDING),
+                ("team_number", ASCENDING),
+            ],
+            name="unique_team_match_scouting",
+            unique=True,
+            partialFilterExpression={"scouter_team": {"$type": "number"}},
+        ),
+    ],
+    "team_stats": [
+        IndexModel(
+            [("scope", ASCENDING), ("event_code", ASCENDING), ("team_number", ASCENDING)],
+            name="unique_team_stats_key",
+            unique=True,
+        ),
+        IndexModel([("scope", ASCENDING), ("team_number", ASCENDING)]),
+    ],
+    "api_cache": [
+        # Shared FTCScout cache (API_CACHE_BACKEND=mongo); purge_at is when
+        # the entry stops being servable even as stale
+        IndexModel([("purge_at", ASCENDING)], expireAfterSeconds=0),
+    ],
+    "pit_scouting": [
+        IndexModel([("team_number", ASCENDING)]),
+        IndexModel([("scouter_id", ASCENDING)]),
+    ],
+    "assignments": [
+        IndexModel([("team_number", ASCENDING)]),
+        IndexModel(
+            [("due_date", ASCENDING)],
+            partialFilterExpression={"due_date": {"$exists": True}},
+        ),
+        # Reminder reconciliation only looks at recently modified assignments
+        IndexModel([("updated_at", ASCENDING)]),
+    ],
+    "assignment_subscriptions": [
+        # Due-notification scan only ever looks at pending entries
+        IndexModel(
+            [("scheduled_time", ASCENDING), ("sent", ASCENDING), ("status", ASCENDING)],
+            partialFilterExpression={"status": "pending"},
+        ),
+        IndexModel([("assignment_id", ASCENDING), ("sent", ASCENDING)]),
+        IndexModel([("team_number", ASCENDING), ("assignment_id", ASCENDING)]),
+        # Expired claims are taken over by another notification worker
+        IndexModel(
+            [("lease_expires", ASCENDING)],
+            partialFilterExpression={"status": "sending"},
+        ),
+        # One unsent reminder per user and assignment, whichever worker
+        # schedules it; sent ones stay as history beside a rescheduled one
+        IndexModel(
+            [("user_id", ASCENDING), ("team_number", ASCENDING), ("assignment_id", ASCENDING)],
+            name="unique_unsent_assignment_reminder",
+            unique=True,
+            partialFilterExpression={"assignment_id": {"$type": "string"}, "sent": False},
+        ),
+    ],
+    "push_devices": [
+        # One document per browser push subscription
+        IndexModel([("endpoint", ASCENDING)], name="unique_push_endpoint", unique=True),
+        IndexModel([("user_id", ASCENDING), ("team_number", ASCENDING)]),
+    ],
+    "fs.files": [
+        # Resized image variants, looked up when their original is deleted
+        IndexModel(
+            [("metadata.variant_of", ASCENDING)],
+            partialFilterExpression={"metadata.variant_of": {"$exists": True}},
+        ),
+        # Uploads parked until their metadata-free original is stored
+        IndexModel(
+            [("metadata.upload_of", ASCENDING)],
+            partialFilterExpression={"metadata.upload_of": {"$exists": True}},
+        ),
+    ],
+}
+
+
+def ensure_indexes(db, indexes=None):
+    """Create every declared index that does not exist yet
+
+    Returns:
+        list: Names of the indexes that were created
+    """
+    created = []
+    existing_collections = set(db.list_collection_names())
+
+    for collection_name, models in (indexes or INDEXES).items():
+        if collection_name not in existing_collections:
+            db.create_collection(collection_name)
+            logger.info(f"Created {collection_name} collection")
+
+        collection = db[collection_name]
+        existing = set(collection.index_information())
+        missing = [model for model in models if model.document["name"] not in existing]
+        if not missing:
+            continue
+
+        for model in missing:
+            try:
+                collection.create_indexes([model])
+                created.append(f"{collection_name}.{model.document['name']}")
+            except OperationFailure as e:
+                logger.error(f"Failed to create index {model.document['name']} on {collection_name}: {str(e)}")
+
+    if created:
+        logger.info(f"Created indexes: {', '.join(created)}")
+    return created
+
+
+# ============ Data Migrations ============
+
+def backfill_scouter_fields(db):
+    """Stamp scouter_team/scouter_name onto every team_data entry from the users collection"""
+    operations = []
+    known_ids = []
+    for user in db.users.find({}, {"username": 1, "teamNumber": 1}):
+        known_ids.append(user["_id"])
+        operations.append(UpdateMany(
+            {"scouter_id": user["_id"]},
+            {"$set": {
+                "scouter_team": user.get("teamNumber"),
+                "scouter_name": user.get("username"),
+            }}
+        ))
+
+    # Entries whose scouter no longer exists are hidden like the old inner join did
+    operations.append(UpdateMany(
+        {"scouter_id": {"$nin": known_ids}},
+        {"$set": {"scouter_team": None, "scouter_name": None}}
+    ))
+
+    result = db.team_data.bulk_write(operations, ordered=False)
+    logger.info(f"Backfilled scouter fields on {result.modified_count} team_data entries")
+
+
+def build_team_stats(db):
+    """Build the materialized team_stats rows from existing team_data"""
+    from app.scout.team_stats import rebuild_team_stats
+
+    rebuild_team_stats(db)
+
+
+def normalize_push_devices(db):
+    """Move the push subscriptions copied into assignment_subscriptions to push_devices"""
+    subscriptions = list(db.assignment_subscriptions.find(
+        {"subscription_json.endpoint": {"$exists": True}},
+        {"subscription_json": 1, "user_id": 1, "team_number": 1, "updated_at": 1},
+    ))
+
+    # The most recent registration of an endpoint owns the device
+    latest = {}
+    for sub in sorted(subscriptions, key=lambda sub: sub.get("updated_at") or datetime.min):
+        latest[sub["subscription_json"]["endpoint"]] = sub
+
+    device_ids = {}
+    for endpoint, sub in latest.items():
+        device = db.push_devices.find_one_and_update(
+            {"endpoint": endpoint},
+            {"$setOnInsert": {
+                "endpoint": endpoint,
+                "subscription_json": sub["subscription_json"],
+                "user_id": sub.get("user_id"),
+                "team_number": sub.get("team_number"),
+                "active": True,
+                "created_at": sub.get("updated_at") or datetime.now(),
+                "updated_at": sub.get("updated_at") or datetime.now(),
+            }},
+            projection={"_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        device_ids[endpoint] = device["_id"]
+
+    operations = [
+        UpdateOne(
+            {"_id": sub["_id"]},
+            {
+                "$set": {"device_id": device_ids[sub["subscription_json"]["endpoint"]]},
+                "$unset": {"subscription_json": ""},
+            },
+        )
+        for sub in subscriptions
+    ]
+    if operations:
+        db.assignment_subscriptions.bulk_write(operations, ordered=False)
+    # Leftover empty subscriptions were never sendable
+    db.assignment_subscriptions.update_many(
+        {"subscription_json": {"$exists": True}}, {"$unset": {"subscription_json": ""}}
+    )
+    logger.info(f"Moved {len(subscriptions)} push subscriptions to {len(device_ids)} push devices")
+
+
+def dedupe_team_match_scouting(db):
+    """Resolve duplicate team scouting entries so unique_team_match_scouting can be built
+
+    The newest entry of each team/event/match/robot stays with the team; the
+    older ones keep their data but become their scouter's own entries
+    (scouter_team None), like entries of a scouter without a team.
+    """
+    from app.scout.team_stats import rebuild_team_stats, stats_scope
+
+    duplicates = db.team_data.aggregate([
+        {"$match": {"scouter_team": {"$type": "number"}}},
+        {"$sort": {"created_at": -1, "_id": -1}},
+        {"$group": {
+            "_id": {
+                "scouter_team": "$scouter_team",
+                "event_code": "$event_code",
+                "match_number": "$match_number",
+                "team_number": "$team_number",
+            },
+            "entries": {"$push": {"_id": "$_id", "scouter_id": "$scouter_id"}},
+        }},
+        {"$match": {"entries.1": {"$exists": True}}},
+    ], allowDiskUse=True)
+
+    detached = []
+    scopes = set()
+    for group in duplicates:
+        scopes.add(group["_id"]["scouter_team"])
+        for entry in group["entries"][1:]:
+            detached.append(entry["_id"])
+            scopes.add(stats_scope(None, entry.get("scouter_id")))
+
+    if detached:
+        db.team_data.update_many({"_id": {"$in": detached}}, {"$set": {"scouter_team": None}})
+        rebuild_team_stats(db, scopes)
+    logger.info(f"Detached {len(detached)} duplicate team scouting entries")
+
+
+def dedupe_assignment_reminders(db):
+    """Remove duplicate assignment reminders so unique_unsent_assignment_reminder can be built
+
+    Workers used to schedule reminders with racing full scans, leaving
+    several per user and assignment. Of each user/team/assignment the
+    earliest pending or sent entry stays (the earliest one when all were
+    cancelled); the other unsent ones are deleted, sent ones are kept as
+    history.
+    """
+    duplicates = db.assignment_subscriptions.aggregate([
+        {"$match": {"assignment_id": {"$type": "string"}}},
+        {"$sort": {"created_at": 1, "_id": 1}},
+        {"$group": {
+            "_id": {
+                "user_id": "$user_id",
+                "team_number": "$team_number",
+                "assignment_id": "$assignment_id",
+            },
+            "entries": {"$push": {"_id": "$_id", "sent": "$sent", "status": "$status"}},
+        }},
+        {"$match": {"entries.1": {"$exists": True}}},
+    ], allowDiskUse=True)
+
+    removed = []
+    for group in duplicates:
+        entries = group["entries"]
+        keep = next(
+            (entry for entry in entries if entry.get("sent") or entry.get("status") == "pending"),
+            entries[0],
+        )
+        removed.extend(
+            entry["_id"] for entry in entries
+            if entry is not keep and not entry.get("sent")
+        )
+
+    if removed:
+        db.assignment_subscriptions.delete_many({"_id": {"$in": removed}})
+    logger.info(f"Removed {len(removed)} duplicate assignment reminders")
+
+
+# (version, name, function) - append only, never renumber
+MIGRATIONS = [
+    (1, "backfill_scouter_fields", backfill_scouter_fields),
+    (2, "build_team_stats", build_team_stats),
+    (3, "normalize_push_devices", normalize_push_devices),
+    (4, "dedupe_team_match_scouting", dedupe_team_match_scouting),
+    (5, "dedupe_assignment_reminders", dedupe_assignment_reminders),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def get_schema_version(db):
+    """Get the highest applied migration version (0 if none)"""
+    latest = db[MIGRATIONS_COLLECTION].find_one(
+        {"status": "applied"}, sort=[("_id", -1)]
+    )
+    return latest["_id"] if latest else 0
+
+
+def _claim_migration(db, version, name):
+    """Claim a migration, or take over a claim whose lease ran out
+
+    Returns:
+        bool: Whether this worker now runs the migration
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        db[MIGRATIONS_COLLECTION].insert_one({
+            "_id": version,
+            "name": name,
+            "status": "running",
+            "started_at": now,
+        })
+        return True
+    except DuplicateKeyError:
+        pass
+
+    # The claiming worker died mid-way (or is still running past its lease)
+    stale = db[MIGRATIONS_COLLECTION].find_one_and_update(
+        {
+            "_id": version,
+            "status": "running",
+            "started_at": {"$lte": now - timedelta(seconds=MIGRATION_LEASE_SECONDS)},
+        },
+        {"$set": {"started_at": now}},
+    )
+    if stale is not None:
+        logger.warning(f"Taking over migration {version} ({name}) claimed at {stale['started_at']}")
+        return True
+    return False
+
+
+def run_migrations(db):
+    """Apply pending data migrations, then create missing indexes
+
+    Each migration is claimed by inserting its version into the migrations
+    collection, so concurrent workers never apply the same one twice; a claim
+    older than MIGRATION_LEASE_SECONDS is taken over. Migrations apply in
+    order: while another worker runs one, the later ones wait. Indexes
+    are created afterwards so backfills are not rejected by unique indexes
+    (a unique index over existing duplicates fails and is logged instead).
+
+    Returns:
+        int: The schema version after running
+    """
+    applied = {
+        doc["_id"]
+        for doc in db[MIGRATIONS_COLLECTION].find({"status": "applied"}, {"_id": 1})
+    }
+
+    for version, name, migration in MIGRATIONS:
+        if version in applied:
+            continue
+
+        if not _claim_migration(db, version, name):
+            logger.info(f"Migration {version} ({name}) is being applied by another worker")
+            break
+
+        try:
+            logger.info(f"Applying migration {version}: {name}")
+            migration(db)
+            db[MIGRATIONS_COLLECTION].update_one(
+                {"_id": version},
+                {"$set": {"status": "applied", "applied_at": datetime.now(timezone.utc)}}
+            )
+        except Exception as e:
+            # Release the claim so the next start retries it
+            db[MIGRATIONS_COLLECTION].delete_one({"_id": version})
+            logger.error(f"Migration {version} ({name}) failed: {str(e)}", exc_info=True)
+            break
+
+    ensure_indexes(db)
+
+    version = get_schema_version(db)
+    logger.info(f"Database schema at version {version} (latest {SCHEMA_VERSION})")
+    return version
+
+
+# ============ Query Plans ============
+
+def _hot_queries(db):
+    """Representative hot-path queries as (name, collection, kind, spec)"""
+    user = db.users.find_one({"teamNumber": {"$ne": None}}, {"username": 1, "email": 1, "teamNumber": 1}) or {}
+    user_id = user.get("_id") or ObjectId()
+    team_number = user.get("teamNumber") or 0
+    entry = db.team_data.find_one({}, {"event_code": 1, "match_number": 1, "team_number": 1}) or {}
+    access = {"$or": [{"scouter_team": team_number}, {"scouter_id": user_id}]}
+    scopes = [team_number, f"user:{user_id}"]
+
+    return [
+        ("login", "users", "find",
+         {"$or": [{"email": user.get("email", "")}, {"username": user.get("username", "")}]}),
+        ("team_by_number", "teams", "find", {"team_number": team_number}),
+        ("team_by_join_code", "teams", "find", {"team_join_code": "AAAAAA"}),
+        ("scouting_list", "team_data", "find", access),
+        ("team_scouting", "team_data", "find",
+         {"team_number": entry.get("team_number", 0), **access}),
+        ("match_entries", "team_data", "find", {
+            "event_code": entry.get("event_code", ""),
+            "match_number": entry.get("match_number", ""),
+            "team_number": entry.get("team_number", 0),
+        }),
+        ("leaderboard", "team_stats", "aggregate", [
+            {"$match": {"scope": {"$in": scopes}}},
+            {"$group": {"_id": "$team_number", "matches_played": {"$sum": "$count"}}},
+        ]),
+        ("compare_stats", "team_stats", "find",
+         {"scope": {"$in": scopes}, "team_number": entry.get("team_number", 0)}),
+        ("team_assignments", "assignments", "find", {"team_number": team_number}),
+        ("pending_notifications", "assignment_subscriptions", "find", {
+            "scheduled_time": {"$lte": datetime.now()},
+            "sent": False,
+            "status": "pending",
+        }),
+        ("instant_push_devices", "push_devices", "find",
+         {"user_id": {"$in": [str(user_id)]}, "team_number": team_number, "active": True}),
+    ]
+
+
+def _plan_stages(plan):
+    """Flatten a winning plan into a list of 'STAGE(index)' strings"""
+    stages = []
+    while plan:
+        stage = plan.get("stage", "?")
+        if plan.get("indexName"):
+            stage = f"{stage}({plan['indexName']})"
+        stages.append(stage)
+        if "inputStage" in plan:
+            plan = plan["inputStage"]
+        elif plan.get("inputStages"):
+            stages.extend(
+                stage for child in plan["inputStages"] for stage in _plan_stages(child)
+            )
+            break
+        else:
+            break
+    return stages
+
+
+def _find_winning_plan(explain):
+    """Locate the winning plan in find or aggregate explain output"""
+    if "queryPlanner" in explain:
+        planner = explain["queryPlanner"]
+        return planner.get("winningPlan", {}).get("queryPlan", planner.get("winningPlan", {}))
+    for stage in explain.get("stages", []):
+        if "$cursor" in stage:
+            return _find_winning_plan(stage["$cursor"])
+    return {}
+
+
+def explain_hot_queries(db):
+    """Explain the hot-path queries and report whether they are index-covered
+
+    Returns:
+        list: One dict per query with its plan stages and a COLLSCAN flag
+    """
+    report = []
+    for name, collection_name, kind, spec in _hot_queries(db):
+        try:
+            if kind == "aggregate":
+                explain = db.command("aggregate", collection_name, pipeline=spec, explain=True)
+            else:
+                explain = db[collection_name].find(spec).explain()
+            stages = _plan_stages(_find_winning_plan(explain))
+            stats = explain.get("executionStats", {})
+            report.append({
+                "name": name,
+                "collection": collection_name,
+                "stages": stages,
+                "collscan": any(stage.startswith("COLLSCAN") for stage in stages),
+                "docs_examined": stats.get("totalDocsExamined"),
+                "keys_examined": stats.get("totalKeysExamined"),
+            })
+        except Exception as e:
+            report.append({"name": name, "collection": collection_name, "error": str(e)})
+    return report
+
+
+def print_explain_report(db):
+    for entry in explain_hot_queries(db):
+        if "error" in entry:
+            print(f"{entry['name']:<24} {entry['collection']:<26} ERROR {entry['error']}")
+            continue
+        flag = "COLLSCAN" if entry["collscan"] else "indexed"
+        print(
+            f"{entry['name']:<24} {entry['collection']:<26} {flag:<9} "
+            f"{' <- '.join(entry['stages'])} "
+            f"(keys: {entry['keys_examined']}, docs: {entry['docs_examined']})"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply Castle schema migrations")
+    parser.add_argument("--status", action="store_true", help="Print the applied schema version and exit")
+    parser.add_argument("--explain", action="store_true", help="Print query plans for the hot queries")
+    parser.add_argument("--rebuild-stats", action="store_true", help="Recompute team_stats from team_data")
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    from app.utils import get_mongodb_instance
+
+    load_dotenv()
+    db = get_mongodb_instance(os.getenv("MONGO_URI")).get_db()
+
+    if args.status:
+        print(f"Schema version {get_schema_version(db)} (latest {SCHEMA_VERSION})")
+    elif args.explain:
+        print_explain_report(db)
+    elif args.rebuild_stats:
+        from app.scout.team_stats import rebuild_team_stats
+
+        print(f"Rebuilt {rebuild_team_stats(db)} team stats rows")
+    else:
+        print(f"Schema version {run_migrations(db)}")
+
+
+if __name__ == "__main__":
+    main()
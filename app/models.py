@@ -282,7 +282,7 @@ class AssignmentSubscription:
         self.team_number = data.get("team_number")
         
         # Push notification details
-        self.subscription_json = data.get("subscription_json", {})  # The Web Push subscription object
+        self.device_id = data.get("device_id")  # The push_devices entry to send to
         
         # Assignment specific details
         self.assignment_id = data.get("assignment_id")  # Optional - None means it's a general subscription
@@ -323,7 +323,7 @@ class AssignmentSubscription:
         return {
             "user_id": self.user_id,
             "team_number": self.team_number,
-            "subscription_json": self.subscription_json,
+            "device_id": self.device_id,
             "assignment_id": self.assignment_id,
             "reminder_time": self.reminder_time,
             "scheduled_time": self.scheduled_time,
@@ -1,16 +1,95 @@
+"""Push notifications for team assignments.
+
+Assignment reminders are scheduled from events: creating, editing or deleting
+an assignment (and subscribing) queues a change that the notification worker
+applies right away. The worker keeps a min-heap of upcoming reminder times
+and sleeps until the earliest one, instead of scanning every assignment on a
+timer. A reconciliation pass every ``NOTIFICATION_RECONCILE_SECONDS`` (default
+300) reschedules the assignments modified since the previous pass, which
+covers changes made through other worker processes.
+
+Every worker process drains the same queue: a due notification is claimed
+(pending -> sending, under a lease) before it is sent, so each one is sent
+once however many workers run. The lease is ``NOTIFICATION_LEASE_SECONDS``,
+raised when needed to outlast sending a whole ``NOTIFICATION_BATCH_SIZE``
+batch with the configured ``PUSH_WORKERS``/``PUSH_TIMEOUT``. A notification
+whose lease ran out ``NOTIFICATION_MAX_ATTEMPTS`` times (default 3) is marked
+as an error instead of being claimed again.
+
+The VAPID key is loaded once, when the manager is created. Without a usable
+key (unset in development, or malformed) every push fails with a per-message
+error, so claimed notifications are marked as errors instead of staying in
+sending.
+
+Browser push subscriptions are stored once per endpoint in ``push_devices``;
+subscriptions and reminders reference them by ``device_id``. A push service
+answering 404/410 deactivates the one device document.
+"""
+
+import asyncio
+import heapq
 import logging
+import os
+import queue
 import threading
-from datetime import datetime, timedelta
+import time
+from datetime import datetime, timedelta, timezone
 import json
 from bson import ObjectId
-from typing import Dict, Optional, Tuple
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import BulkWriteError
+from typing import Dict, List, Optional, Tuple
 
 from app.models import AssignmentSubscription
+from app.notifications.push_delivery import PushResult, VapidSigner, deliver, max_deliver_seconds
 from app.utils import DatabaseManager, with_mongodb_retry, get_database_connection
-from pywebpush import webpush, WebPushException
 
 logger = logging.getLogger(__name__)
 
+RECONCILE_INTERVAL = float(os.getenv("NOTIFICATION_RECONCILE_SECONDS", 300))
+BATCH_SIZE = int(os.getenv("NOTIFICATION_BATCH_SIZE", 50))
+# How long a claimed notification is reserved for the worker sending it: at
+# least as long as its batch can take, plus time to claim and record it
+LEASE_SECONDS = max(
+    float(os.getenv("NOTIFICATION_LEASE_SECONDS", 60)),
+    max_deliver_seconds(BATCH_SIZE) + 30,
+)
+# Claims after which a notification whose sender keeps dying is given up
+MAX_ATTEMPTS = int(os.getenv("NOTIFICATION_MAX_ATTEMPTS", 3))
+# Statuses of reminders that may still be (re)scheduled
+OPEN_STATUSES = ["pending", "cancelled"]
+
+
+def _parse_due_date(due_date) -> Optional[datetime]:
+    """Get an assignment's due date as a naive local datetime, or None"""
+    if not due_date:
+        return None
+    if isinstance(due_date, str):
+        try:
+            due_date = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
+        except (ValueError, AttributeError):
+            return None
+    if due_date.tzinfo is not None:
+        due_date = due_date.astimezone().replace(tzinfo=None)
+    return due_date
+
+
+def _reminder_content(assignment: Dict, due_date: datetime) -> Dict:
+    """Title, body and payload of an assignment's reminder"""
+    assignment_id = str(assignment["_id"])
+    return {
+        "title": f"Assignment Reminder: {assignment.get('title')}",
+        "body": f"Your assignment '{assignment.get('title')}' is due soon",
+        "url": "/team/manage",
+        "data": {
+            "assignment_id": assignment_id,
+            "title": assignment.get("title"),
+            "due_date": due_date.isoformat(),
+            "type": "assignment_reminder",
+        },
+    }
+
+
 class NotificationManager(DatabaseManager):
     """Manages push notifications and subscriptions"""
     
@@ -27,20 +106,25 @@ class NotificationManager(DatabaseManager):
         
         self.vapid_private_key = vapid_private_key
         self.vapid_claims = vapid_claims
+        self.vapid_signer, self.vapid_error = self._build_vapid_signer()
         self._shutdown_event = threading.Event()
         self._notification_thread = None
-        self._ensure_collections()
-        
-    def _ensure_collections(self) -> None:
-        """Ensure required collections exist"""
-        if "assignment_subscriptions" not in self.db.list_collection_names():
-            self.db.create_collection("assignment_subscriptions")
-            logger.info("Created assignment_subscriptions collection")
+        self._reset_schedule()
+
+    def _reset_schedule(self):
+        # Only the worker thread touches the heap; others go through _changes
+        self._heap = []
+        self._heap_times = set()
+        self._changes = queue.SimpleQueue()
+        self._wakeup = threading.Event()
+        self._reconciled_at = None
             
     def start_notification_service(self):
         """Start the background thread that processes notifications"""
         if self._notification_thread is None or not self._notification_thread.is_alive():
             self._shutdown_event.clear()
+            # Fresh state in this process (the manager may come from a forked parent)
+            self._reset_schedule()
             self._notification_thread = threading.Thread(
                 target=self._notification_worker,
                 daemon=True
@@ -52,140 +136,339 @@ class NotificationManager(DatabaseManager):
         """Stop the notification background thread"""
         if self._notification_thread and self._notification_thread.is_alive():
             self._shutdown_event.set()
+            self._wakeup.set()
             self._notification_thread.join(timeout=5)
             logger.info("Notification service stopped")
-    
+
+    # ============ Scheduling Events ============
+
+    def assignment_changed(self, assignment_id: str):
+        """Reschedule an assignment's reminders after it was created, edited or deleted"""
+        self._changes.put(("assignment", str(assignment_id)))
+        self._wakeup.set()
+
+    def team_assignments_changed(self, team_number: int):
+        """Reschedule every reminder of a team (assignments cleared, team subscription changed)"""
+        self._changes.put(("team", team_number))
+        self._wakeup.set()
+
+    def _push_time(self, scheduled_time: Optional[datetime]):
+        if scheduled_time is None or scheduled_time in self._heap_times:
+            return
+        self._heap_times.add(scheduled_time)
+        heapq.heappush(self._heap, scheduled_time)
+
+    def _pop_due(self, now: datetime):
+        while self._heap and self._heap[0] <= now:
+            self._heap_times.discard(heapq.heappop(self._heap))
+
+    def _seconds_until_next(self, next_reconcile: float) -> float:
+        timeout = next_reconcile - time.monotonic()
+        if self._heap:
+            timeout = min(timeout, (self._heap[0] - datetime.now()).total_seconds())
+        return max(0.0, timeout)
+
+    # ============ Worker ============
+
     def _notification_worker(self):
-        """Background worker that checks for pending notifications"""
+        """Background worker sleeping until the next reminder is due"""
         logger.info("Notification worker started")
-        
+        # Reconcile everything on start
+        next_reconcile = 0.0
+
         while not self._shutdown_event.is_set():
             try:
-                # Check for notifications that need to be sent
-                self._process_pending_notifications()
-                
-                # Schedule notifications for upcoming assignments
-                self._schedule_assignment_notifications()
-                
-                # Sleep for a 15s before checking again
-                self._shutdown_event.wait(15)
+                # Cleared first so a change queued while we work wakes the next wait
+                self._wakeup.clear()
+
+                if time.monotonic() >= next_reconcile:
+                    self._reconcile()
+                    next_reconcile = time.monotonic() + RECONCILE_INTERVAL
+
+                self._apply_changes()
+
+                now = datetime.now()
+                if self._heap and self._heap[0] <= now:
+                    self._process_pending_notifications(now)
+                    self._pop_due(now)
+                    self._push_next_pending()
+
+                self._wakeup.wait(self._seconds_until_next(next_reconcile))
             except Exception as e:
                 logger.error(f"Error in notification worker: {str(e)}")
                 # Sleep for 5 seconds before retrying after an error
                 self._shutdown_event.wait(5)
-    
+
+    def _apply_changes(self):
+        """Reschedule what the queued events point at"""
+        while True:
+            try:
+                kind, key = self._changes.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                if kind == "assignment":
+                    self._reschedule_assignment_id(key)
+                else:
+                    self._reschedule_team(key)
+            except Exception as e:
+                # The next reconciliation pass catches up
+                logger.error(f"Error rescheduling {kind} {key}: {str(e)}")
+
     @with_mongodb_retry()
-    def _process_pending_notifications(self):
-        """Process all pending notifications that are due to be sent"""
-        
+    def _reconcile(self):
+        """Reschedule the assignments modified since the last pass (all of them on the first)"""
+        started = datetime.now(timezone.utc)
+        if self._reconciled_at is None:
+            query = {"due_date": {"$exists": True, "$ne": None}}
+        else:
+            # Edits from other processes, including due dates being removed
+            query = {"updated_at": {"$gte": self._reconciled_at}}
 
-        # Find notifications scheduled for now or earlier that haven't been sent
-        now = datetime.now()
-        pending_notifications = self.db.assignment_subscriptions.find({
-            "scheduled_time": {"$lte": now},
-            "sent": False,
-            "status": "pending"
-        })
+        count = 0
+        for assignment in self.db.assignments.find(query):
+            self._reschedule_assignment(assignment)
+            count += 1
+        self._reconciled_at = started
+        # Reminders queued by other processes
+        self._push_next_pending()
+        if count:
+            logger.info(f"Reconciled reminders of {count} assignments")
+
+    def _push_next_pending(self):
+        next_pending = self.db.assignment_subscriptions.find_one(
+            {"sent": False, "status": "pending", "scheduled_time": {"$ne": None}},
+            {"scheduled_time": 1},
+            sort=[("scheduled_time", 1)],
+        )
+        if next_pending:
+            self._push_time(next_pending["scheduled_time"])
+        # Claims of a worker that died are taken over when their lease ends
+        next_lease = self.db.assignment_subscriptions.find_one(
+            {"sent": False, "status": "sending"},
+            {"lease_expires": 1},
+            sort=[("lease_expires", 1)],
+        )
+        if next_lease and next_lease.get("lease_expires"):
+            self._push_time(next_lease["lease_expires"])
+
+    def _due_query(self, now: datetime) -> Dict:
+        """Due notifications nobody is sending, or whose sender's lease ran out"""
+        return {"$or": [
+            {"status": "pending", "sent": False, "scheduled_time": {"$lte": now}},
+            {"status": "sending", "sent": False, "lease_expires": {"$lte": now}},
+        ]}
+
+    @with_mongodb_retry()
+    def _claim_notification(self, now: datetime) -> Optional[Dict]:
+        """Atomically move one due notification to sending under a fresh lease"""
+        return self.db.assignment_subscriptions.find_one_and_update(
+            self._due_query(now),
+            {
+                "$set": {
+                    "status": "sending",
+                    "lease_token": ObjectId(),
+                    "lease_expires": datetime.now() + timedelta(seconds=LEASE_SECONDS),
+                },
+                "$inc": {"attempts": 1},
+            },
+            sort=[("scheduled_time", 1)],
+            return_document=ReturnDocument.AFTER,
+        )
+
+    @with_mongodb_retry()
+    def _record_results(self, operations: List):
+        self.db.assignment_subscriptions.bulk_write(operations, ordered=False)
 
+    def _process_pending_notifications(self, now: Optional[datetime] = None):
+        """Send every notification due by now, claimed in batches
+
+        Each notification is claimed with find_one_and_update (pending ->
+        sending) before it is sent, so any number of workers can drain the
+        queue without sending one twice. A worker that dies mid-batch leaves
+        its claims to be picked up again once their lease expires, up to
+        MAX_ATTEMPTS times.
+        """
+        now = now or datetime.now()
         count = 0
-        for notification in pending_notifications:
-            subscription_obj = AssignmentSubscription.create_from_db(notification)
 
-            try:
-                if success := self._send_push_notification(subscription_obj):
-                    subscription_obj.mark_as_sent()
-                    self.db.assignment_subscriptions.update_one(
-                        {"_id": subscription_obj._id},
-                        {"$set": {
+        while not self._shutdown_event.is_set():
+            claimed = []
+            while len(claimed) < BATCH_SIZE and (notification := self._claim_notification(now)):
+                claimed.append(notification)
+            if not claimed:
+                break
+
+            operations = []
+            release = {"lease_token": "", "lease_expires": ""}
+            # Claimed again after MAX_ATTEMPTS expired leases: stop retrying
+            exhausted = [n for n in claimed if n.get("attempts", 1) > MAX_ATTEMPTS]
+            for notification in exhausted:
+                logger.error(f"Giving up on notification {notification['_id']} after {MAX_ATTEMPTS} attempts")
+                operations.append(UpdateOne(
+                    {"_id": notification["_id"], "lease_token": notification["lease_token"]},
+                    {
+                        "$set": {
+                            "status": "error",
+                            "error": f"Not sent after {MAX_ATTEMPTS} attempts",
+                            "updated_at": datetime.now()
+                        },
+                        "$unset": release,
+                    },
+                ))
+            claimed = [n for n in claimed if n.get("attempts", 1) <= MAX_ATTEMPTS]
+
+            results = self._push_batch([AssignmentSubscription.create_from_db(n) for n in claimed]) if claimed else []
+
+            for notification, result in zip(claimed, results):
+                # Only the holder of the lease records the outcome
+                claim = {"_id": notification["_id"], "lease_token": notification["lease_token"]}
+                if result.ok:
+                    operations.append(UpdateOne(claim, {
+                        "$set": {
                             "sent": True,
                             "sent_at": datetime.now(),
                             "status": "sent",
                             "updated_at": datetime.now()
-                        }}
-                    )
+                        },
+                        "$unset": release,
+                    }))
                     count += 1
                 else:
                     # Mark as error if sending failed
-                    self.db.assignment_subscriptions.update_one(
-                        {"_id": subscription_obj._id},
-                        {"$set": {
+                    operations.append(UpdateOne(claim, {
+                        "$set": {
                             "status": "error",
-                            "error": "Failed to send push notification",
+                            "error": result.error or "Failed to send push notification",
                             "updated_at": datetime.now()
-                        }}
-                    )
-            except Exception as e:
-                logger.error(f"Error processing notification {subscription_obj.id}: {str(e)}")
-                self.db.assignment_subscriptions.update_one(
-                    {"_id": subscription_obj._id},
-                    {"$set": {
-                        "status": "error",
-                        "error": str(e),
-                        "updated_at": datetime.now()
-                    }}
-                )
+                        },
+                        "$unset": release,
+                    }))
+
+            self._record_results(operations)
 
         if count > 0:
             logger.info(f"Sent {count} notifications")
     
     @with_mongodb_retry()
-    def _schedule_assignment_notifications(self):
-        """Schedule notifications for assignments with due dates"""
-        
-        
-        # Get assignments with due dates
-        assignments = self.db.assignments.find({
-            "due_date": {"$exists": True, "$ne": None}
+    def get_queue_depth(self) -> Dict[str, int]:
+        """Count the notifications waiting to be sent, and those already due"""
+        waiting = {"sent": False, "status": "pending"}
+        return {
+            "pending": self.db.assignment_subscriptions.count_documents(waiting),
+            "due": self.db.assignment_subscriptions.count_documents({**waiting, "scheduled_time": {"$lte": datetime.now()}}),
+            "sending": self.db.assignment_subscriptions.count_documents({"sent": False, "status": "sending"}),
+        }
+
+    @with_mongodb_retry()
+    def _reschedule_assignment_id(self, assignment_id: str):
+        """Reschedule one assignment's reminders, dropping them if it was deleted"""
+        assignment = self.db.assignments.find_one({"_id": ObjectId(assignment_id)})
+        if assignment is None:
+            result = self.db.assignment_subscriptions.delete_many({
+                "assignment_id": assignment_id,
+                "sent": False,
+                "status": {"$in": OPEN_STATUSES},
+            })
+            if result.deleted_count:
+                logger.info(f"Dropped {result.deleted_count} reminders of deleted assignment {assignment_id}")
+            return
+        self._reschedule_assignment(assignment)
+
+    @with_mongodb_retry()
+    def _reschedule_team(self, team_number: int):
+        """Reschedule every assignment of a team and drop reminders of deleted ones"""
+        assignment_ids = []
+        for assignment in self.db.assignments.find({"team_number": team_number}):
+            assignment_ids.append(str(assignment["_id"]))
+            self._reschedule_assignment(assignment)
+
+        self.db.assignment_subscriptions.delete_many({
+            "team_number": team_number,
+            "assignment_id": {"$nin": assignment_ids + [None]},
+            "sent": False,
+            "status": {"$in": OPEN_STATUSES},
         })
-        
-        for assignment in assignments:
-            # Get the subscriptions for this assignment
-            self._schedule_assignment_reminder(assignment)
-    
-    def _schedule_assignment_reminder(self, assignment: Dict):
-        """Schedule reminders for a specific assignment
+
+    def _reschedule_assignment(self, assignment: Dict):
+        """Bring an assignment's unsent reminders in line with its due date and assignees
         
         Args:
             assignment: The assignment document from MongoDB
         """
         assignment_id = str(assignment["_id"])
-        due_date = assignment.get("due_date")
-        team_number = assignment.get("team_number")
-
-        if not due_date:
-            return
+        due_date = _parse_due_date(assignment.get("due_date"))
+        assigned_to = assignment.get("assigned_to") or []
+        now = datetime.now()
 
-        # Ensure due_date is a datetime object
-        if isinstance(due_date, str):
+        operations = []
+        existing_user_ids = []
+        for reminder in self.db.assignment_subscriptions.find({"assignment_id": assignment_id, "sent": False}):
+            existing_user_ids.append(reminder.get("user_id"))
+            if reminder.get("status") not in OPEN_STATUSES:
+                continue
+            scheduled_time = None
+            if due_date and reminder.get("user_id") in assigned_to:
+                scheduled_time = due_date - timedelta(minutes=reminder.get("reminder_time", 1440))
+
+            if scheduled_time and scheduled_time > now:
+                if reminder.get("scheduled_time") != scheduled_time or reminder.get("status") != "pending":
+                    operations.append(UpdateOne({"_id": reminder["_id"]}, {"$set": {
+                        **_reminder_content(assignment, due_date),
+                        "scheduled_time": scheduled_time,
+                        "status": "pending",
+                        "updated_at": now,
+                    }}))
+                self._push_time(scheduled_time)
+            elif reminder.get("status") == "pending":
+                # Unassigned, due date removed or moved into the past
+                operations.append(UpdateOne(
+                    {"_id": reminder["_id"]},
+                    {"$set": {"status": "cancelled", "updated_at": now}}
+                ))
+
+        if due_date:
+            operations.extend(self._schedule_assignment_reminder(assignment, due_date, existing_user_ids))
+
+        if operations:
             try:
-                due_date = datetime.fromisoformat(due_date.replace('Z', '+00:00'))
-            except (ValueError, AttributeError):
-                logger.error(f"Invalid due date format for assignment {assignment_id}")
-                return
+                self.db.assignment_subscriptions.bulk_write(operations, ordered=False)
+            except BulkWriteError as e:
+                # Another worker upserted the same reminder first
+                if any(error.get("code") != 11000 for error in e.details.get("writeErrors", [])):
+                    raise
+
+    def _schedule_assignment_reminder(self, assignment: Dict, due_date: datetime,
+                                      existing_user_ids: List[str]) -> List[UpdateOne]:
+        """Create reminders for assignees subscribed team-wide without one for this assignment
+
+        Reminders are upserted on their unsent (user, team, assignment),
+        unique in the collection, so workers reconciling the same assignment
+        concurrently never create two, while a reminder already sent does
+        not stop a new one when the due date moves later.
+        
+        Args:
+            assignment: The assignment document from MongoDB
+            due_date: The parsed due date
+            existing_user_ids: Users that already have a reminder for it
 
-        # Find existing subscriptions for this assignment
-        existing = self.db.assignment_subscriptions.find({
-            "assignment_id": assignment_id,
-            "sent": False
-        })
-        existing_user_ids = [sub.get("user_id") for sub in existing]
+        Returns:
+            List[UpdateOne]: The reminder upserts
+        """
+        assignment_id = str(assignment["_id"])
+        team_number = assignment.get("team_number")
+        assigned_to = assignment.get("assigned_to") or []
 
         # Get all subscriptions for the team that don't have specific assignment subscriptions
         team_subscriptions = self.db.assignment_subscriptions.find({
             "team_number": team_number,
             "assignment_id": None,
-            "user_id": {"$nin": existing_user_ids},
-            "subscription_json": {"$exists": True, "$ne": {}}
+            "user_id": {"$in": [user_id for user_id in assigned_to if user_id not in existing_user_ids]},
+            "device_id": {"$ne": None},
         })
 
-        # For each team subscription, create an assignment-specific subscription
+        inserts = []
         for sub in team_subscriptions:
-            user_id = sub.get("user_id")
-
-            # Check if user is assigned to this task
-            if user_id not in assignment.get("assigned_to", []):
-                continue
-
             # Calculate scheduled time based on reminder_time
             reminder_time = sub.get("reminder_time", 1440)  # Default: 1 day in minutes
             scheduled_time = due_date - timedelta(minutes=reminder_time)
@@ -194,34 +477,97 @@ class NotificationManager(DatabaseManager):
             if scheduled_time <= datetime.now():
                 continue
 
-            # Create the notification
-            new_notification = {
-                "user_id": user_id,
+            key = {
+                "user_id": sub.get("user_id"),
                 "team_number": team_number,
-                "subscription_json": sub.get("subscription_json", {}),
                 "assignment_id": assignment_id,
+                "sent": False,
+            }
+            inserts.append(UpdateOne(key, {"$setOnInsert": {
+                **key,
+                "device_id": sub["device_id"],
                 "reminder_time": reminder_time,
                 "scheduled_time": scheduled_time,
-                "sent": False,
                 "status": "pending",
-                "title": f"Assignment Reminder: {assignment.get('title')}",
-                "body": f"Your assignment '{assignment.get('title')}' is due soon",
-                "url": "/team/manage",
-                "data": {
-                    "assignment_id": assignment_id,
-                    "title": assignment.get("title"),
-                    "due_date": due_date.isoformat(),
-                    "type": "assignment_reminder",
-                },
+                **_reminder_content(assignment, due_date),
                 "created_at": datetime.now(),
                 "updated_at": datetime.now(),
-            }
-
-            # Insert the new notification
-            self.db.assignment_subscriptions.insert_one(new_notification)
+            }}, upsert=True))
+            self._push_time(scheduled_time)
+        return inserts
     
+    def _build_payload(self, subscription: AssignmentSubscription) -> str:
+        """Build the JSON push payload of a notification"""
+        data = {
+            "title": subscription.title,
+            "body": subscription.body,
+            "url": subscription.url,
+            "data": {
+                "assignment_id": subscription.assignment_id,
+                "url": subscription.url,
+                **subscription.data  # Include any additional data
+            },
+            "icon": "/static/images/logo.png",
+            "badge": "/static/images/logo.png",
+            "image": "/static/images/logo.png",
+            "actions": [
+                {
+                    "action": "view",
+                    "title": "View"
+                },
+                {
+                    "action": "dismiss",
+                    "title": "Dismiss"
+                }
+            ],
+            "timestamp": datetime.now().timestamp() * 1000  # JavaScript timestamp
+        }
+        return json.dumps(data)
+
+    def _build_vapid_signer(self) -> Tuple[Optional[VapidSigner], Optional[str]]:
+        """Load the VAPID key once; (None, reason) when it is unset or unusable"""
+        try:
+            return VapidSigner(self.vapid_private_key, self.vapid_claims), None
+        except Exception as e:
+            logger.error(f"Web Push disabled, cannot load the VAPID private key: {str(e)}")
+            return None, f"Web Push disabled: {str(e)}"
+
+    def _push_batch(self, subscriptions: List[AssignmentSubscription]) -> List[PushResult]:
+        """Send notifications concurrently to the devices they reference
+        
+        Devices whose push service reports the subscription gone are
+        deactivated in one update.
+
+        Args:
+            subscriptions: The AssignmentSubscription objects to send
+            
+        Returns:
+            List[PushResult]: One result per subscription, keyed by its id
+        """
+        if self.vapid_signer is None:
+            return [PushResult(subscription.id, False, None, self.vapid_error, 0.0) for subscription in subscriptions]
+
+        devices = self._load_devices(subscriptions)
+        messages = []
+        device_by_key = {}
+        for subscription in subscriptions:
+            device = devices.get(subscription.device_id)
+            # Inactive, deleted, or since registered by someone else on that browser
+            if device is None or device.get("user_id") != subscription.user_id:
+                logger.warning(f"No active push device for {subscription.id}")
+                continue
+            messages.append((subscription.id, device["subscription_json"], self._build_payload(subscription)))
+            device_by_key[subscription.id] = device["_id"]
+
+        results = {result.key: result for result in deliver(messages, self.vapid_signer)} if messages else {}
+        self._deactivate_devices(list({device_by_key[key] for key, result in results.items() if result.gone}))
+        return [
+            results.get(subscription.id) or PushResult(subscription.id, False, None, "No active push device", 0.0)
+            for subscription in subscriptions
+        ]
+
     def _send_push_notification(self, subscription: AssignmentSubscription) -> bool:
-        """Send a push notification using WebPush
+        """Send a single push notification
         
         Args:
             subscription: The AssignmentSubscription object
@@ -229,59 +575,60 @@ class NotificationManager(DatabaseManager):
         Returns:
             bool: True if the notification was sent successfully
         """
-        try:
-            subscription_info = subscription.subscription_json
-            if not subscription_info:
-                logger.warning(f"Empty subscription info for {subscription.id}")
-                return False
-                
-            data = {
-                "title": subscription.title,
-                "body": subscription.body,
-                "url": subscription.url,
-                "data": {
-                    "assignment_id": subscription.assignment_id,
-                    "url": subscription.url,
-                    **subscription.data  # Include any additional data
+        return self._push_batch([subscription])[0].ok
+    
+    # ============ Devices ============
+
+    async def register_device(self, user_id: str, team_number: int, subscription_json: Dict) -> Optional[ObjectId]:
+        """Store a browser push subscription once per endpoint
+        
+        Returns:
+            Optional[ObjectId]: The device id, None if the subscription has no endpoint
+        """
+        endpoint = (subscription_json or {}).get("endpoint")
+        if not endpoint:
+            return None
+        now = datetime.now()
+        device = await self.async_db.push_devices.find_one_and_update(
+            {"endpoint": endpoint},
+            {
+                "$set": {
+                    "subscription_json": subscription_json,
+                    "user_id": user_id,
+                    "team_number": team_number,
+                    "active": True,
+                    "updated_at": now,
                 },
-                "icon": "/static/images/logo.png",
-                "badge": "/static/images/logo.png",
-                "image": "/static/images/logo.png",
-                "actions": [
-                    {
-                        "action": "view",
-                        "title": "View"
-                    },
-                    {
-                        "action": "dismiss",
-                        "title": "Dismiss"
-                    }
-                ],
-                "timestamp": datetime.now().timestamp() * 1000  # JavaScript timestamp
-            }
-            
-            webpush(
-                subscription_info=subscription_info,
-                data=json.dumps(data),
-                vapid_private_key=self.vapid_private_key,
-                vapid_claims=self.vapid_claims
+                "$setOnInsert": {"created_at": now},
+            },
+            projection={"_id": 1},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return device["_id"]
+
+    def _load_devices(self, subscriptions: List[AssignmentSubscription]) -> Dict[ObjectId, Dict]:
+        """Get the active devices the subscriptions point at, by id"""
+        device_ids = list({subscription.device_id for subscription in subscriptions if subscription.device_id})
+        if not device_ids:
+            return {}
+        return {
+            device["_id"]: device
+            for device in self.db.push_devices.find(
+                {"_id": {"$in": device_ids}, "active": True},
+                {"subscription_json": 1, "user_id": 1},
             )
-            
-            return True
-        except WebPushException as e:
-            logger.error(f"WebPush error for {subscription.id}: {str(e)}")
-            
-            # Handle subscription that has been closed
-            if e.response and e.response.status_code in (404, 410):
-                # Remove the subscription since it's no longer valid
-                self.db.assignment_subscriptions.delete_one({"_id": subscription._id})
-                logger.info(f"Removed invalid subscription {subscription.id}")
-                
-            return False
-        except Exception as e:
-            logger.error(f"Error sending push notification: {str(e)}")
-            return False
-    
+        }
+
+    def _deactivate_devices(self, device_ids: List[ObjectId]):
+        """Stop pushing to devices whose push service dropped the subscription"""
+        if device_ids:
+            self.db.push_devices.update_many(
+                {"_id": {"$in": device_ids}},
+                {"$set": {"active": False, "deactivated_at": datetime.now()}}
+            )
+            logger.info(f"Deactivated {len(device_ids)} expired push devices")
+
     @with_mongodb_retry()
     async def create_subscription(self, user_id: str, team_number: int, 
                                 subscription_json: Dict, 
@@ -303,13 +650,13 @@ class NotificationManager(DatabaseManager):
 
         try:
             # Check if user is in the team
-            team = self.db.teams.find_one({"team_number": team_number, "users": user_id})
+            team = await self.async_db.teams.find_one({"team_number": team_number, "users": user_id})
             if not team:
                 return False, "User is not a member of this team"
 
             # If this is for a specific assignment, check if it exists and user is assigned
             if assignment_id:
-                assignment = self.db.assignments.find_one({
+                assignment = await self.async_db.assignments.find_one({
                     "_id": ObjectId(assignment_id),
                     "team_number": team_number
                 })
@@ -326,6 +673,9 @@ class NotificationManager(DatabaseManager):
                 "team_number": team_number,
                 "assignment_id": assignment_id or None,
             }
+            if assignment_id:
+                # A reminder already sent is kept, a new one is scheduled
+                query["sent"] = {"$ne": True}
 
             # Calculate scheduled time if this is for a specific assignment
             scheduled_time = None
@@ -345,8 +695,12 @@ class NotificationManager(DatabaseManager):
                 if scheduled_time <= datetime.now():
                     scheduled_time = None
 
+            device_id = await self.register_device(user_id, team_number, subscription_json)
+            if device_id is None:
+                return False, "Invalid subscription"
+
             update_data = {
-                "subscription_json": subscription_json,
+                "device_id": device_id,
                 "reminder_time": reminder_time,
                 "updated_at": datetime.now()
             }
@@ -368,12 +722,31 @@ class NotificationManager(DatabaseManager):
                 }
 
             # Use upsert to either update existing or create new
-            result = self.db.assignment_subscriptions.update_one(
+            result = await self.async_db.assignment_subscriptions.update_one(
                 query,
-                {"$set": update_data},
+                {"$set": update_data, "$unset": {"subscription_json": ""}},
                 upsert=True
             )
 
+            if not assignment_id:
+                # Unsent reminders follow the user's current browser
+                await self.async_db.assignment_subscriptions.update_many(
+                    {
+                        "user_id": user_id,
+                        "team_number": team_number,
+                        "assignment_id": {"$ne": None},
+                        "sent": False,
+                        "device_id": {"$ne": device_id},
+                    },
+                    {"$set": {"device_id": device_id}}
+                )
+
+            # Let the worker (re)schedule the reminders this subscription covers
+            if assignment_id:
+                self.assignment_changed(assignment_id)
+            else:
+                self.team_assignments_changed(team_number)
+
             if result.matched_count > 0:
                 return True, "Subscription updated successfully"
             elif result.upserted_id:
@@ -409,7 +782,14 @@ class NotificationManager(DatabaseManager):
             if assignment_id:
                 query["assignment_id"] = assignment_id
             
-            result = self.db.assignment_subscriptions.delete_many(query)
+            result = await self.async_db.assignment_subscriptions.delete_many(query)
+
+            if not assignment_id:
+                # The browser dropped its push subscription too
+                device_query = {key: value for key, value in query.items() if key != "assignment_id"}
+                await self.async_db.push_devices.update_many(
+                    device_query, {"$set": {"active": False, "deactivated_at": datetime.now()}}
+                )
             
             if result.deleted_count > 0:
                 return True, f"Deleted {result.deleted_count} subscriptions"
@@ -479,70 +859,38 @@ class NotificationManager(DatabaseManager):
             if not assigned_users:
                 return
                 
-            # Find all valid subscriptions for these users
-            subscriptions = self.db.assignment_subscriptions.find({
+            # One document per browser: no duplicates to weed out
+            devices = self.async_db.push_devices.find({
                 "user_id": {"$in": assigned_users},
                 "team_number": team_number,
-                "subscription_json": {"$exists": True, "$ne": {}},
+                "active": True,
                 "updated_at": {"$gte": datetime.now() - timedelta(days=1)}  # Only get recent subscriptions
-            })
-            
-            # Group subscriptions by user_id and keep only the most recent one
-            user_subscriptions = {}
-            for sub_data in subscriptions:
-                user_id = sub_data.get("user_id")
-                updated_at = sub_data.get("updated_at", datetime.min)
-                
-                # Keep only the most recently updated subscription for each user
-                if user_id not in user_subscriptions or updated_at > user_subscriptions[user_id].get("updated_at", datetime.min):
-                    user_subscriptions[user_id] = sub_data
-            
-            expired_subscriptions = []
-            notification_sent = False
-            
-            # Send notification using only the most recent subscription for each user
-            for sub_data in user_subscriptions.values():
-                try:
-                    # Create subscription object
-                    subscription = AssignmentSubscription({
-                        **sub_data,
-                        "title": f"New Assignment: {assignment_data.get('title')}",
-                        "body": f"Assignment: {assignment_data.get('title')}",
-                        "url": "/team/manage",
-                        "data": {
-                            "assignment_id": str(assignment_data.get("_id")),
-                            "title": assignment_data.get("title"),
-                            "type": "new_assignment"
-                        },
-                        "sent": False,
-                        "status": "pending"
-                    })
-                    
-                    # Try to send the notification
-                    try:
-                        if self._send_push_notification(subscription):
-                            notification_sent = True
-                            logger.info(f"Successfully sent notification for assignment {assignment_data.get('title')} to user {subscription.user_id}")
-                        else:
-                            logger.warning(f"Failed to send notification for assignment {assignment_data.get('title')} to user {subscription.user_id}")
-                    except WebPushException as e:
-                        if e.response and e.response.status_code in (404, 410):
-                            expired_subscriptions.append(sub_data["_id"])
-                            logger.info(f"Subscription {subscription.id} has expired")
-                        else:
-                            logger.error(f"WebPush error for {subscription.id}: {str(e)}")
-                    
-                except Exception as e:
-                    logger.error(f"Error processing subscription: {str(e)}")
-                    continue
-            
-            # Clean up expired subscriptions in bulk if any found
-            if expired_subscriptions:
-                self.db.assignment_subscriptions.delete_many({
-                    "_id": {"$in": expired_subscriptions}
+            }, {"user_id": 1})
+
+            subscriptions = [
+                AssignmentSubscription({
+                    "_id": device["_id"],
+                    "user_id": device["user_id"],
+                    "team_number": team_number,
+                    "device_id": device["_id"],
+                    "title": f"New Assignment: {assignment_data.get('title')}",
+                    "body": f"Assignment: {assignment_data.get('title')}",
+                    "url": "/team/manage",
+                    "data": {
+                        "assignment_id": str(assignment_data.get("_id")),
+                        "title": assignment_data.get("title"),
+                        "type": "new_assignment"
+                    },
+                    "sent": False,
+                    "status": "pending"
                 })
-                logger.info(f"Cleaned up {len(expired_subscriptions)} expired subscriptions")
-            
+                async for device in devices
+            ]
+            results = await asyncio.to_thread(self._push_batch, subscriptions)
+
+            notification_sent = any(result.ok for result in results)
+            logger.info(f"Sent {sum(result.ok for result in results)}/{len(results)} notifications for assignment {assignment_data.get('title')}")
+
             if not notification_sent:
                 logger.warning(f"No notifications were sent for assignment {assignment_data.get('title')}")
                 
@@ -0,0 +1,258 @@
+"""Concurrent Web Push delivery.
+
+``deliver`` sends a batch of pushes from a bounded thread pool instead of one
+blocking HTTPS request after another, and returns every outcome so callers
+can record them in a single bulk write. Each push service origin (FCM,
+Mozilla, Apple...) gets its own pooled ``requests.Session``, so TLS
+connections are reused across pushes and batches.
+
+VAPID Authorization headers only depend on the push service (the JWT
+audience), so ``VapidSigner`` loads the private key once and signs one
+header per audience, reused until shortly before it expires. Only the
+payload encryption is done per subscription.
+
+Sends are not retried here: a push service that did not answer 2xx may still
+have delivered, and the notification queue decides what to do with failures.
+
+Configured through the environment:
+    PUSH_WORKERS: Pushes sent concurrently (default 8)
+    PUSH_TIMEOUT: Seconds to wait for a push service (default 10)
+"""
+
+from __future__ import annotations
+
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from urllib.parse import urlparse
+
+import requests
+from py_vapid import Vapid, Vapid01
+from pywebpush import WebPusher
+from requests.adapters import HTTPAdapter
+
+from app import lifecycle
+
+logger = logging.getLogger(__name__)
+
+# Push service answers meaning the subscription no longer exists
+GONE_STATUSES = (404, 410)
+# Lifetime of a signed VAPID token (push services accept up to 24h), and how
+# long before its expiry a new one is signed
+VAPID_TOKEN_SECONDS = 12 * 3600
+VAPID_REFRESH_MARGIN = 600
+
+_executor = None
+_executor_lock = threading.Lock()
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+_stats = {"batches": 0, "batch_seconds": 0.0, "vapid_signatures": 0, "origins": {}}
+_stats_lock = threading.Lock()
+
+
+class PushResult(NamedTuple):
+    key: object
+    ok: bool
+    status: Optional[int]
+    error: Optional[str]
+    seconds: float
+
+    @property
+    def gone(self):
+        return self.status in GONE_STATUSES
+
+
+class VapidSigner:
+    """Signs VAPID Authorization headers, cached per push service audience"""
+
+    def __init__(self, private_key, claims: Dict[str, str]):
+        """
+        Args:
+            private_key: VAPID private key (base64 DER, PEM, a key file path or a Vapid instance)
+            claims: VAPID claims; aud and exp are set per audience
+
+        Raises:
+            ValueError: No key given
+            Exception: The key cannot be loaded (py_vapid errors)
+        """
+        if not private_key:
+            raise ValueError("No VAPID private key configured")
+        if isinstance(private_key, Vapid01):
+            self._vapid = private_key
+        elif os.path.isfile(private_key):
+            self._vapid = Vapid.from_file(private_key_file=private_key)
+        else:
+            self._vapid = Vapid.from_string(private_key=private_key)
+        self.claims = {key: value for key, value in claims.items() if key not in ("aud", "exp")}
+        # audience -> (exp, headers)
+        self._headers = {}
+        self._lock = threading.Lock()
+
+    def headers(self, audience: str) -> Dict[str, str]:
+        """Get the Authorization headers for a push service origin"""
+        cached = self._headers.get(audience)
+        if cached is None or cached[0] - VAPID_REFRESH_MARGIN <= time.time():
+            with self._lock:
+                cached = self._headers.get(audience)
+                if cached is None or cached[0] - VAPID_REFRESH_MARGIN <= time.time():
+                    exp = int(time.time()) + VAPID_TOKEN_SECONDS
+                    cached = self._headers[audience] = (exp, self._vapid.sign({**self.claims, "aud": audience, "exp": exp}))
+                    with _stats_lock:
+                        _stats["vapid_signatures"] += 1
+        # The sender adds its own headers to the dict
+        return dict(cached[1])
+
+
+@lifecycle.on_fork
+def _reset_after_fork():
+    # Pool threads and pooled sockets belong to the parent
+    global _executor, _executor_lock, _sessions, _sessions_lock, _stats_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+    _sessions = {}
+    _sessions_lock = threading.Lock()
+    _stats_lock = threading.Lock()
+
+
+def _workers():
+    return int(os.getenv("PUSH_WORKERS", 8))
+
+
+def _timeout():
+    return float(os.getenv("PUSH_TIMEOUT", 10))
+
+
+def max_deliver_seconds(count: int) -> float:
+    """Longest ``deliver`` can take for count pushes
+
+    Pushes go out in rounds of PUSH_WORKERS; PUSH_TIMEOUT bounds connecting
+    and waiting for the answer separately, so a push takes at most twice that.
+    """
+    return math.ceil(count / _workers()) * 2 * _timeout()
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=_workers(), thread_name_prefix="web-push")
+    return _executor
+
+
+def _origin(endpoint):
+    parsed = urlparse(endpoint)
+    return f"{parsed.scheme}://{parsed.netloc}"
+
+
+def _session_for(origin):
+    """Get the pooled session of a push service origin"""
+    session = _sessions.get(origin)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(origin)
+            if session is None:
+                session = requests.Session()
+                # As many connections as pushes in flight, and no retries (see above)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=_workers(), max_retries=0)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _sessions[origin] = session
+    return session
+
+
+def _record(origin, result):
+    with _stats_lock:
+        stats = _stats["origins"].setdefault(origin, {
+            "sent": 0,
+            "failed": 0,
+            "gone": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+        })
+        if result.ok:
+            stats["sent"] += 1
+        elif result.gone:
+            stats["gone"] += 1
+        else:
+            stats["failed"] += 1
+        stats["total_seconds"] += result.seconds
+        stats["max_seconds"] = max(stats["max_seconds"], result.seconds)
+
+
+def _push(key, subscription_info, data, signer):
+    endpoint = subscription_info.get("endpoint", "")
+    origin = _origin(endpoint)
+    started = time.perf_counter()
+    try:
+        # Encrypted for this subscription; the signed header is shared per origin
+        response = WebPusher(subscription_info, requests_session=_session_for(origin)).send(
+            data,
+            headers=signer.headers(origin),
+            content_encoding="aes128gcm",
+            timeout=_timeout(),
+        )
+        if response.status_code > 202:
+            error = f"Push failed: {response.status_code} {response.reason}: {response.text}"
+            result = PushResult(key, False, response.status_code, error, time.perf_counter() - started)
+        else:
+            result = PushResult(key, True, response.status_code, None, time.perf_counter() - started)
+    except Exception as e:
+        result = PushResult(key, False, None, str(e), time.perf_counter() - started)
+
+    _record(origin, result)
+    if not result.ok and not result.gone:
+        logger.error(f"WebPush error for {key}: {result.error}")
+    return result
+
+
+def deliver(messages: Iterable[Tuple[object, Dict, str]], signer: VapidSigner) -> List[PushResult]:
+    """Send pushes concurrently and wait for all of them
+
+    Args:
+        messages: (key, subscription info, JSON payload) per push; the key is
+            handed back in its result
+        signer: Signer of the VAPID Authorization headers
+
+    Returns:
+        List[PushResult]: One result per message, in order
+    """
+    messages = list(messages)
+    if not messages:
+        return []
+
+    started = time.perf_counter()
+    executor = _get_executor()
+    futures = [
+        executor.submit(_push, key, subscription_info, data, signer)
+        for key, subscription_info, data in messages
+    ]
+    results = [future.result() for future in futures]
+    elapsed = time.perf_counter() - started
+
+    with _stats_lock:
+        _stats["batches"] += 1
+        _stats["batch_seconds"] += elapsed
+    sent = sum(result.ok for result in results)
+    logger.info(f"Delivered {sent}/{len(results)} pushes in {elapsed * 1000:.0f}ms")
+    return results
+
+
+def get_push_stats():
+    """Get push counts and timings per push service origin, plus batch totals"""
+    with _stats_lock:
+        origins = {}
+        for origin, stats in _stats["origins"].items():
+            count = stats["sent"] + stats["failed"] + stats["gone"]
+            origins[origin] = {**stats, "avg_seconds": stats["total_seconds"] / count if count else 0.0}
+        return {
+            "batches": _stats["batches"],
+            "batch_seconds": _stats["batch_seconds"],
+            "vapid_signatures": _stats["vapid_signatures"],
+            "origins": origins,
+        }
@@ -1,6 +1,7 @@
 from flask import Blueprint, current_app, jsonify, request
 from flask_login import current_user, login_required
 
+from app import lifecycle
 from app.utils import async_route, limiter
 from .notification_manager import NotificationManager
 
@@ -31,14 +32,8 @@ def on_blueprint_init(state):
         app.db_managers = {}
     app.db_managers['notification'] = notification_manager
     
-    # Start the notification service
-    notification_manager.start_notification_service()
-    
-    # Register shutdown function
-    @app.teardown_appcontext
-    def shutdown_notification_service(exception=None):
-        if notification_manager:
-            notification_manager.stop_notification_service()
+    # Start the notification service once per process (after fork under gunicorn)
+    lifecycle.register_service("notification_service", notification_manager.start_notification_service)
 
 @notifications_bp.route("/vapid-public-key")
 def get_vapid_public_key():
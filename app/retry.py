@@ -0,0 +1,375 @@
+"""Retry policy and circuit breaker for MongoDB operations.
+
+``with_mongodb_retry`` (app.utils) wraps every manager method with this
+policy:
+
+- failed attempts are retried after an exponential backoff with full jitter
+  (``MONGO_RETRY_BASE_DELAY * 2**attempt``, capped at the decorator's
+  ``delay``), so a failover does not park every worker thread for seconds
+- ``async def`` methods await ``asyncio.sleep`` between attempts instead of
+  blocking their event loop
+- a per-process circuit breaker opens after ``MONGO_BREAKER_THRESHOLD``
+  consecutive connection failures; while open, calls fail fast with
+  ``CircuitOpenError`` for ``MONGO_BREAKER_COOLDOWN`` seconds, then a single
+  trial call decides whether it closes again
+
+Most manager methods catch their own exceptions, so a failure seldom reaches
+the decorator. The breaker is therefore also fed by the driver itself:
+``topology_watcher`` (a client event listener) opens it as soon as the
+server monitor reports no reachable server, and closes it when a heartbeat
+reaches one again. While the driver reports the server down, a call that
+returned (its error swallowed) does not count as a success, except for the
+half-open trial: every client's monitor feeds the same breaker, so a stale
+client can leave it marked down after the others have recovered, and the
+trial after each cooldown is what closes it then.
+
+Only the outermost decorated call goes through the breaker: methods called
+from another decorated method retry on their own but are neither rejected
+nor counted, so a half-open trial is one top-level operation.
+
+Configured through the environment:
+    MONGO_RETRY_BASE_DELAY: First backoff step in seconds (default 0.1)
+    MONGO_BREAKER_THRESHOLD: Consecutive failures that open the circuit (default 5)
+    MONGO_BREAKER_COOLDOWN: Seconds the circuit stays open (default 10)
+
+``get_retry_stats()`` reports retries, rejected calls and time spent open.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import contextvars
+import inspect
+import logging
+import os
+import random
+import threading
+import time
+from functools import wraps
+
+from pymongo import monitoring
+from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+
+from app import lifecycle
+
+logger = logging.getLogger(__name__)
+
+RETRYABLE_ERRORS = (ServerSelectionTimeoutError, ConnectionFailure)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(ConnectionFailure):
+    """Raised instead of calling MongoDB while the circuit is open"""
+
+
+class CircuitBreaker:
+    """Per-process circuit breaker shared by every MongoDB operation"""
+
+    def __init__(self, threshold=None, cooldown=None):
+        self.threshold = threshold or int(os.getenv("MONGO_BREAKER_THRESHOLD", 5))
+        self.cooldown = cooldown or float(os.getenv("MONGO_BREAKER_COOLDOWN", 10))
+        self.state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_running = False
+        # Set while the driver's server monitor finds no reachable server
+        self._server_down = False
+        self._lock = threading.Lock()
+
+    def _reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._trial_running = False
+
+    def allow(self):
+        """Whether a call may go to the database now
+
+        Returns:
+            tuple: (allowed, whether the call holds the half-open trial slot)
+        """
+        with self._lock:
+            if self.state == CLOSED:
+                return True, False
+            if self.state == OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN and not self._trial_running:
+                # Let exactly one trial call through
+                self._trial_running = True
+                return True, True
+        _incr("rejected")
+        return False, False
+
+    def release_trial(self):
+        """Free the trial slot of a call that ended without a verdict"""
+        with self._lock:
+            self._trial_running = False
+
+    def _open(self, reason):
+        # Caller holds the lock
+        self._opened_at = time.monotonic()
+        self.state = OPEN
+        _incr("circuit_opens")
+        logger.error(f"MongoDB circuit opened: {reason}")
+
+    def _close(self):
+        # Caller holds the lock
+        _incr("open_seconds", time.monotonic() - self._opened_at)
+        self.state = CLOSED
+        self._opened_at = None
+        logger.info("MongoDB circuit closed")
+
+    def record_success(self):
+        with self._lock:
+            self._trial_running = False
+            if self._server_down:
+                if self.state != HALF_OPEN:
+                    # The method swallowed its error; the driver knows better
+                    return
+                # The trial reached the server despite what a monitor last said
+                self._server_down = False
+            self._failures = 0
+            if self.state != CLOSED:
+                self._close()
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == HALF_OPEN:
+                # Failed trial: stay open for another cooldown
+                _incr("open_seconds", time.monotonic() - self._opened_at)
+                self._opened_at = time.monotonic()
+                self.state = OPEN
+            elif self.state == CLOSED and self._failures >= self.threshold:
+                self._open(f"{self._failures} consecutive failures")
+
+    def server_down(self, error):
+        """The driver's monitor lost every server: fail fast right away"""
+        with self._lock:
+            self._server_down = True
+            if self.state == CLOSED:
+                self._open(f"no reachable server ({error})")
+
+    def server_up(self):
+        """A heartbeat reached a server again"""
+        with self._lock:
+            self._server_down = False
+            self._failures = 0
+            self._trial_running = False
+            if self.state != CLOSED:
+                self._close()
+
+    def open_for(self):
+        """Seconds the circuit has been open, 0 when closed"""
+        with self._lock:
+            return time.monotonic() - self._opened_at if self._opened_at is not None else 0.0
+
+
+class TopologyWatcher(monitoring.TopologyListener):
+    """Feeds the breaker from the driver's server monitoring (heartbeats)"""
+
+    def opened(self, event):
+        pass
+
+    def closed(self, event):
+        pass
+
+    def description_changed(self, event):
+        description = event.new_description
+        if description.has_readable_server():
+            if breaker._server_down:
+                breaker.server_up()
+            return
+        # Servers not checked yet have no error: only a failed heartbeat counts
+        errors = [server.error for server in description.server_descriptions().values() if server.error]
+        if errors:
+            breaker.server_down(errors[0])
+
+
+breaker = CircuitBreaker()
+topology_watcher = TopologyWatcher()
+# Set while a decorated call runs, so nested ones bypass the breaker
+_in_operation = contextvars.ContextVar("mongo_operation", default=False)
+
+
+def leave_operation():
+    """Clear the nested-call flag, for work that outlives the call that started it
+
+    Run inside a copied context (see ``async_runtime.spawn``), so a task
+    spawned from a decorated call goes through the breaker on its own.
+    """
+    _in_operation.set(False)
+
+
+# ============ Counters ============
+
+_stats = {
+    "calls": 0,
+    "retries": 0,
+    "recovered": 0,
+    "failed": 0,
+    "rejected": 0,
+    "circuit_opens": 0,
+    "open_seconds": 0.0,
+}
+_stats_lock = threading.Lock()
+
+
+def _incr(counter, amount=1):
+    with _stats_lock:
+        _stats[counter] += amount
+
+
+def get_retry_stats():
+    """Get retry/circuit counters and the breaker's current state"""
+    with _stats_lock:
+        stats = dict(_stats)
+    open_for = breaker.open_for()
+    stats["open_seconds"] += open_for
+    stats["circuit_state"] = breaker.state
+    stats["circuit_open_for_seconds"] = open_for
+    return stats
+
+
+@lifecycle.on_fork
+def _reset_after_fork():
+    global _stats_lock
+    _stats_lock = threading.Lock()
+    breaker._reset_after_fork()
+
+
+# ============ Retry Policy ============
+
+def backoff_delay(attempt, max_delay):
+    """Full-jitter exponential backoff before retry number ``attempt`` (from 0)"""
+    base = float(os.getenv("MONGO_RETRY_BASE_DELAY", 0.1))
+    return random.uniform(0, min(max_delay, base * 2 ** attempt))
+
+
+def _reject(f):
+    logger.warning(f"MongoDB circuit open, failing {f.__qualname__} fast")
+    return CircuitOpenError("MongoDB is unavailable (circuit open)")
+
+
+def _on_error(f, e, attempt, retries):
+    """Record a failed attempt; True when the call should be retried"""
+    breaker.record_failure()
+    if attempt < retries - 1 and breaker.state == CLOSED:
+        logger.warning(f"Attempt {attempt + 1} of {f.__qualname__} failed: {str(e)}")
+        _incr("retries")
+        return True
+    logger.error(f"{f.__qualname__} failed after {attempt + 1} attempts: {str(e)}")
+    _incr("failed")
+    return False
+
+
+def _on_success(attempt):
+    breaker.record_success()
+    if attempt:
+        _incr("recovered")
+
+
+def _nested_retry(f, e, attempt, retries):
+    """Failed attempt of a nested call: retried, but left to the outermost call to count"""
+    if attempt < retries - 1:
+        logger.warning(f"Attempt {attempt + 1} of {f.__qualname__} failed: {str(e)}")
+        return True
+    return False
+
+
+def retry(retries=3, delay=2):
+    """Decorator retrying MongoDB operations under the shared circuit breaker
+
+    Args:
+        retries: Attempts in total
+        delay: Longest single backoff in seconds
+    """
+    def decorator(f):
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def async_wrapper(*args, **kwargs):
+                if _in_operation.get():
+                    for attempt in range(retries):
+                        try:
+                            return await f(*args, **kwargs)
+                        except CircuitOpenError:
+                            raise
+                        except RETRYABLE_ERRORS as e:
+                            if not _nested_retry(f, e, attempt, retries):
+                                raise
+                            await asyncio.sleep(backoff_delay(attempt, delay))
+
+                _incr("calls")
+                token = _in_operation.set(True)
+                try:
+                    for attempt in range(retries):
+                        allowed, trial = breaker.allow()
+                        if not allowed:
+                            raise _reject(f)
+                        try:
+                            result = await f(*args, **kwargs)
+                        except CircuitOpenError:
+                            raise
+                        except RETRYABLE_ERRORS as e:
+                            if not _on_error(f, e, attempt, retries):
+                                raise
+                            await asyncio.sleep(backoff_delay(attempt, delay))
+                        except Exception:
+                            breaker.record_success()
+                            raise
+                        else:
+                            _on_success(attempt)
+                            return result
+                        finally:
+                            if trial:
+                                # No-op once a verdict was recorded
+                                breaker.release_trial()
+                finally:
+                    _in_operation.reset(token)
+            return async_wrapper
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if _in_operation.get():
+                for attempt in range(retries):
+                    try:
+                        return f(*args, **kwargs)
+                    except CircuitOpenError:
+                        raise
+                    except RETRYABLE_ERRORS as e:
+                        if not _nested_retry(f, e, attempt, retries):
+                            raise
+                        time.sleep(backoff_delay(attempt, delay))
+
+            _incr("calls")
+            token = _in_operation.set(True)
+            try:
+                for attempt in range(retries):
+                    allowed, trial = breaker.allow()
+                    if not allowed:
+                        raise _reject(f)
+                    try:
+                        result = f(*args, **kwargs)
+                    except CircuitOpenError:
+                        raise
+                    except RETRYABLE_ERRORS as e:
+                        if not _on_error(f, e, attempt, retries):
+                            raise
+                        time.sleep(backoff_delay(attempt, delay))
+                    except Exception:
+                        # Any other error still means the server answered
+                        breaker.record_success()
+                        raise
+                    else:
+                        _on_success(attempt)
+                        return result
+                    finally:
+                        if trial:
+                            # No-op once a verdict was recorded
+                            breaker.release_trial()
+            finally:
+                _in_operation.reset(token)
+        return wrapper
+    return decorator
@@ -1,14 +1,15 @@
 import logging
 import os
 from datetime import datetime
-from functools import lru_cache
 from typing import Union
-import requests
+
+from app.cache import CATALOG, LIVE_DATA, STATIC, STATS, ttl_cache
+from app.http_session import get_session
 
 logger = logging.getLogger(__name__)
 
 class FTCScout:
-    def __init__(self):
+    def __init__(self, cache_backend=None):
         self._API_URI: str = "https://api.ftcscout.org/rest/v1"
         self._GRAPHQL_URI: str = "https://api.ftcscout.org/graphql"
 
@@ -17,8 +18,15 @@ class FTCScout:
         }
 
         self.timeout = 5 
+        # Optional cross-worker cache (see app.cache.create_cache_backend)
+        self.cache_backend = cache_backend
+
+    @property
+    def session(self):
+        # Pooled keep-alive connections shared by every client in the process
+        return get_session()
 
-    @lru_cache(maxsize=100)
+    @ttl_cache(CATALOG)
     def get_all_events(self, season: int, start: str = None, end: str = None, limit: int = None, 
                        region: str = None, event_type: str = "All", has_matches: bool = None, 
                        search_text: str = None):
@@ -76,7 +84,7 @@ class FTCScout:
             if search_text:
                 variables['searchText'] = search_text
             
-            response = requests.post(
+            response = self.session.post(
                 self._GRAPHQL_URI,
                 headers={
                     "accept": "application/json",
@@ -108,7 +116,7 @@ class FTCScout:
             logger.error(f"Error fetching events from FTCScout: {e}")
             return None
 
-    @lru_cache(maxsize=100)
+    @ttl_cache(LIVE_DATA)
     def get_all_matches(self, season: int, code: str) -> Union[dict, None]:
         """Get all matches in a certain event
         
@@ -117,7 +125,7 @@ class FTCScout:
             code: Event code
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self._API_URI}/events/{season}/{code}/matches",
                 headers=self.headers,
                 timeout=self.timeout
@@ -128,7 +136,38 @@ class FTCScout:
             logger.error(f"Error fetching matches from FTCScout: {e}")
             return None
 
-    @lru_cache(maxsize=100)
+    def poll_all_matches(self, season: int, code: str, etag: str = None) -> tuple:
+        """Get all matches in an event unless they are unchanged since etag
+        
+        Args:
+            season: Season year
+            code: Event code
+            etag: ETag of the previously fetched matches (optional)
+
+        Returns:
+            tuple: (matches, etag, modified); (None, etag, False) when unchanged
+            and (None, None, False) on error
+        """
+        headers = dict(self.headers)
+        if etag:
+            headers["If-None-Match"] = etag
+        try:
+            response = self.session.get(
+                f"{self._API_URI}/events/{season}/{code}/matches",
+                headers=headers,
+                timeout=self.timeout
+            )
+
+            if response.status_code == 304:
+                return None, etag, False
+            if response.status_code != 200:
+                return None, None, False
+            return response.json(), response.headers.get("ETag"), True
+        except Exception as e:
+            logger.error(f"Error polling matches from FTCScout: {e}")
+            return None, None, False
+
+    @ttl_cache(STATIC)
     def get_team(self, team: int) -> Union[dict, None]:
         """Get team information
         
@@ -136,7 +175,7 @@ class FTCScout:
             team: Team number
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self._API_URI}/teams/{team}",
                 headers=self.headers,
                 timeout=self.timeout
@@ -147,7 +186,7 @@ class FTCScout:
             logger.error(f"Error fetching team from FTCScout: {e}")
             return None
 
-    @lru_cache(maxsize=100)
+    @ttl_cache(STATS)
     def get_team_events(self, team: int, season: int) -> Union[list, None]:
         """Get events for a team in a season
         
@@ -156,7 +195,7 @@ class FTCScout:
             season: Season year
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self._API_URI}/teams/{team}/events/{season}",
                 headers=self.headers,
                 timeout=self.timeout
@@ -167,7 +206,7 @@ class FTCScout:
             logger.error(f"Error fetching team events from FTCScout: {e}")
             return None
 
-    @lru_cache(maxsize=100)
+    @ttl_cache(CATALOG)
     def get_event_details(self, season: int, code: str) -> Union[dict, None]:
         """Get event details
         
@@ -176,7 +215,7 @@ class FTCScout:
             code: Event code
         """
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self._API_URI}/events/{season}/{code}",
                 headers=self.headers,
                 timeout=self.timeout
@@ -187,7 +226,7 @@ class FTCScout:
             logger.error(f"Error fetching event details from FTCScout: {e}")
             return None
 
-    @lru_cache(maxsize=100)
+    @ttl_cache(STATS)
     def get_quick_stats(self, team: int, season: int = None, region: str = None) -> Union[dict, None]:
         """Get quick stats for a team
         
@@ -203,7 +242,7 @@ class FTCScout:
             if region:
                 params['region'] = region
                 
-            response = requests.get(
+            response = self.session.get(
                 f"{self._API_URI}/teams/{team}/quick-stats",
                 headers=self.headers,
                 params=params,
@@ -215,7 +254,7 @@ class FTCScout:
             logger.error(f"Error fetching quick stats from FTCScout: {e}")
             return None
 
-    @lru_cache(maxsize=100)
+    @ttl_cache(LIVE_DATA)
     def get_event_rankings(self, season: int, code: str) -> Union[list, None]:
         """Get event rankings using GraphQL
         
@@ -253,7 +292,7 @@ class FTCScout:
                 "code": code
             }
             
-            response = requests.post(
+            response = self.session.post(
                 self._GRAPHQL_URI,
                 headers={
                     "accept": "application/json",
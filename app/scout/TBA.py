@@ -3,8 +3,9 @@
 import logging
 import os
 from datetime import datetime
-from functools import lru_cache
-import requests
+
+from app.cache import CATALOG, LIVE_DATA, STATIC, STATS, ttl_cache
+from app.http_session import get_session
 
 logger = logging.getLogger(__name__)
 
@@ -23,11 +24,16 @@ class TBAInterface:
         }
         self.timeout = 5  # Reduced timeout
 
-    @lru_cache(maxsize=100)
+    @property
+    def session(self):
+        # Pooled keep-alive connections shared by every client in the process
+        return get_session()
+
+    @ttl_cache(STATIC)
     def get_team(self, team_key):
         """Get team information from TBA"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/team/{team_key}",
                 headers=self.headers,
                 timeout=self.timeout
@@ -37,11 +43,11 @@ class TBAInterface:
             logger.error(f"Error fetching team from TBA: {e}")
             return None
 
-    @lru_cache(maxsize=100)
+    @ttl_cache(LIVE_DATA)
     def get_event_matches(self, event_key):
         """Get matches for an event and format them by match number"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/event/{event_key}/matches",
                 headers=self.headers,
                 timeout=self.timeout
@@ -78,11 +84,11 @@ class TBAInterface:
             logger.error(f"Error fetching event matches from TBA: {e}")
             return None
 
-    @lru_cache(maxsize=100)
+    @ttl_cache(CATALOG)
     def get_current_events(self, year):
         """Get all events for the specified year"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/events/{year}/simple",
                 headers=self.headers,
                 timeout=self.timeout
@@ -112,11 +118,11 @@ class TBAInterface:
             logger.error(f"Error fetching events from TBA: {e}")
             return None
             
-    @lru_cache(maxsize=100)
+    @ttl_cache(LIVE_DATA)
     def get_team_status_at_event(self, team_key, event_key):
         """Get team status and ranking at a specific event"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/team/{team_key}/event/{event_key}/status",
                 headers=self.headers,
                 timeout=self.timeout
@@ -126,11 +132,11 @@ class TBAInterface:
             logger.error(f"Error fetching team status from TBA: {e}")
             return None
             
-    @lru_cache(maxsize=100)
+    @ttl_cache(LIVE_DATA)
     def get_team_matches_at_event(self, team_key, event_key):
         """Get a team's matches at a specific event with previous and upcoming separation"""
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/team/{team_key}/event/{event_key}/matches",
                 headers=self.headers,
                 timeout=self.timeout
@@ -198,14 +204,14 @@ class TBAInterface:
             logger.error(f"Error fetching team matches from TBA: {e}")
             return None
             
-    @lru_cache(maxsize=100)
+    @ttl_cache(STATS)
     def get_team_events(self, team_key, year=None):
         """Get all events a team is participating in for the given year"""
         if year is None:
             year = datetime.now().year
             
         try:
-            response = requests.get(
+            response = self.session.get(
                 f"{self.base_url}/team/{team_key}/events/{year}/simple",
                 headers=self.headers,
                 timeout=self.timeout
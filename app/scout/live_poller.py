@@ -0,0 +1,232 @@
+"""Background poller keeping live events' matches and rankings warm.
+
+While an event is running its matches and rankings change every few minutes.
+Instead of fetching them lazily on user requests, the poller refreshes the
+FTCScout cache for every live event on a fixed cadence, so
+``/api/ftc/matches``, ``/api/ftc/team-status`` and the rankings always read a
+fresh cached value.
+
+An event is live when it has team_data written in the last
+``LIVE_EVENT_RECENT_HOURS`` hours and (if the season catalog knows it) its
+start/end dates include today.
+
+The poller starts in every worker process. With a shared cache backend
+(``API_CACHE_BACKEND`` mongo or sqlite) only one polls at a time, since what
+it caches is read by every worker: it holds a lease in the
+``service_leases`` collection, renewed every poll and taken over by another
+process once it lapses. Without one each worker only has its own in-memory
+cache, so every worker polls for itself rather than leaving all but one to
+call FTCScout on their misses. Its calls run on a small pool of its own, so
+polling never takes threads from request fan-outs.
+
+Configured through the environment:
+    LIVE_POLL_ENABLED: Set to False to disable the poller (default True)
+    LIVE_POLL_INTERVAL: Seconds between polls (default 30)
+    LIVE_POLL_WORKERS: Threads polling events concurrently (default 2)
+    LIVE_EVENT_RECENT_HOURS: How recent team_data writes must be (default 6)
+"""
+
+from __future__ import annotations
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+from app.http_session import fan_out
+from app.scout.FTCScout import FTCScout
+
+logger = logging.getLogger(__name__)
+
+LEASES_COLLECTION = "service_leases"
+LEASE_NAME = "live_event_poller"
+
+
+def current_season(today=None):
+    """FTC seasons start in September"""
+    today = today or datetime.now()
+    return today.year if today.month >= 9 else today.year - 1
+
+
+class LiveEventPoller:
+    """Polls matches and rankings of live events into the FTCScout cache"""
+
+    def __init__(self, ftc, db_manager, interval=None, recent_hours=None):
+        self.ftc = ftc
+        self.db_manager = db_manager
+        self.interval = interval or int(os.getenv("LIVE_POLL_INTERVAL", 30))
+        self.recent_hours = recent_hours or int(os.getenv("LIVE_EVENT_RECENT_HOURS", 6))
+        # event code -> (ETag, matches) of the last matches response; only
+        # the poller thread touches it
+        self._matches = {}
+        self._shutdown_event = threading.Event()
+        self._poller_thread = None
+        self._executor = None
+        # Identifies this process's claim on the lease
+        self._lease_owner = ObjectId()
+        self._is_leader = False
+
+    @property
+    def db(self):
+        return self.db_manager.db
+
+    def start(self):
+        """Start the background polling thread"""
+        if os.getenv("LIVE_POLL_ENABLED", "True").lower() == "false":
+            logger.info("Live event poller disabled")
+            return
+        if self._poller_thread is None or not self._poller_thread.is_alive():
+            self._shutdown_event.clear()
+            # Fresh pool and lease identity in this process (it may be a forked child)
+            self._executor = ThreadPoolExecutor(
+                max_workers=int(os.getenv("LIVE_POLL_WORKERS", 2)),
+                thread_name_prefix="live-poller",
+            )
+            self._lease_owner = ObjectId()
+            self._is_leader = False
+            self._matches = {}
+            self._poller_thread = threading.Thread(
+                target=self._poller_worker,
+                name="live-event-poller",
+                daemon=True
+            )
+            self._poller_thread.start()
+            logger.info("Live event poller started")
+
+    def stop(self):
+        """Stop the background polling thread"""
+        if self._poller_thread and self._poller_thread.is_alive():
+            self._shutdown_event.set()
+            self._poller_thread.join(timeout=5)
+            self._executor.shutdown(wait=False)
+            self._release_lease()
+            logger.info("Live event poller stopped")
+
+    @property
+    def shared_cache(self):
+        """Whether what this process caches is seen by the other workers"""
+        return getattr(self.ftc, "cache_backend", None) is not None
+
+    def _poller_worker(self):
+        if not self.shared_cache:
+            logger.info("No shared API cache backend, live event poller polls in every worker")
+        while not self._shutdown_event.is_set():
+            try:
+                if not self.shared_cache or self._acquire_lease():
+                    self.poll_once()
+            except Exception as e:
+                logger.error(f"Error in live event poller: {str(e)}")
+            self._shutdown_event.wait(self.interval)
+
+    # ============ Leader Lease ============
+
+    def _acquire_lease(self):
+        """Take or renew the poller lease; whether this process polls now"""
+        now = datetime.now(timezone.utc)
+        try:
+            # Matches our own lease or a lapsed one; otherwise the upsert
+            # collides with the holder's document
+            self.db[LEASES_COLLECTION].update_one(
+                {
+                    "_id": LEASE_NAME,
+                    "$or": [{"owner": self._lease_owner}, {"expires_at": {"$lte": now}}],
+                },
+                {"$set": {
+                    "owner": self._lease_owner,
+                    # Outlives a few missed polls before another process takes over
+                    "expires_at": now + timedelta(seconds=3 * self.interval),
+                }},
+                upsert=True,
+            )
+            leader = True
+        except DuplicateKeyError:
+            leader = False
+
+        if leader != self._is_leader:
+            logger.info(f"Live event poller {'is now' if leader else 'is no longer'} polling in this process")
+            if not leader:
+                self._matches = {}
+        self._is_leader = leader
+        return leader
+
+    def _release_lease(self):
+        if not self._is_leader:
+            return
+        try:
+            self.db[LEASES_COLLECTION].delete_one({"_id": LEASE_NAME, "owner": self._lease_owner})
+        except Exception as e:
+            logger.warning(f"Could not release the live event poller lease: {str(e)}")
+        self._is_leader = False
+
+    def live_events(self):
+        """Get the codes of the events being scouted right now"""
+        cutoff = datetime.now(timezone.utc) - timedelta(hours=self.recent_hours)
+        scouted = {
+            code for code in self.db.team_data.distinct("event_code", {"created_at": {"$gte": cutoff}})
+            if code
+        }
+        if not scouted:
+            return set()
+
+        today = datetime.now().strftime("%Y-%m-%d")
+        catalog = {
+            event.get("code"): event
+            for event in self.ftc.get_all_events(current_season()) or []
+        }
+        live = set()
+        for code in scouted:
+            event = catalog.get(code)
+            # Events missing from the catalog are trusted on their writes alone
+            if event is None or (event.get("start") or "")[:10] <= today <= (event.get("end") or "9999")[:10]:
+                live.add(code)
+        return live
+
+    def poll_once(self):
+        """Refresh matches and rankings of every live event once"""
+        events = self.live_events()
+        for code in set(self._matches) - events:
+            del self._matches[code]
+        if not events:
+            return 0
+
+        season = current_season()
+        deadline_seconds = max(5, self.interval - 1)
+        calls = {}
+        for code in events:
+            calls[("matches", code)] = (self._poll_matches, season, code, self._matches.get(code, (None, None)))
+            calls[("rankings", code)] = (self._poll_rankings, season, code)
+
+        results, timed_out = fan_out(calls, time.monotonic() + deadline_seconds, executor=self._executor)
+        # Merged here, on the poller thread; late calls only warm the cache
+        for (kind, code), result in results.items():
+            if kind == "matches" and result is not None:
+                self._matches[code] = result
+        logger.debug(f"Polled {len(events)} live events ({len(timed_out)} calls still running)")
+        return len(events)
+
+    def _poll_matches(self, season, code, previous):
+        """Refresh an event's matches
+
+        Returns:
+            tuple: New (ETag, matches) to remember, or None when unchanged
+        """
+        previous_etag, previous_matches = previous
+        matches, etag, modified = self.ftc.poll_all_matches(season, code, previous_etag)
+        if modified:
+            FTCScout.get_all_matches.cache_put(self.ftc, matches, season, code)
+            return (etag, matches) if etag else (None, None)
+        if etag and previous_matches is not None:
+            # Unchanged upstream (304): keep the cached copy fresh
+            FTCScout.get_all_matches.cache_put(self.ftc, previous_matches, season, code)
+        return None
+
+    def _poll_rankings(self, season, code):
+        # GraphQL has no conditional requests, always fetch and swap in
+        rankings = FTCScout.get_event_rankings.__wrapped__(self.ftc, season, code)
+        if rankings is not None:
+            FTCScout.get_event_rankings.cache_put(self.ftc, rankings, season, code)
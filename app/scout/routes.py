@@ -3,15 +3,22 @@
 from __future__ import annotations
 
 import json
+import time
 from datetime import datetime, timezone
 
-from bson import ObjectId, json_util
+from bson import json_util
 from flask import (Blueprint, current_app, flash, jsonify, redirect,
                    render_template, request, url_for)
 from flask_login import current_user, login_required
 
 import logging
-from app.scout.scouting_utils import ScoutingManager
+from app import lifecycle
+from app.cache import create_cache_backend
+from app.http_session import fan_out
+from app.log_pipeline import log_fields
+from app.scout import team_stats
+from app.scout.live_poller import LiveEventPoller
+from app.scout.scouting_utils import ScoutingManager, scouter_access_filter
 from app.utils import handle_route_errors
 
 from .FTCScout import FTCScout
@@ -19,6 +26,10 @@ from .FTCScout import FTCScout
 scouting_bp = Blueprint("scouting", __name__)
 scouting_manager = None
 ftc = None
+live_poller = None
+
+# Overall time budget for the FTCScout calls behind /api/ftc/team-status
+TEAM_STATUS_DEADLINE = 8
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -26,15 +37,19 @@ logger = logging.getLogger(__name__)
 
 @scouting_bp.record
 def on_blueprint_init(state):
-    global scouting_manager, ftc
+    global scouting_manager, ftc, live_poller
     app = state.app
     
     # Create ScoutingManager with the singleton connection
     scouting_manager = ScoutingManager(app.config["MONGO_URI"])
     
-    # Initialize FTCScout
+    # Initialize FTCScout, sharing its cache across workers if configured
     global ftc
-    ftc = FTCScout()
+    ftc = FTCScout(cache_backend=create_cache_backend(scouting_manager))
+
+    # Keep matches and rankings of live events warm in the FTCScout cache
+    live_poller = LiveEventPoller(ftc, scouting_manager)
+    lifecycle.register_service("live_event_poller", live_poller.start)
     
     # Store in app context for proper cleanup
     if not hasattr(app, 'db_managers'):
@@ -81,9 +96,17 @@ def add():
             flash("Invalid path coordinates format", "error")
             return redirect(url_for("scouting.home"))
 
-    success, message = scouting_manager.add_scouting_data(data, current_user.get_id())
-    current_app.logger.info(f"Tried to add scouting data ({success}) {data} for user {current_user.username if current_user.is_authenticated else 'Anonymous'} - {message}")
-    current_app.logger.info(f"Scouting.add Form Details {request.form} - {message}")
+    success, message = scouting_manager.add_scouting_data(data, current_user.get_id(), scouter=current_user)
+    current_app.logger.info(
+        f"Tried to add scouting data ({success}) for user {current_user.username if current_user.is_authenticated else 'Anonymous'} - {message}",
+        extra=log_fields(
+            team_number=data.get("team_number"),
+            event_code=data.get("event_code"),
+            match_number=data.get("match_number"),
+            fields=len(data),
+            request_bytes=request.content_length,
+        ),
+    )
 
     if success:
         flash("Team data added successfully", "success")
@@ -141,7 +164,6 @@ def edit(id):
 
         if request.method == "POST":
             data = request.form.to_dict()
-            current_app.logger.info(f"Scouting.edit Form Details {request.form}")
             # Add edit tracking - record who made the edit
             data['last_edited_by'] = current_user.get_id()
             data['last_edited_at'] = datetime.now().isoformat()
@@ -156,10 +178,16 @@ def edit(id):
             
             if scouting_manager.update_team_data(id, data, current_user.get_id()):
                 flash("Data updated successfully", "success")
-                current_app.logger.info(f"Successfully updated scouting data {data} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
+                current_app.logger.info(
+                    f"Successfully updated scouting data {id} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}",
+                    extra=log_fields(entry_id=id, fields=len(data), request_bytes=request.content_length),
+                )
                 return redirect(url_for("scouting.home"))
             
-            current_app.logger.info(f"Failed to update scouting data {data} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
+            current_app.logger.info(
+                f"Failed to update scouting data {id} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}",
+                extra=log_fields(entry_id=id, fields=len(data), request_bytes=request.content_length),
+            )
             flash("Unable to update data", "error")
 
         return render_template("scouting/edit.html", team_data=team_data)
@@ -245,66 +273,46 @@ def compare_teams():
         if len(teams) < 2:
             return jsonify({"error": "At least 2 teams are required"}), 400
 
+        scopes = team_stats.viewer_scopes(current_user.teamNumber, current_user.get_id())
         teams_data = {}
         for team_num in teams:
             try:
-                pipeline = [
-                    {"$match": {"team_number": team_num}},
-                    {"$lookup": {
-                        "from": "users",
-                        "localField": "scouter_id",
-                        "foreignField": "_id",
-                        "as": "scouter"
-                    }},
-                    {"$unwind": "$scouter"},
-                    {"$match": {
-                        "$or": [
-                            {"scouter.teamNumber": current_user.teamNumber} if current_user.teamNumber else {"scouter._id": ObjectId(current_user.get_id())},
-                            {"scouter._id": ObjectId(current_user.get_id())}
-                        ]
-                    }},
-                    {"$group": {
-                        "_id": "$team_number",
-                        "matches_played": {"$sum": 1},
-                        "avg_auto_purple_classified": {"$avg": {"$cond": [{"$gt": ["$auto_purple_classified", 0]}, "$auto_purple_classified", None]}},
-                        "avg_auto_green_classified": {"$avg": {"$cond": [{"$gt": ["$auto_green_classified", 0]}, "$auto_green_classified", None]}},
-                        "avg_auto_purple_overflow": {"$avg": {"$cond": [{"$gt": ["$auto_purple_overflow", 0]}, "$auto_purple_overflow", None]}},
-                        "avg_auto_green_overflow": {"$avg": {"$cond": [{"$gt": ["$auto_green_overflow", 0]}, "$auto_green_overflow", None]}},
-                        "avg_teleop_purple_classified": {"$avg": {"$cond": [{"$gt": ["$teleop_purple_classified", 0]}, "$teleop_purple_classified", None]}},
-                        "avg_teleop_green_classified": {"$avg": {"$cond": [{"$gt": ["$teleop_green_classified", 0]}, "$teleop_green_classified", None]}},
-                        "avg_teleop_purple_overflow": {"$avg": {"$cond": [{"$gt": ["$teleop_purple_overflow", 0]}, "$teleop_purple_overflow", None]}},
-                        "avg_teleop_green_overflow": {"$avg": {"$cond": [{"$gt": ["$teleop_green_overflow", 0]}, "$teleop_green_overflow", None]}},
-                        # Only count successful climbs in the rate
-                        "climb_success_rate": {"$avg": {"$cond": ["$climb_success", 1, 0]}},
-                        "auto_paths": {"$push": {
-                            "path": "$auto_path",
-                            "notes": "$auto_notes",
-                            "match_number": "$match_number"
-                        }},
-                        "robot_disabled_list": {"$push": "$robot_disabled"},
-                        "preferred_climb_type": {"$last": "$climb_type"},
-                        "matches": {"$push": "$$ROOT"}
-                    }},
+                if summary := next(scouting_manager.db.team_stats.aggregate([
+                    {"$match": {"scope": {"$in": scopes}, "team_number": team_num}},
+                    {"$sort": {"updated_at": 1}},
+                    {"$group": {"_id": "$team_number", **team_stats.summary_fields()}},
                     {"$match": {"matches_played": {"$gt": 0}}}
-                ]
+                ]), None):
+                    stats = {
+                        "_id": team_num,
+                        "matches_played": summary["matches_played"],
+                        # Only count successful climbs in the rate
+                        "climb_success_rate": summary["climb_successes"] / summary["matches_played"],
+                        "robot_disabled_counts": {
+                            value: summary[f"robot_disabled_{value.lower()}"]
+                            for value in team_stats.ROBOT_DISABLED_VALUES
+                        },
+                        "preferred_climb_type": summary["last_climb_type"],
+                    }
+                    # Averages skip matches where nothing was scored
+                    for field in team_stats.SCORING_FIELDS:
+                        nonzero = summary[f"nonzero_{field}"]
+                        stats[f"avg_{field}"] = summary[f"sum_{field}"] / nonzero if nonzero else None
 
-                if stats := list(
-                    scouting_manager.db.team_data.aggregate(pipeline)
-                ):
                     normalized_stats = {
                         "auto_scoring": (
-                            (stats[0]["avg_auto_purple_classified"] or 0) + 
-                            (stats[0]["avg_auto_green_classified"] or 0) +
-                            (stats[0]["avg_auto_purple_overflow"] or 0) +
-                            (stats[0]["avg_auto_green_overflow"] or 0)
+                            (stats["avg_auto_purple_classified"] or 0) + 
+                            (stats["avg_auto_green_classified"] or 0) +
+                            (stats["avg_auto_purple_overflow"] or 0) +
+                            (stats["avg_auto_green_overflow"] or 0)
                         ) / 20,
                         "teleop_scoring": (
-                            (stats[0]["avg_teleop_purple_classified"] or 0) + 
-                            (stats[0]["avg_teleop_green_classified"] or 0) +
-                            (stats[0]["avg_teleop_purple_overflow"] or 0) +
-                            (stats[0]["avg_teleop_green_overflow"] or 0)
+                            (stats["avg_teleop_purple_classified"] or 0) + 
+                            (stats["avg_teleop_green_classified"] or 0) +
+                            (stats["avg_teleop_purple_overflow"] or 0) +
+                            (stats["avg_teleop_green_overflow"] or 0)
                         ) / 20,
-                        "climb_rating": stats[0]["climb_success_rate"],
+                        "climb_rating": stats["climb_success_rate"],
                     }
 
                     # Get team info from FTCScout
@@ -316,9 +324,8 @@ def compare_teams():
                         "city": team_info.get("city"),
                         "state_prov": team_info.get("state"),
                         "country": team_info.get("country"),
-                        "stats": stats[0],
+                        "stats": stats,
                         "normalized_stats": normalized_stats,
-                        "matches": stats[0]["matches"]
                     }
 
             except Exception as team_error:
@@ -327,13 +334,55 @@ def compare_teams():
         if not teams_data:
             return jsonify({"error": "No data available for the selected teams"}), 404
 
-        current_app.logger.info(f"Successfully fetched team data {teams_data} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
+        current_app.logger.info(f"Successfully fetched team data for {len(teams_data)} teams for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
         return json_util.dumps(teams_data)
 
     except Exception as e:
         current_app.logger.error(f"Error in compare_teams: {str(e)}", exc_info=True)
         return jsonify({"error": "An error occurred while comparing teams"}), 500
 
+# Fields of a team_data entry shown in the compare match table and auto paths
+COMPARE_MATCH_FIELDS = (
+    "alliance", "match_number", "event_code", "climb_success", "climb_type",
+    "auto_path", "auto_notes", "device_type", "notes", "scouter_name", "created_at",
+    *team_stats.SCORING_FIELDS,
+)
+COMPARE_MATCHES_MAX_PER_PAGE = 100
+
+
+@scouting_bp.route("/api/compare/matches")
+# @limiter.limit("30 per minute")
+@login_required
+def compare_team_matches():
+    """One page of a compared team's scouted matches, newest first"""
+    try:
+        team_number = int(request.args.get("team", ""))
+        page = max(int(request.args.get("page", 1)), 1)
+        per_page = min(max(int(request.args.get("per_page", 50)), 1), COMPARE_MATCHES_MAX_PER_PAGE)
+    except ValueError:
+        return jsonify({"error": "Invalid team or page"}), 400
+
+    try:
+        # One extra row tells whether there is a next page
+        matches = list(scouting_manager.db.team_data.find(
+            {
+                "team_number": team_number,
+                **scouter_access_filter(current_user.teamNumber, current_user.get_id())
+            },
+            {field: 1 for field in COMPARE_MATCH_FIELDS},
+        ).sort([("created_at", -1), ("_id", -1)]).skip((page - 1) * per_page).limit(per_page + 1))
+
+        return json_util.dumps({
+            "team_number": team_number,
+            "page": page,
+            "has_more": len(matches) > per_page,
+            "matches": matches[:per_page],
+        })
+    except Exception as e:
+        current_app.logger.error(f"Error in compare_team_matches: {str(e)}", exc_info=True)
+        return jsonify({"error": "An error occurred while loading matches"}), 500
+
+
 @scouting_bp.route("/api/search")
 @login_required
 # @limiter.limit("30 per minute")
@@ -356,20 +405,10 @@ def search_teams():
         
         # Fetch scouting data from our database
         pipeline = [
-            {"$match": {"team_number": team_number}},
-            {"$lookup": {
-                "from": "users",
-                "localField": "scouter_id",
-                "foreignField": "_id",
-                "as": "scouter"
-            }},
-            {"$unwind": {"path": "$scouter"}},
-            # Add team access filter
+            # Team access filter on the denormalized scouter fields
             {"$match": {
-                "$or": [
-                    {"scouter.teamNumber": current_user.teamNumber} if current_user.teamNumber else {"scouter._id": ObjectId(current_user.get_id())},
-                    {"scouter._id": ObjectId(current_user.get_id())}
-                ]
+                "team_number": team_number,
+                **scouter_access_filter(current_user.teamNumber, current_user.get_id())
             }},
             {"$sort": {"event_code": 1, "match_number": 1}},
             {
@@ -391,8 +430,8 @@ def search_teams():
                     "auto_path": 1,
                     "auto_notes": 1,
                     "notes": 1,
-                    "scouter_name": "$scouter.username",
-                    "scouter_id": {"$toString": "$scouter._id"} 
+                    "scouter_name": 1,
+                    "scouter_id": {"$toString": "$scouter_id"}
                 }
             }
         ]
@@ -412,7 +451,7 @@ def search_teams():
         }]
 
         # Use json_util.dumps to handle MongoDB types
-        current_app.logger.info(f"Successfully fetched team data {response_data} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
+        current_app.logger.info(f"Successfully fetched {len(response_data)} search results for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
         return json_util.dumps(response_data), 200, {'Content-Type': 'application/json'}
 
     except Exception as e:
@@ -427,212 +466,68 @@ def leaderboard():
         sort_type = request.args.get('sort', 'total')
         selected_event = request.args.get('event', 'all')
         
-        # Get available events from scouting data
+        # Get available events from the materialized team stats
         # Filter by team access: only show events from user's team or user himself
+        scopes = team_stats.viewer_scopes(current_user.teamNumber, current_user.get_id())
         events_pipeline = [
-            # Join with users collection to get scouter information
-            {
-                "$lookup": {
-                    "from": "users",
-                    "localField": "scouter_id",
-                    "foreignField": "_id",
-                    "as": "scouter"
-                }
-            },
-            {"$unwind": "$scouter"},
-            # Filter by team access
-            {"$match": {
-                "$or": [
-                    {"scouter.teamNumber": current_user.teamNumber} if current_user.teamNumber else {"scouter._id": ObjectId(current_user.get_id())},
-                    {"scouter._id": ObjectId(current_user.get_id())}
-                ]
-            }},
+            {"$match": {"scope": {"$in": scopes}}},
             # Group by event code to get unique events
             {"$group": {
                 "_id": "$event_code",
                 "event_name": {"$first": "$event_name"},
-                "count": {"$sum": 1}
+                "count": {"$sum": "$count"}
             }},
             {"$sort": {"_id": 1}}
         ]
         
-        events = list(scouting_manager.db.team_data.aggregate(events_pipeline))
+        events = list(scouting_manager.db.team_stats.aggregate(events_pipeline))
         
-        # Main pipeline for team data
-        pipeline = [
-            # Join with users collection to get scouter information
-            {
-                "$lookup": {
-                    "from": "users",
-                    "localField": "scouter_id",
-                    "foreignField": "_id",
-                    "as": "scouter"
-                }
-            },
-            {"$unwind": "$scouter"},
-            # Filter by team access
-            {"$match": {
-                "$or": [
-                    {"scouter.teamNumber": current_user.teamNumber} if current_user.teamNumber else {"scouter._id": ObjectId(current_user.get_id())},
-                    {"scouter._id": ObjectId(current_user.get_id())}
-                ]
-            }}
-        ]
-        
-        # Filter by selected event if not 'all'
+        # One stats row per (event, team): sum the rows of the selected events
+        match_stage = {"scope": {"$in": scopes}}
         if selected_event != 'all':
-            pipeline.append({"$match": {"event_code": selected_event}})
-        
-        # Continue with the existing aggregation
-        pipeline.extend([
-            {"$group": {
-                "_id": "$team_number",
-                "matches_played": {"$sum": 1},
-
-                "auto_purple_classified": {"$avg": {"$ifNull": ["$auto_purple_classified", 0]}},
-                "auto_green_classified": {"$avg": {"$ifNull": ["$auto_green_classified", 0]}},
-                "auto_purple_overflow": {"$avg": {"$ifNull": ["$auto_purple_overflow", 0]}},
-                "auto_green_overflow": {"$avg": {"$ifNull": ["$auto_green_overflow", 0]}},
-                # Teleop
-                "teleop_purple_classified": {"$avg": {"$ifNull": ["$teleop_purple_classified", 0]}},
-                "teleop_green_classified": {"$avg": {"$ifNull": ["$teleop_green_classified", 0]}},
-                "teleop_purple_overflow": {"$avg": {"$ifNull": ["$teleop_purple_overflow", 0]}},
-                "teleop_green_overflow": {"$avg": {"$ifNull": ["$teleop_green_overflow", 0]}},
-                
-                # Robot Disabled
-                "robot_disabled_list": {"$push": "$robot_disabled"},
-
-                # Climb stats
-                "climb_attempts": {"$sum": 1},
-                "climb_successes": {
-                    "$sum": {"$cond": [{"$eq": ["$climb_success", True]}, 1, 0]}
-                },
-                "park_attempts": {
-                    "$sum": {"$cond": [{"$eq": ["$climb_type", "park"]}, 1, 0]}
-                },
-                "park_successes": {
-                    "$sum": {
-                        "$cond": [
-                            {"$and": [
-                                {"$eq": ["$climb_type", "park"]},
-                                {"$eq": ["$climb_success", True]}
-                            ]},
-                            1,
-                            0
-                        ]
-                    }
-                },
-                "complete_park_attempts": {
-                    "$sum": {"$cond": [{"$eq": ["$climb_type", "complete park"]}, 1, 0]}
-                },
-                "complete_park_successes": {
-                    "$sum": {
-                        "$cond": [
-                            {"$and": [
-                                {"$eq": ["$climb_type", "complete park"]},
-                                {"$eq": ["$climb_success", True]}
-                            ]},
-                            1,
-                            0
-                        ]
-                    }
-                },
-                "stacked_park_attempts": {
-                    "$sum": {"$cond": [{"$eq": ["$climb_type", "stacked park"]}, 1, 0]}
-                },
-                "stacked_park_successes": {
-                    "$sum": {
-                        "$cond": [
-                            {"$and": [
-                                {"$eq": ["$climb_type", "stacked park"]},
-                                {"$eq": ["$climb_success", True]}
-                            ]},
-                            1,
-                            0
-                        ]
-                    }
-                }
-            }},
+            match_stage["event_code"] = selected_event
+
+        def avg(field):
+            return {"$divide": [f"$sum_{field}", "$matches_played"]}
+
+        def rate(successes, attempts):
+            return {
+                "$multiply": [
+                    {"$cond": [
+                        {"$gt": [f"${attempts}", 0]},
+                        {"$divide": [f"${successes}", f"${attempts}"]},
+                        0
+                    ]},
+                    100
+                ]
+            }
+
+        auto_fields = [field for field in team_stats.SCORING_FIELDS if field.startswith("auto_")]
+        teleop_fields = [field for field in team_stats.SCORING_FIELDS if field.startswith("teleop_")]
+
+        pipeline = [
+            {"$match": match_stage},
+            {"$group": {"_id": "$team_number", **team_stats.summary_fields()}},
             {"$match": {"matches_played": {"$gte": MIN_MATCHES}}},
             {"$project": {
                 "team_number": "$_id",
                 "matches_played": 1,
-                "auto_stats": {
-                    "purple_classified": "$auto_purple_classified",
-                    "green_classified": "$auto_green_classified",
-                    "purple_overflow": "$auto_purple_overflow",
-                    "green_overflow": "$auto_green_overflow"
-                },
-                "teleop_stats": {
-                    "purple_classified": "$teleop_purple_classified",
-                    "green_classified": "$teleop_green_classified",
-                    "purple_overflow": "$teleop_purple_overflow",
-                    "green_overflow": "$teleop_green_overflow"
-                },
+                "auto_stats": {field[len("auto_"):]: avg(field) for field in auto_fields},
+                "teleop_stats": {field[len("teleop_"):]: avg(field) for field in teleop_fields},
                 # Calculate totals for each category
-                "total_score": {
-                    "$add": [
-                        "$auto_purple_classified", "$auto_green_classified", 
-                        "$auto_purple_overflow", "$auto_green_overflow",
-                        "$teleop_purple_classified", "$teleop_green_classified", 
-                        "$teleop_purple_overflow", "$teleop_green_overflow"
-                    ]
-                },
-                "total_auto": {
-                    "$add": [
-                        "$auto_purple_classified", "$auto_green_classified", 
-                        "$auto_purple_overflow", "$auto_green_overflow"
-                    ]
-                },
-                "total_teleop": {
-                    "$add": [
-                        "$teleop_purple_classified", "$teleop_green_classified", 
-                        "$teleop_purple_overflow", "$teleop_green_overflow"
-                    ]
-                },
-                "climb_success_rate": {
-                    "$multiply": [
-                        {"$cond": [
-                            {"$gt": ["$climb_attempts", 0]},
-                            {"$divide": ["$climb_successes", "$climb_attempts"]},
-                            0
-                        ]},
-                        100
-                    ]
-                },
-                "park_success_rate": {
-                    "$multiply": [
-                        {"$cond": [
-                            {"$gt": ["$park_attempts", 0]},
-                            {"$divide": ["$park_successes", "$park_attempts"]},
-                            0
-                        ]},
-                        100
-                    ]
-                },
-                "complete_park_success_rate": {
-                    "$multiply": [
-                        {"$cond": [
-                            {"$gt": ["$complete_park_attempts", 0]},
-                            {"$divide": ["$complete_park_successes", "$complete_park_attempts"]},
-                            0
-                        ]},
-                        100
-                    ]
-                },
-                "stacked_park_success_rate": {
-                    "$multiply": [
-                        {"$cond": [
-                            {"$gt": ["$stacked_park_attempts", 0]},
-                            {"$divide": ["$stacked_park_successes", "$stacked_park_attempts"]},
-                            0
-                        ]},
-                        100
-                    ]
-                },
-                "robot_disabled_list": "$robot_disabled_list"
+                "total_score": {"$add": [avg(field) for field in team_stats.SCORING_FIELDS]},
+                "total_auto": {"$add": [avg(field) for field in auto_fields]},
+                "total_teleop": {"$add": [avg(field) for field in teleop_fields]},
+                "climb_success_rate": rate("climb_successes", "matches_played"),
+                "park_success_rate": rate("park_successes", "park_attempts"),
+                "complete_park_success_rate": rate("complete_park_successes", "complete_park_attempts"),
+                "stacked_park_success_rate": rate("stacked_park_successes", "stacked_park_attempts"),
+                "robot_disabled": {
+                    "full": "$robot_disabled_full",
+                    "partially": "$robot_disabled_partially"
+                }
             }}
-        ])
+        ]
 
         # Add sorting based on selected type
         sort_field = {
@@ -647,7 +542,7 @@ def leaderboard():
 
         pipeline.append({"$sort": {sort_field: -1}})
 
-        teams = list(scouting_manager.db.team_data.aggregate(pipeline))
+        teams = list(scouting_manager.db.team_stats.aggregate(pipeline))
         
         return render_template("scouting/leaderboard.html", teams=teams, current_sort=sort_type, 
                               events=events, selected_event=selected_event)
@@ -673,34 +568,26 @@ def scouter_leaderboard():
         events = [evt["_id"] for evt in scouting_manager.db.team_data.aggregate(events_pipeline)]
         
         # Build pipeline to count scouting entries by user
-        pipeline = [
-            # Join with users to get scouter information
-            {
-                "$lookup": {
-                    "from": "users",
-                    "localField": "scouter_id",
-                    "foreignField": "_id",
-                    "as": "scouter"
-                }
-            },
-            {"$unwind": "$scouter"},
-        ]
-        
+        # Skip entries whose scouter account no longer exists
+        match_stage = {"scouter_name": {"$ne": None}}
+
         # Apply event filter if specified
         if selected_event != 'all':
-            pipeline.append({"$match": {"event_code": selected_event}})
+            match_stage["event_code"] = selected_event
             
         # Apply team filter if specified
         if selected_team != 'all' and selected_team.isdigit():
-            pipeline.append({"$match": {"scouter.teamNumber": int(selected_team)}})
+            match_stage["scouter_team"] = int(selected_team)
+
+        pipeline = [{"$match": match_stage}]
             
         # Group by scouter and count
         pipeline.extend([
             {
                 "$group": {
-                    "_id": "$scouter._id",
-                    "username": {"$first": "$scouter.username"},
-                    "teamNumber": {"$first": "$scouter.teamNumber"},
+                    "_id": "$scouter_id",
+                    "username": {"$first": "$scouter_name"},
+                    "teamNumber": {"$first": "$scouter_team"},
                     "match_count": {"$sum": 1},
                     "unique_teams": {"$addToSet": "$team_number"},
                 }
@@ -728,20 +615,13 @@ def scouter_leaderboard():
         
         # Get list of all teams for filtering
         teams_pipeline = [
-            {"$lookup": {
-                "from": "users",
-                "localField": "scouter_id",
-                "foreignField": "_id",
-                "as": "scouter"
-            }},
-            {"$unwind": "$scouter"},
-            {"$match": {"scouter.teamNumber": {"$exists": True, "$ne": None}}},
-            {"$group": {"_id": "$scouter.teamNumber"}},
+            {"$match": {"scouter_team": {"$exists": True, "$ne": None}}},
+            {"$group": {"_id": "$scouter_team"}},
             {"$sort": {"_id": 1}}
         ]
         teams = [team["_id"] for team in scouting_manager.db.team_data.aggregate(teams_pipeline)]
         
-        current_app.logger.info(f"Successfully fetched scouter leaderboard {scouters} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
+        current_app.logger.info(f"Successfully fetched scouter leaderboard of {len(scouters)} scouters for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
         return render_template(
             "scouting/scouter-leaderboard.html", 
             scouters=scouters, 
@@ -783,7 +663,7 @@ def get_ftc_events():
                 'start_date': e['start']
             }
             
-        current_app.logger.info(f"Successfully fetched FTC events {events} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
+        current_app.logger.info(f"Successfully fetched {len(events)} FTC events for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
         return jsonify(events)
     except Exception as e:
         current_app.logger.error(f"Error getting FTC events: {e}")
@@ -800,10 +680,8 @@ def get_ftc_matches(event_code):
         if current_date.month < 9:
             season -= 1
             
-        matches = ftc.get_all_matches(season, event_code) or []
-        
-        # Sort matches by ID to ensure correct order
-        matches.sort(key=lambda x: x.get('id', 0))
+        # Sort matches by ID to ensure correct order (without touching the cached list)
+        matches = sorted(ftc.get_all_matches(season, event_code) or [], key=lambda x: x.get('id', 0))
         
         formatted_matches = {}
         
@@ -869,7 +747,7 @@ def get_ftc_matches(event_code):
                 'set_number': m.get('series', None)
             }
             
-        current_app.logger.info(f"Successfully fetched FTC matches {formatted_matches} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
+        current_app.logger.info(f"Successfully fetched {len(formatted_matches)} FTC matches for {event_code} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
         return jsonify(formatted_matches)
     except Exception as e:
         current_app.logger.error(f"Error getting FTC matches: {e}")
@@ -889,7 +767,7 @@ def live_match_status():
         'team_number': team_number,
         'event_code': event_code
     }
-    current_app.logger.info(f"Successfully fetched live match status {context} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
+    current_app.logger.info(f"Successfully fetched live match status for team {team_number} at {event_code} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
     return render_template("scouting/live-match-status.html", **context)
 
 #TODO
@@ -905,6 +783,8 @@ def get_team_status():
         return jsonify({"error": "Team number is required"}), 400
     
     try:
+        deadline = time.monotonic() + TEAM_STATUS_DEADLINE
+        timed_out = []
         current_date = datetime.now()
         season = current_date.year
         if current_date.month < 9:
@@ -915,14 +795,13 @@ def get_team_status():
              team_events = ftc.get_team_events(team_number, season)
              
              if team_events:
-                 # Fetch details for each event to get start dates
-                 events_with_dates = []
-                 for e in team_events:
-                     code = e.get('eventCode')
-                     if code:
-                         details = ftc.get_event_details(season, code)
-                         if details:
-                             events_with_dates.append(details)
+                 # Fetch details for every event concurrently to get start dates
+                 details, missed = fan_out({
+                     code: (ftc.get_event_details, season, code)
+                     for code in {e.get('eventCode') for e in team_events} if code
+                 }, deadline)
+                 timed_out.extend(missed)
+                 events_with_dates = [event for event in details.values() if event]
                  
                  if events_with_dates:
                      # Sort by start date
@@ -948,11 +827,15 @@ def get_team_status():
              if not event_code:
                  return jsonify({"error": "No events found for this team"}), 404
 
-        # Get all matches for event
-        all_matches = ftc.get_all_matches(season, event_code) or []
-        
-        # Sort matches by ID to ensure correct order
-        all_matches.sort(key=lambda x: x.get('id', 0))
+        # Matches and rankings are independent, fetch them together
+        results, missed = fan_out({
+            "matches": (ftc.get_all_matches, season, event_code),
+            "rankings": (ftc.get_event_rankings, season, event_code),
+        }, deadline)
+        timed_out.extend(missed)
+
+        # Sort matches by ID to ensure correct order (without touching the cached list)
+        all_matches = sorted(results.get("matches") or [], key=lambda x: x.get('id', 0))
         
         # Counters for match numbering
         qual_counter = 1
@@ -1061,7 +944,7 @@ def get_team_status():
                     upcoming_matches.append(match_data)
         
         # Get team ranking
-        rankings = ftc.get_event_rankings(season, event_code) or []
+        rankings = results.get("rankings") or []
         team_rank = None
         for r in rankings:
             if str(r.get('teamNumber')) == str(team_number):
@@ -1095,7 +978,9 @@ def get_team_status():
             "event": {
                 "key": event_code,
                 "name": event_code # Placeholder
-            }
+            },
+            # Some upstream calls missed the deadline, data may be incomplete
+            "partial": bool(timed_out)
         })
     except Exception as e:
         logger.error(f"Error getting team status: {e}")
@@ -1115,20 +1000,10 @@ def get_team_paths():
         
         # Build pipeline to get paths for the team
         pipeline = [
-            {"$match": {"team_number": team_number}},
-            {"$lookup": {
-                "from": "users",
-                "localField": "scouter_id",
-                "foreignField": "_id",
-                "as": "scouter"
-            }},
-            {"$unwind": {"path": "$scouter", "preserveNullAndEmptyArrays": True}},
-            # Add team access filter
+            # Team access filter on the denormalized scouter fields
             {"$match": {
-                "$or": [
-                    {"scouter.teamNumber": current_user.teamNumber} if current_user.teamNumber else {"scouter._id": ObjectId(current_user.get_id())},
-                    {"scouter._id": ObjectId(current_user.get_id())}
-                ]
+                "team_number": team_number,
+                **scouter_access_filter(current_user.teamNumber, current_user.get_id())
             }},
             # Only get matches with auto path data
             {"$match": {"auto_path": {"$exists": True, "$ne": []}}},
@@ -1144,8 +1019,8 @@ def get_team_paths():
                 "alliance": 1,
                 "auto_path": 1,
                 "auto_notes": 1,
-                "scouter_name": "$scouter.username",
-                "scouter_id": {"$toString": "$scouter._id"}
+                "scouter_name": 1,
+                "scouter_id": {"$toString": "$scouter_id"}
             }}
         ]
         
@@ -1167,7 +1042,7 @@ def get_team_paths():
             "paths": paths
         }
         
-        current_app.logger.info(f"Successfully fetched team paths {response} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
+        current_app.logger.info(f"Successfully fetched {len(paths)} team paths for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
         return json_util.dumps(response), 200, {'Content-Type': 'application/json'}
         
     except Exception as e:
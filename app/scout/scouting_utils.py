@@ -6,83 +6,158 @@ import logging
 from datetime import datetime, timezone
 
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 from app.models import TeamData
+from app.scout import team_stats
 from app.utils import DatabaseManager, with_mongodb_retry
 
 logger = logging.getLogger(__name__)
 
 
+def scouter_access_filter(user_team_number, user_id):
+    """Build the team-access filter on the denormalized scouter fields of team_data.
+
+    Users see everything scouted by their team plus their own entries; users
+    without a team only see their own entries.
+    """
+    if user_team_number:
+        return {
+            "$or": [
+                {"scouter_team": user_team_number},
+                {"scouter_id": ObjectId(user_id)}
+            ]
+        }
+    return {"scouter_id": ObjectId(user_id)}
+
+
+def _match_key(entry):
+    return entry.get("event_code"), entry.get("match_number"), entry.get("team_number")
+
+
+def _duplicate_entries(db, entries_filter, team_number):
+    """Find entries that would scout a robot the team already scouted in that match
+
+    Moving them into the team would break unique_team_match_scouting. The
+    team's existing entry wins; among the moving entries the newest does.
+
+    Returns:
+        list: Ids of the entries that cannot join the team
+    """
+    moving = list(db.team_data.find(
+        entries_filter,
+        {"event_code": 1, "match_number": 1, "team_number": 1},
+    ).sort([("created_at", -1), ("_id", -1)]))
+    if not moving:
+        return []
+
+    taken = {
+        _match_key(entry)
+        for entry in db.team_data.find(
+            {
+                "scouter_team": team_number,
+                "event_code": {"$in": list({entry.get("event_code") for entry in moving})},
+                "_id": {"$nin": [entry["_id"] for entry in moving]},
+            },
+            {"event_code": 1, "match_number": 1, "team_number": 1},
+        )
+    }
+    duplicates = []
+    for entry in moving:
+        key = _match_key(entry)
+        if key in taken:
+            duplicates.append(entry["_id"])
+        else:
+            taken.add(key)
+    return duplicates
+
+
+def sync_scouter_fields(db, user_ids, **fields):
+    """Propagate a scouter's team number and/or username onto their team_data entries
+
+    Entries that would duplicate a match the new team already scouted are
+    kept as the scouter's own entries (scouter_team None) instead.
+
+    Args:
+        db: Database handle
+        user_ids: A single user ID or a list of user IDs
+        **fields: ``scouter_team`` and/or ``scouter_name`` values to stamp
+
+    Raises:
+        DuplicateKeyError: A conflicting entry was written concurrently; the
+            sync is idempotent and can be run again
+    """
+    if not fields:
+        return 0
+    if not isinstance(user_ids, (list, tuple, set)):
+        user_ids = [user_ids]
+    entries_filter = {"scouter_id": {"$in": [ObjectId(uid) for uid in user_ids]}}
+    user_scopes = {team_stats.stats_scope(None, uid) for uid in user_ids}
+
+    # Entries moving between teams move between stats scopes as well
+    affected_scopes = set()
+    duplicates = []
+    if "scouter_team" in fields:
+        for team in db.team_data.distinct("scouter_team", entries_filter):
+            affected_scopes.update([team] if team else user_scopes)
+        affected_scopes.update([fields["scouter_team"]] if fields["scouter_team"] else user_scopes)
+        if fields["scouter_team"]:
+            duplicates = _duplicate_entries(db, entries_filter, fields["scouter_team"])
+
+    try:
+        modified = 0
+        if duplicates:
+            logger.warning(
+                f"{len(duplicates)} team_data entries of {user_ids} duplicate team "
+                f"{fields['scouter_team']}'s scouting, kept as the scouters' own"
+            )
+            affected_scopes.update(user_scopes)
+            modified += db.team_data.update_many(
+                {"_id": {"$in": duplicates}}, {"$set": {**fields, "scouter_team": None}}
+            ).modified_count
+            entries_filter = {**entries_filter, "_id": {"$nin": duplicates}}
+        modified += db.team_data.update_many(entries_filter, {"$set": fields}).modified_count
+    except DuplicateKeyError as e:
+        logger.error(f"Conflicting team_data entries while syncing {fields} for {user_ids}: {str(e)}")
+        raise
+
+    if modified and affected_scopes:
+        team_stats.rebuild_team_stats(db, affected_scopes)
+    return modified
+
+
 class ScoutingManager(DatabaseManager):
     def __init__(self, mongo_uri=None):
         # Use the singleton connection
         super().__init__(mongo_uri)
-        self._ensure_collections()
-
-    def _ensure_collections(self):
-        """Ensure required collections exist"""
-        collections = self.db.list_collection_names()
-        if "team_data" not in collections:
-            self._create_team_data_collection()
-        if "pit_scouting" not in collections:
-            self.db.create_collection("pit_scouting")
-            self.db.pit_scouting.create_index([("team_number", 1)])
-            self.db.pit_scouting.create_index([("scouter_id", 1)])
-            logger.info("Created pit_scouting collection and indexes")
-        
-
-    def _create_team_data_collection(self):
-        self.db.create_collection("team_data")
-        self.db.team_data.create_index([("team_number", 1)])
-        self.db.team_data.create_index([("scouter_id", 1)])
-        logger.info("Created team_data collection and indexes")
+
+    def _scouter_fields(self, scouter_id):
+        """Get the denormalized scouter fields to stamp onto a team_data entry"""
+        scouter = self.db.users.find_one(
+            {"_id": ObjectId(scouter_id)},
+            {"username": 1, "teamNumber": 1}
+        ) or {}
+        return {
+            "scouter_team": scouter.get("teamNumber"),
+            "scouter_name": scouter.get("username"),
+        }
 
     @with_mongodb_retry(retries=3, delay=2)
-    def add_scouting_data(self, data, scouter_id):
-        """Add new scouting data with retry mechanism"""
-        # Ensure we have a valid connection
-        
-        
+    def add_scouting_data(self, data, scouter_id, scouter=None):
+        """Add new scouting data with retry mechanism
+
+        Duplicate entries (same team, event, match and robot) are rejected by the
+        unique_team_match_scouting index. The insert is retried with the same
+        ``_id``, so a retry after a lost acknowledgement finds the entry it
+        saved instead of reporting it as a duplicate. Pass the already-loaded
+        ``scouter`` user to skip looking them up again.
+        """
         try:
             # Validate team number
             team_number = int(data["team_number"])
             if team_number <= 0:
                 return False, "Invalid team number"
 
-            # Lookup to check if this team is already scouted in this match by someone from the same team
-            pipeline = [
-                {
-                    "$match": {
-                        "event_code": data["event_code"],
-                        "match_number": data["match_number"],
-                        "team_number": team_number
-                    }
-                },
-                {
-                    "$lookup": {
-                        "from": "users",
-                        "localField": "scouter_id",
-                        "foreignField": "_id",
-                        "as": "scouter"
-                    }
-                },
-                {"$unwind": "$scouter"},
-                {
-                    "$lookup": {
-                        "from": "users",
-                        "localField": "scouter.teamNumber",
-                        "foreignField": "teamNumber",
-                        "as": "team_scouters"
-                    }
-                }
-            ]
-
-            if existing_entries := list(self.db.team_data.aggregate(pipeline)):
-                current_user = self.db.users.find_one({"_id": ObjectId(scouter_id)})
-                for entry in existing_entries:
-                    if entry.get("scouter", {}).get("teamNumber") == current_user.get("teamNumber"):
-                        return False, f"Team {team_number} has already been scouted by your team in match {data['match_number']}"
-
             # Get existing match data to validate alliance sizes and calculate scores
             # match_data = list(self.db.team_data.find({
             #     "event_code": data["event_code"],
@@ -99,6 +174,8 @@ class ScoutingManager(DatabaseManager):
 
             # Process form data
             team_data = {
+                # Fixed up front so every retried insert writes the same entry
+                "_id": ObjectId(),
                 "team_number": team_number,
                 "event_code": data["event_code"],
                 "match_number": data["match_number"],
@@ -139,52 +216,38 @@ class ScoutingManager(DatabaseManager):
 
                 # Metadata
                 "scouter_id": ObjectId(scouter_id),
+                **(
+                    {"scouter_team": scouter.teamNumber, "scouter_name": scouter.username}
+                    if scouter is not None else self._scouter_fields(scouter_id)
+                ),
                 "created_at": datetime.now(timezone.utc),
             }
 
-            result = self.db.team_data.insert_one(team_data)
-            return True, str(result.inserted_id)
+            try:
+                self._insert_team_data(team_data)
+            except DuplicateKeyError:
+                # Only an earlier attempt of this very insert counts as saved
+                if not self.db.team_data.find_one({"_id": team_data["_id"]}, {"_id": 1}):
+                    return False, f"Team {team_number} has already been scouted by your team in match {data['match_number']}"
+            team_stats.record_entry(self.db, team_data)
+            return True, str(team_data["_id"])
 
         except Exception as e:
             logger.error(f"Error adding team data: {str(e)}")
             return False, "An internal error has occurred."
 
+    @with_mongodb_retry(retries=3, delay=2)
+    def _insert_team_data(self, team_data):
+        self.db.team_data.insert_one(team_data)
+
     @with_mongodb_retry(retries=3, delay=2)
     def get_all_scouting_data(self, user_team_number=None, user_id=None):
         """Get all scouting data with user information, filtered by team access"""
         try:
-            # Base pipeline for user lookup
             pipeline = [
-                {
-                    "$lookup": {
-                        "from": "users",
-                        "localField": "scouter_id",
-                        "foreignField": "_id",
-                        "as": "scouter"
-                    }
-                },
-                {"$unwind": "$scouter"},
+                {"$match": scouter_access_filter(user_team_number, user_id)},
             ]
 
-            # Add match stage for filtering based on team number or user ID
-            if user_team_number:
-                # If user has a team number, show data from their team and their own data
-                pipeline.append({
-                    "$match": {
-                        "$or": [
-                            {"scouter.teamNumber": user_team_number},
-                            {"scouter._id": ObjectId(user_id)}
-                        ]
-                    }
-                })
-            else:
-                # If user has no team, only show their own data
-                pipeline.append({
-                    "$match": {
-                        "scouter._id": ObjectId(user_id)
-                    }
-                })
-
             # Project the needed fields
             pipeline.append({
                 "$project": {
@@ -209,8 +272,8 @@ class ScoutingManager(DatabaseManager):
                     "notes": 1,
                     "alliance": 1,
                     "scouter_id": 1,
-                    "scouter_name": "$scouter.username",
-                    "scouter_team": "$scouter.teamNumber",
+                    "scouter_name": 1,
+                    "scouter_team": 1,
                     "device_type": 1
                 }
             })
@@ -230,12 +293,8 @@ class ScoutingManager(DatabaseManager):
             if not data:
                 return None
 
-            if scouter := self.db.users.find_one(
-                {"_id": ObjectId(data["scouter_id"])}
-            ):
-                data["scouter_team"] = scouter.get("teamNumber")
-            else:
-                data["scouter_team"] = None
+            if "scouter_team" not in data:
+                data.update(self._scouter_fields(data["scouter_id"]))
 
             # Then check ownership if scouter_id is provided
             if scouter_id:
@@ -261,38 +320,6 @@ class ScoutingManager(DatabaseManager):
                 logger.warning(f"Data not found for team_id: {team_id}")
                 return False
 
-            # Check if the team is already scouted by someone else from the same team
-            pipeline = [
-                {
-                    "$match": {
-                        "event_code": data["event_code"],
-                        "match_number": data["match_number"],
-                        "team_number": int(data["team_number"]),
-                        "_id": {"$ne": ObjectId(team_id)}  # Exclude current entry
-                    }
-                },
-                {
-                    "$lookup": {
-                        "from": "users",
-                        "localField": "scouter_id",
-                        "foreignField": "_id",
-                        "as": "scouter"
-                    }
-                },
-                {"$unwind": "$scouter"}
-            ]
-            
-            existing_entries = list(self.db.team_data.aggregate(pipeline))
-            current_user = self.db.users.find_one({"_id": ObjectId(scouter_id)})
-            
-            for entry in existing_entries:
-                if entry.get("scouter", {}).get("teamNumber") == current_user.get("teamNumber"):
-                    logger.warning(
-                        f"Update attempted for team {data['team_number']} in match {data['match_number']} "
-                        f"which is already scouted by team {current_user.get('teamNumber')}"
-                    )
-                    return False
-
             # Get match data to validate alliance sizes
             match_data = list(self.db.team_data.find({
                 "event_code": data["event_code"],
@@ -346,17 +373,38 @@ class ScoutingManager(DatabaseManager):
                 
                 # Notes
                 "notes": data.get("notes", ""),
+
+                # Refresh the owner's denormalized scouter fields
+                **self._scouter_fields(existing_data["scouter_id"]),
             }
 
-            result = self.db.team_data.update_one(
-                {"_id": ObjectId(team_id)},
-                {"$set": updated_data},
-            )
-            return result.modified_count > 0
+            try:
+                result = self.db.team_data.update_one(
+                    {"_id": ObjectId(team_id)},
+                    {"$set": updated_data},
+                )
+            except DuplicateKeyError:
+                logger.warning(
+                    f"Update attempted for team {data['team_number']} in match {data['match_number']} "
+                    f"which is already scouted by team {updated_data.get('scouter_team')}"
+                )
+                return False
+            if result.modified_count > 0:
+                team_stats.update_entry(self.db, existing_data, {**existing_data, **updated_data})
+                return True
+            return False
         except Exception as e:
             logger.error(f"Error updating team data: {str(e)}")
             return False
 
+    def _delete_entry(self, team_data):
+        """Delete a team_data entry and take it out of the team stats"""
+        result = self.db.team_data.delete_one({"_id": team_data["_id"]})
+        if result.deleted_count > 0:
+            team_stats.remove_entry(self.db, team_data)
+            return True
+        return False
+
     @with_mongodb_retry(retries=3, delay=2)
     def delete_team_data(self, team_id, user_id, admin_override=False):
         """Delete team data if scouter has permission (original scouter or team admin)"""
@@ -373,15 +421,13 @@ class ScoutingManager(DatabaseManager):
             # If admin_override is True, skip additional permission checks
             if admin_override:
                 logger.info(f"Admin override: Deleting team data {team_id} by user {user_id}")
-                result = self.db.team_data.delete_one({"_id": ObjectId(team_id)})
-                return result.deleted_count > 0
+                return self._delete_entry(team_data)
 
             # Check if user is a team admin
             is_team_admin = False
 
             # Get the scouter's team number
-            scouter = self.db.users.find_one({"_id": ObjectId(team_data["scouter_id"])})
-            scouter_team_number = scouter.get("teamNumber") if scouter else None
+            scouter_team_number = team_data.get("scouter_team")
 
             # Get the current user's team number
             current_user = self.db.users.find_one({"_id": ObjectId(user_id)})
@@ -399,8 +445,7 @@ class ScoutingManager(DatabaseManager):
             # Allow deletion if user is original scouter or a team admin
             if is_original_scouter or is_team_admin:
                 logger.info(f"Deleting team data {team_id} by user {user_id} (original: {is_original_scouter}, admin: {is_team_admin})")
-                result = self.db.team_data.delete_one({"_id": ObjectId(team_id)})
-                return result.deleted_count > 0
+                return self._delete_entry(team_data)
 
             logger.warning(f"Permission denied: User {user_id} attempted to delete team data {team_id}")
             return False
@@ -423,17 +468,11 @@ class ScoutingManager(DatabaseManager):
         """Get all match data for a specific team"""
         try:
             pipeline = [
-                {"$match": {"team_number": int(team_number)}},
-                {"$sort": {"event_code": 1, "match_number": 1}},
-                {
-                    "$lookup": {
-                        "from": "users",
-                        "localField": "scouter_id",
-                        "foreignField": "_id",
-                        "as": "scouter"
-                    }
-                },
-                {"$unwind": "$scouter"}
+                {"$match": {
+                    "team_number": int(team_number),
+                    "scouter_name": {"$ne": None}
+                }},
+                {"$sort": {"event_code": 1, "match_number": 1}}
             ]
 
             return list(self.db.team_data.aggregate(pipeline))
@@ -0,0 +1,253 @@
+"""Materialized per-team scouting statistics.
+
+``team_stats`` holds one row per (scope, event_code, team_number) with running
+sums, counts and climb/park tallies of the team_data entries in that scope.
+The scope is the scouting team number, or ``user:<id>`` for scouters without
+a team, matching the team-access rules of the read paths. Rows are kept up to
+date with ``$inc`` on every team_data write, so the leaderboard and compare
+endpoints read O(teams) rows instead of aggregating every entry.
+
+If the rows ever drift, ``rebuild_team_stats`` recomputes them from team_data
+(``python -m app.migrations --rebuild-stats``).
+"""
+
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from pymongo import ReplaceOne
+
+logger = logging.getLogger(__name__)
+
+SCORING_FIELDS = (
+    "auto_purple_classified",
+    "auto_green_classified",
+    "auto_purple_overflow",
+    "auto_green_overflow",
+    "teleop_purple_classified",
+    "teleop_green_classified",
+    "teleop_purple_overflow",
+    "teleop_green_overflow",
+)
+
+# climb_type value -> counter prefix
+CLIMB_TYPES = {
+    "park": "park",
+    "complete park": "complete_park",
+    "stacked park": "stacked_park",
+}
+
+ROBOT_DISABLED_VALUES = ("None", "Partially", "Full")
+
+KEY_FIELDS = ("scope", "event_code", "team_number")
+
+
+def stats_scope(scouter_team, scouter_id):
+    """Get the stats scope an entry (or a viewer) belongs to"""
+    if scouter_team:
+        return scouter_team
+    return f"user:{scouter_id}"
+
+
+def viewer_scopes(user_team_number, user_id):
+    """Get the stats scopes a viewer may read: their team's plus their own
+
+    Mirrors scouter_access_filter: a scouter's entries that could not join
+    their team (see dedupe_team_match_scouting) stay in their user scope.
+    """
+    own = stats_scope(None, user_id)
+    return [user_team_number, own] if user_team_number else [own]
+
+
+def _number(value):
+    return value if isinstance(value, (int, float)) and not isinstance(value, bool) else 0
+
+
+def _entry_key(entry):
+    return {
+        "scope": stats_scope(entry.get("scouter_team"), entry.get("scouter_id")),
+        "event_code": entry.get("event_code"),
+        "team_number": entry.get("team_number"),
+    }
+
+
+def _entry_counters(entry):
+    """Counter contributions of a single team_data entry"""
+    counters = {"count": 1}
+    for field in SCORING_FIELDS:
+        value = _number(entry.get(field))
+        counters[f"sum_{field}"] = value
+        counters[f"nonzero_{field}"] = 1 if value > 0 else 0
+
+    climb_success = entry.get("climb_success") is True
+    counters["climb_successes"] = int(climb_success)
+    for climb_type, prefix in CLIMB_TYPES.items():
+        attempted = entry.get("climb_type") == climb_type
+        counters[f"{prefix}_attempts"] = int(attempted)
+        counters[f"{prefix}_successes"] = int(attempted and climb_success)
+
+    robot_disabled = entry.get("robot_disabled") or "None"
+    for value in ROBOT_DISABLED_VALUES:
+        counters[f"robot_disabled_{value.lower()}"] = int(robot_disabled == value)
+    return counters
+
+
+def _latest_fields(entry):
+    """Non-counter fields taken from the most recently written entry"""
+    fields = {"last_climb_type": entry.get("climb_type", "")}
+    if entry.get("event_name"):
+        fields["event_name"] = entry["event_name"]
+    return fields
+
+
+def _apply(db, key, counters, sign, latest=None):
+    increments = {field: sign * value for field, value in counters.items() if value}
+    update = {"$inc": increments, "$set": {"updated_at": datetime.now(timezone.utc), **(latest or {})}}
+    db.team_stats.update_one(key, update, upsert=sign > 0)
+    if sign < 0:
+        db.team_stats.delete_one({**key, "count": {"$lte": 0}})
+
+
+def record_entry(db, entry):
+    """Add a newly inserted team_data entry to its stats row"""
+    try:
+        _apply(db, _entry_key(entry), _entry_counters(entry), 1, _latest_fields(entry))
+    except Exception as e:
+        logger.error(f"Error recording team stats for {entry.get('_id')}: {str(e)}")
+
+
+def remove_entry(db, entry):
+    """Remove a deleted team_data entry from its stats row"""
+    try:
+        _apply(db, _entry_key(entry), _entry_counters(entry), -1)
+    except Exception as e:
+        logger.error(f"Error removing team stats for {entry.get('_id')}: {str(e)}")
+
+
+def update_entry(db, old_entry, new_entry):
+    """Apply the delta between the old and new version of an edited entry"""
+    try:
+        old_key, new_key = _entry_key(old_entry), _entry_key(new_entry)
+        old_counters, new_counters = _entry_counters(old_entry), _entry_counters(new_entry)
+
+        if old_key != new_key:
+            _apply(db, old_key, old_counters, -1)
+            _apply(db, new_key, new_counters, 1, _latest_fields(new_entry))
+            return
+
+        delta = {field: new_counters[field] - old_counters[field] for field in new_counters}
+        _apply(db, new_key, delta, 1, _latest_fields(new_entry))
+    except Exception as e:
+        logger.error(f"Error updating team stats for {new_entry.get('_id')}: {str(e)}")
+
+
+def _rebuild_pipeline(match=None):
+    """Aggregation recomputing stats rows from team_data"""
+    group = {
+        "_id": {
+            "scope": {"$ifNull": [
+                "$scouter_team",
+                {"$concat": ["user:", {"$toString": "$scouter_id"}]}
+            ]},
+            "event_code": "$event_code",
+            "team_number": "$team_number",
+        },
+        "count": {"$sum": 1},
+        "climb_successes": {"$sum": {"$cond": [{"$eq": ["$climb_success", True]}, 1, 0]}},
+        "last_climb_type": {"$last": "$climb_type"},
+        "event_name": {"$last": "$event_name"},
+    }
+    for field in SCORING_FIELDS:
+        group[f"sum_{field}"] = {"$sum": {"$ifNull": [f"${field}", 0]}}
+        group[f"nonzero_{field}"] = {"$sum": {"$cond": [
+            {"$and": [
+                {"$isNumber": f"${field}"},
+                {"$gt": [f"${field}", 0]}
+            ]}, 1, 0
+        ]}}
+    for climb_type, prefix in CLIMB_TYPES.items():
+        group[f"{prefix}_attempts"] = {"$sum": {"$cond": [{"$eq": ["$climb_type", climb_type]}, 1, 0]}}
+        group[f"{prefix}_successes"] = {"$sum": {"$cond": [
+            {"$and": [{"$eq": ["$climb_type", climb_type]}, {"$eq": ["$climb_success", True]}]}, 1, 0
+        ]}}
+    for value in ROBOT_DISABLED_VALUES:
+        group[f"robot_disabled_{value.lower()}"] = {"$sum": {"$cond": [
+            {"$eq": [{"$ifNull": ["$robot_disabled", "None"]}, value]}, 1, 0
+        ]}}
+
+    project = {"_id": 0}
+    project.update({field: f"$_id.{field}" for field in KEY_FIELDS})
+    project.update({field: 1 for field in group if field != "_id"})
+
+    pipeline = [{"$match": match}] if match else []
+    pipeline.extend([
+        {"$sort": {"created_at": 1}},
+        {"$group": group},
+        {"$project": project},
+    ])
+    return pipeline
+
+
+def rebuild_team_stats(db, scopes=None):
+    """Recompute stats rows from team_data
+
+    Args:
+        db: Database handle
+        scopes: Only rebuild these scopes (all scopes if None)
+
+    Returns:
+        int: Number of stats rows written
+    """
+    rebuild_started = datetime.now(timezone.utc)
+    if scopes is None:
+        stats_filter, match = {}, None
+    else:
+        scopes = list(scopes)
+        team_scopes = [scope for scope in scopes if not str(scope).startswith("user:")]
+        user_ids = [ObjectId(str(scope)[5:]) for scope in scopes if str(scope).startswith("user:")]
+        stats_filter = {"scope": {"$in": scopes}}
+        match = {"$or": [
+            {"scouter_team": {"$in": team_scopes}},
+            {"scouter_id": {"$in": user_ids}, "scouter_team": None},
+        ]}
+
+    rows = list(db.team_data.aggregate(_rebuild_pipeline(match)))
+
+    # Replace rows in place (instead of delete + insert) so concurrent $inc
+    # upserts never collide with the unique key, then drop rows that are gone
+    if rows:
+        db.team_stats.bulk_write([
+            ReplaceOne(
+                {field: row[field] for field in KEY_FIELDS},
+                {**row, "updated_at": rebuild_started},
+                upsert=True
+            )
+            for row in rows
+        ], ordered=False)
+    db.team_stats.delete_many({
+        **stats_filter,
+        "updated_at": {"$lt": rebuild_started},
+    })
+
+    logger.info(f"Rebuilt {len(rows)} team stats rows" + (f" for scopes {scopes}" if scopes else ""))
+    return len(rows)
+
+
+def summary_fields():
+    """$group accumulators summing stats rows across events"""
+    fields = {
+        "matches_played": {"$sum": "$count"},
+        "climb_successes": {"$sum": "$climb_successes"},
+        "last_climb_type": {"$last": "$last_climb_type"},
+    }
+    for field in SCORING_FIELDS:
+        fields[f"sum_{field}"] = {"$sum": f"$sum_{field}"}
+        fields[f"nonzero_{field}"] = {"$sum": f"$nonzero_{field}"}
+    for prefix in CLIMB_TYPES.values():
+        fields[f"{prefix}_attempts"] = {"$sum": f"${prefix}_attempts"}
+        fields[f"{prefix}_successes"] = {"$sum": f"${prefix}_successes"}
+    for value in ROBOT_DISABLED_VALUES:
+        fields[f"robot_disabled_{value.lower()}"] = {"$sum": f"$robot_disabled_{value.lower()}"}
+    return fields
@@ -1,5 +1,7 @@
 // Constants
 const API_ENDPOINT = '/api/compare';
+const MATCHES_ENDPOINT = '/api/compare/matches';
+const MATCHES_PER_PAGE = 100;
 const MIN_TEAMS = 2;
 const MAX_TEAMS = 3;
 
@@ -57,12 +59,31 @@ async function handleCompare() {
 
 function updateDisplay(data) {
     updateTeamCards(data);
+    // Match rows are only loaded once the summary is on screen
+    loadTeamMatches(data);
+}
+
+async function loadTeamMatches(data) {
+    await Promise.all(Object.entries(data).map(async ([teamNumber, teamData]) => {
+        teamData.matches = [];
+        try {
+            // Follow the pages until the team's last match
+            for (let page = 1, hasMore = true; hasMore; page++) {
+                const response = await fetch(`${MATCHES_ENDPOINT}?team=${teamNumber}&page=${page}&per_page=${MATCHES_PER_PAGE}`);
+                const data = await response.json();
+                if (data.error) {
+                    throw new Error(data.error);
+                }
+                teamData.matches.push(...(data.matches || []));
+                hasMore = Boolean(data.has_more);
+            }
+        } catch (error) {
+            console.error(`Error loading matches for team ${teamNumber}:`, error);
+        }
+    }));
+
     updateRawDataTable(data);
-    
-    // Add a slight delay to ensure DOM is ready
-    setTimeout(() => {
-        updateAutoPaths(data);
-    }, 100);
+    updateAutoPaths(data);
 }
 
 function updateTeamCards(data) {
@@ -105,10 +126,9 @@ function updateTeamCards(data) {
         document.getElementById(`team${cardNum}-preferred-climb`).textContent = stats.preferred_climb_type || '-';
 
         // Update Robot Disabled stats
-        const robotDisabled = teamData.stats?.robot_disabled || [];
-        const robotDisabledList = Array.isArray(robotDisabled) ? robotDisabled : [robotDisabled];
-        const fullDisabled = robotDisabledList.filter(d => d === 'Full').length;
-        const partiallyDisabled = robotDisabledList.filter(d => d === 'Partially').length;
+        const robotDisabled = teamData.stats?.robot_disabled_counts || {};
+        const fullDisabled = robotDisabled.Full || 0;
+        const partiallyDisabled = robotDisabled.Partially || 0;
         const totalDisabled = fullDisabled + partiallyDisabled;
         
         let disabledText = totalDisabled > 0 
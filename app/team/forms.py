@@ -42,7 +42,7 @@ class CreateTeamForm(FlaskForm):
     logo = FileField(
         "Team Logo",
         validators=[
-            FileAllowed(["jpg", "png"], "Only JPG and PNG images are allowed!"),
+            FileAllowed(["jpg", "jpeg", "png", "gif", "webp"], "Only PNG, JPG, GIF and WebP images are allowed!"),
             FileSize(
                 max_size=2 * 1024 * 1024, message="File size must be less than 2MB"
             ),
@@ -1,19 +1,20 @@
 from __future__ import annotations
 
-from io import BytesIO
+import asyncio
 from datetime import datetime
 
-from bson import ObjectId
 from flask import (Blueprint, current_app, flash, jsonify, redirect,
                    render_template, request, send_file, url_for)
 from flask_login import current_user, login_required
-from PIL import Image
 from werkzeug.utils import secure_filename
 
+from app.media.image_pipeline import store_image
+from app.log_pipeline import log_fields
+from app.media.media_utils import delete_gridfs_file, serve_gridfs_file
 from app.team.team_utils import TeamManager
 from app.utils import (allowed_file, async_route, error_response,
                        handle_route_errors, limiter, save_file_to_gridfs,
-                       success_response, get_gridfs)
+                       success_response)
 
 from .forms import CreateTeamForm
 
@@ -43,7 +44,6 @@ async def join():
 
         if request.method == "POST":
             join_code = request.form.get("join_code")
-            current_app.logger.info(f"Team.join Form Details {request.form}")
 
             if not join_code:
                 flash("Join code is required", "error")
@@ -87,25 +87,17 @@ async def create():
             # Handle logo upload if provided
             logo_id = None
             if form.logo.data:
-                # Open and resize image
-                image = Image.open(form.logo.data)
-                image = image.convert('RGBA')  # Convert to RGBA mode
-                image.thumbnail((200, 200))  # Resize maintaining aspect ratio
-                
-                # Save to BytesIO
-                buffer = BytesIO()
-                image.save(buffer, format='PNG')
-                buffer.seek(0)
-                
+                # Resized variants are made in the background
                 filename = secure_filename(
-                    f"team_{form.team_number.data}_logo.png"
+                    f"team_{form.team_number.data}_logo_{form.logo.data.filename}"
                 )
                 current_app.logger.debug(f"Uploading file: {filename}")
-                logo_id = get_gridfs().put(
-                    buffer.getvalue(),
-                    filename=filename,
-                    content_type='image/png'
-                )
+                try:
+                    logo_id = store_image(form.logo.data.read(), filename)
+                except ValueError as e:
+                    current_app.logger.warning(f"Rejected team logo upload: {str(e)}")
+                    flash("The logo must be a valid PNG, JPG, GIF or WebP image", "error")
+                    return render_template("team/create.html", form=form)
 
             # Create the team
             success, result = await team_manager.create_team(
@@ -122,7 +114,7 @@ async def create():
                 return redirect(url_for("team.manage"))
             else:
                 if logo_id:  # Clean up uploaded file if team creation failed
-                    get_gridfs().delete(logo_id)
+                    delete_gridfs_file(logo_id)
                 flash(f"Error creating team: {result}", "error")
 
         except Exception as e:
@@ -302,19 +294,20 @@ async def manage(team_number=None):
     if not current_user.teamNumber:
         return redirect(url_for("team.join"))
 
-    success, result = await team_manager.validate_user_team(
-        current_user.get_id(), current_user.teamNumber
-    )
+    success, result = await team_manager.validate_user_team(current_user.get_id(), current_user.teamNumber)
     current_app.logger.info(f"Tried to validate user team ({success}) {current_user.teamNumber} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
     if not success:
         current_user.teamNumber = None
         flash(result, "warning")
         return redirect(url_for("team.join"))
 
+    # Only a validated member gets the team's data, loaded concurrently
+    team_members, assignments = await asyncio.gather(
+        team_manager.get_team_members(current_user.teamNumber),
+        team_manager.get_team_assignments(current_user.teamNumber),
+    )
+
     team = result  # result is the team object if validation succeeded
-    # Get team members and assignments
-    team_members = await team_manager.get_team_members(team.team_number)
-    assignments = await team_manager.get_team_assignments(team.team_number)
 
     # Create a dictionary of user IDs to usernames for easier lookup
     user_dict = {str(member.get_id()): member for member in team_members}
@@ -421,15 +414,11 @@ async def delete_team(team_number):
 @team_bp.route("/team/<int:team_number>/logo")
 def team_logo(team_number):
     try:
-        team = team_manager.db.teams.find_one({"team_number": team_number})
+        team = team_manager.db.teams.find_one({"team_number": team_number}, {"logo_id": 1})
         
         if team and team.get("logo_id"):
-            logo_id = ObjectId(team["logo_id"]) if isinstance(team["logo_id"], str) else team["logo_id"]
-            logo = get_gridfs().get(logo_id)
-            return send_file(
-                BytesIO(logo.read()),
-                mimetype=logo.content_type,
-                download_name=logo.filename
+            return serve_gridfs_file(
+                team["logo_id"], "static/images/default_logo.png", size=request.args.get("size")
             )
     except Exception as e:
         current_app.logger.error(f"Error fetching team logo: {str(e)}", exc_info=True)
@@ -512,7 +501,7 @@ async def update_team_logo(team_number):
     success, message = await team_manager.update_team_logo(team_number, new_logo_id)
     current_app.logger.info(f"Tried to update team logo ({success}) {team_number} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
     if not success:
-        get_gridfs().delete(new_logo_id)
+        delete_gridfs_file(new_logo_id)
         
     return success_response(message) if success else error_response("An internal error has occurred.", log_message="Error updating team logo")
 
@@ -554,28 +543,29 @@ async def update_team_info(team_number):
             file = request.files['team_logo']
             if file and file.filename:
                 if allowed_file(file.filename):
-                    # Save new logo to GridFS
-                    
+                    # Save new logo to GridFS first, so a rejected upload keeps the old one
+                    filename = secure_filename(f"team_{team_number}_logo_{file.filename}")
+                    try:
+                        file_id = store_image(file.stream.read(), filename)
+                    except ValueError as e:
+                        current_app.logger.warning(f"Rejected team logo upload: {str(e)}")
+                        flash("The logo must be a valid PNG, JPG, GIF or WebP image", "error")
+                        return redirect(url_for("team.manage", team_number=team_number))
+
                     # Clean up old logo and its chunks if it exists
                     if team.logo_id:
                         try:
                             # Delete old file and its chunks
-                            get_gridfs().delete(team.logo_id)
+                            delete_gridfs_file(team.logo_id)
                             # Also clean up any orphaned chunks
                             team_manager.db.fs.chunks.delete_many({"files_id": team.logo_id})
                         except Exception as e:
                             flash("An internal error has occurred.")
                     
-                    filename = secure_filename(f"team_{team_number}_logo_{file.filename}")
-                    file_id = get_gridfs().put(
-                        file.stream.read(),
-                        filename=filename,
-                        content_type=file.content_type
-                    )
                     updates['logo_id'] = file_id
                     current_app.logger.info(f"Tried to update team logo ({team_number}) for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
                 else:
-                    flash("Invalid file type. Please use PNG, JPG, or JPEG", "error")
+                    flash("Invalid file type. Please use PNG, JPG, GIF or WebP", "error")
                     return redirect(url_for("team.manage", team_number=team_number))
         
 
@@ -586,7 +576,10 @@ async def update_team_info(team_number):
         # Update team information
         success, message = await team_manager.update_team_info(team_number, updates)
         current_app.logger.info(f"Tried to update team info ({success}) {team_number} for user {current_user.username if current_user.is_authenticated else 'Anonymous'}")
-        current_app.logger.info(f"Team.update_team_info Form Details {request.form}")
+        current_app.logger.info(
+            "Team.update_team_info form",
+            extra=log_fields(team_number=team_number, fields=sorted(updates), request_bytes=request.content_length),
+        )
         flash(message, "success" if success else "error")
         return redirect(url_for("team.manage", team_number=team_number))
         
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import logging
 import secrets
 import string
@@ -11,7 +12,12 @@ import gridfs
 from bson.objectid import ObjectId
 from PIL import Image, ImageDraw, ImageFont
 
+from app import async_runtime
+from app.auth.user_cache import invalidate_user
+from app.media.image_pipeline import store_image
+from app.media.media_utils import delete_gridfs_file
 from app.models import Assignment, Team, User
+from app.scout.scouting_utils import sync_scouter_fields
 from app.utils import DatabaseManager, with_mongodb_retry, get_database_connection, get_gridfs
 from flask import current_app
 
@@ -24,19 +30,20 @@ UserResult = Tuple[bool, Union[str, User]]
 AssignmentResult = Tuple[bool, str]
 DatabaseID = Union[str, ObjectId]
 
+def _reschedule_reminders(assignment_id=None, team_number=None):
+    """Tell the notification scheduler that assignments changed"""
+    if notification_manager := current_app.db_managers.get("notification"):
+        if assignment_id is not None:
+            notification_manager.assignment_changed(assignment_id)
+        else:
+            notification_manager.team_assignments_changed(team_number)
+
 class TeamManager(DatabaseManager):
     """Handles all team-related operations"""
     
     def __init__(self, mongo_uri=None):
         # Use the singleton connection
         super().__init__(mongo_uri)
-        self._ensure_collections()
-
-    def _ensure_collections(self) -> None:
-        """Ensure required collections exist"""
-        if "teams" not in self.db.list_collection_names():
-            self.db.create_collection("teams")
-            logger.info("Created teams collection")
 
     def generate_join_code(self) -> str:
         """Generate a unique 6-character join code"""
@@ -48,7 +55,7 @@ class TeamManager(DatabaseManager):
     async def _get_team(self, query: Dict) -> Optional[Team]:
         """Internal method to fetch team data"""
         try:
-            if team_data := self.db.teams.find_one(query):
+            if team_data := await self.async_db.teams.find_one(query):
                 return Team.create_from_db(team_data)
             return None
         except Exception as e:
@@ -72,7 +79,7 @@ class TeamManager(DatabaseManager):
                 logger.warning("get_team_by_number called with None team_number")
                 return None
 
-            team_data = self.db.teams.find_one({"team_number": team_number})
+            team_data = await self.async_db.teams.find_one({"team_number": team_number})
             if team_data is None:
                 logger.warning(f"No team found with team_number: {team_number}")
                 return None
@@ -96,15 +103,15 @@ class TeamManager(DatabaseManager):
             # If no logo provided, create default
             if not logo_id:
                 logo_bytes = self.create_default_team_logo(team_number)
-                logo_id = get_gridfs().put(
+                logo_id = await asyncio.to_thread(
+                    store_image,
                     logo_bytes,
-                    filename=f"team_{team_number}_default_logo.png",
-                    content_type='image/png'
+                    f"team_{team_number}_default_logo.png",
                 )
 
             team_data = {
                 "team_number": team_number,
-                "team_join_code": self.generate_join_code(),
+                "team_join_code": await asyncio.to_thread(self.generate_join_code),
                 "users": [creator_id],
                 "admins": [creator_id],
                 "owner_id": creator_id,
@@ -115,13 +122,15 @@ class TeamManager(DatabaseManager):
                 "logo_id": str(logo_id)
             }
 
-            result = self.db.teams.insert_one(team_data)
+            result = await self.async_db.teams.insert_one(team_data)
 
             # Update creator's team number
-            self.db.users.update_one(
+            await self.async_db.users.update_one(
                 {"_id": ObjectId(creator_id)},
                 {"$set": {"teamNumber": team_number}}
             )
+            invalidate_user(creator_id)
+            await asyncio.to_thread(sync_scouter_fields, self.db, creator_id, scouter_team=team_number)
 
             return True, Team.create_from_db({"_id": result.inserted_id, **team_data})
 
@@ -134,7 +143,7 @@ class TeamManager(DatabaseManager):
         """Add a user to a team using the join code"""
         
         try:
-            team_data = self.db.teams.find_one({"team_join_code": team_join_code})
+            team_data = await self.async_db.teams.find_one({"team_join_code": team_join_code})
             if not team_data:
                 return False, "Invalid team join code"
 
@@ -142,18 +151,22 @@ class TeamManager(DatabaseManager):
             if user_id in team_data.get("users", []):
                 return False, "User already in team"
 
+            # Move the user's scouting first: if that fails, they are not in the team yet
+            await asyncio.to_thread(sync_scouter_fields, self.db, user_id, scouter_team=team_data["team_number"])
+
             # Add user to team
-            self.db.teams.update_one(
+            await self.async_db.teams.update_one(
                 {"_id": team_data["_id"]}, {"$addToSet": {"users": user_id}}
             )
 
             # Update user's team number
-            self.db.users.update_one(
+            await self.async_db.users.update_one(
                 {"_id": ObjectId(user_id)},
                 {"$set": {"teamNumber": team_data["team_number"]}},
             )
+            invalidate_user(user_id)
 
-            if updated_user := self.db.users.find_one({"_id": ObjectId(user_id)}):
+            if updated_user := await self.async_db.users.find_one({"_id": ObjectId(user_id)}):
                 user = User.create_from_db(updated_user)
                 logger.info(f"User {user_id} joined team {team_data['team_number']}")
                 return True, (Team.create_from_db(team_data), user)
@@ -181,7 +194,7 @@ class TeamManager(DatabaseManager):
                     return False, "Cannot leave team - no available users to transfer ownership to"
 
             # Remove user from team's users and admins lists
-            result = self.db.teams.update_one(
+            result = await self.async_db.teams.update_one(
                 {"team_number": team_number},
                 {"$pull": {"users": user_id, "admins": user_id}},
             )
@@ -190,9 +203,11 @@ class TeamManager(DatabaseManager):
                 return False, "User not found in team"
 
             # Remove team number from user
-            self.db.users.update_one(
+            await self.async_db.users.update_one(
                 {"_id": ObjectId(user_id)}, {"$unset": {"teamNumber": ""}}
             )
+            invalidate_user(user_id)
+            await asyncio.to_thread(sync_scouter_fields, self.db, user_id, scouter_team=None)
 
             logger.info(f"User {user_id} left team {team_number}")
             return True, "Successfully left team"
@@ -206,15 +221,15 @@ class TeamManager(DatabaseManager):
         """Get all members of a team"""
         
         try:
-            team = self.db.teams.find_one({"team_number": team_number})
+            team = await self.async_db.teams.find_one({"team_number": team_number})
             if not team:
                 return []
 
             user_ids = team.get("users", [])
-            users = self.db.users.find(
+            users = self.async_db.users.find(
                 {"_id": {"$in": [ObjectId(uid) for uid in user_ids]}}
             )
-            return [User.create_from_db(user) for user in users]
+            return [User.create_from_db(user) async for user in users]
         except Exception as e:
             logger.error(f"Error getting team members: {str(e)}")
             return []
@@ -244,7 +259,7 @@ class TeamManager(DatabaseManager):
                 return False, "User is already an admin"
 
             # Add the user as an admin
-            result = self.db.teams.update_one(
+            result = await self.async_db.teams.update_one(
                 {"team_number": team_number}, {"$addToSet": {"admins": user_id}}
             )
 
@@ -281,7 +296,7 @@ class TeamManager(DatabaseManager):
                 return False, "User is not an admin"
 
             # Remove the user from admins
-            result = self.db.teams.update_one(
+            result = await self.async_db.teams.update_one(
                 {"team_number": team_number}, {"$pull": {"admins": user_id}}
             )
 
@@ -311,7 +326,7 @@ class TeamManager(DatabaseManager):
                 return False, "Cannot remove the team owner"
 
             # Remove user from team
-            result = self.db.teams.update_one(
+            result = await self.async_db.teams.update_one(
                 {"team_number": team_number},
                 {"$pull": {"users": user_id, "admins": user_id}},
             )
@@ -320,11 +335,13 @@ class TeamManager(DatabaseManager):
                 return False, "User not found in team"
 
             # Update user's team number to None
-            self.db.users.update_one(
+            await self.async_db.users.update_one(
                 {"_id": ObjectId(user_id)}, {"$unset": {"teamNumber": ""}}
             )
+            invalidate_user(user_id)
+            await asyncio.to_thread(sync_scouter_fields, self.db, user_id, scouter_team=None)
 
-            if updated_user := self.db.users.find_one({"_id": ObjectId(user_id)}):
+            if updated_user := await self.async_db.users.find_one({"_id": ObjectId(user_id)}):
                 user = User.create_from_db(updated_user)
                 return True, user
 
@@ -356,43 +373,25 @@ class TeamManager(DatabaseManager):
                 "created_by": ObjectId(creator_id),
                 "created_at": datetime.now(timezone.utc),
             }
+            # Reminder reconciliation picks up assignments by updated_at
+            assignment["updated_at"] = assignment["created_at"]
 
-            result = self.db.assignments.insert_one(assignment)
+            result = await self.async_db.assignments.insert_one(assignment)
             assignment["_id"] = result.inserted_id
 
             # Add assignment to team
-            self.db.teams.update_one(
+            await self.async_db.teams.update_one(
                 {"team_number": team_number},
                 {"$addToSet": {"assignments": str(result.inserted_id)}},
             )
+            _reschedule_reminders(assignment_id=result.inserted_id)
 
-            from app.notifications.notification_manager import NotificationManager
-            import asyncio
-            
-            async def send_notifications():
-                try:
-                    # Reuse the existing database connection
-                    notification_manager = NotificationManager(
-                        self.mongo_uri,
-                        vapid_private_key=current_app.config.get("VAPID_PRIVATE_KEY"),
-                        vapid_claims={"sub": f"mailto:{current_app.config.get('VAPID_CLAIM_EMAIL')}"},
-                        existing_connection=self.get_connection()
-                    )
-                    
-                    # Use with context manager pattern to ensure proper cleanup
-                    try:
-                        await notification_manager.send_instant_assignment_notification(assignment, team_number)
-                    finally:
-                        # Don't close the connection here since it's shared
-                        # Just remove the reference to the shared connection
-                        notification_manager.client = None
-                        notification_manager.db = None
-                    
-                except Exception as e:
-                    logger.error(f"Background notification error: {str(e)}")
-
-            # Start notification task in background
-            asyncio.create_task(send_notifications())
+            # Send notifications in the background on the app's notification manager
+            if notification_manager := current_app.db_managers.get("notification"):
+                async_runtime.spawn(
+                    notification_manager.send_instant_assignment_notification(assignment, team_number),
+                    name=f"assignment-notification-{result.inserted_id}"
+                )
 
             return True, "Assignment created successfully"
         except Exception as e:
@@ -431,8 +430,8 @@ class TeamManager(DatabaseManager):
         """Get all assignments for a team"""
         
         try:
-            assignments = self.db.assignments.find({"team_number": team_number})
-            return [Assignment.create_from_db(assignment) for assignment in assignments]
+            assignments = self.async_db.assignments.find({"team_number": team_number})
+            return [Assignment.create_from_db(assignment) async for assignment in assignments]
         except Exception as e:
             logger.error(f"Error getting team assignments: {str(e)}")
             return []
@@ -455,7 +454,8 @@ class TeamManager(DatabaseManager):
                 return False, "You don't have permission to clear assignments"
 
             # Delete all assignments for the team
-            result = self.db.assignments.delete_many({"team_number": team_number})
+            result = await self.async_db.assignments.delete_many({"team_number": team_number})
+            _reschedule_reminders(team_number=team_number)
 
             if result.deleted_count > 0:
                 return True, f"Successfully cleared {result.deleted_count} assignments"
@@ -484,7 +484,7 @@ class TeamManager(DatabaseManager):
             if team.logo_id:
                 try:
                     # Delete the file and its chunks
-                    get_gridfs().delete(team.logo_id)
+                    await asyncio.to_thread(delete_gridfs_file, team.logo_id)
                 except Exception as e:
                     logger.error(f"Error deleting team logo: {str(e)}")
 
@@ -492,14 +492,17 @@ class TeamManager(DatabaseManager):
             team_members = team.users
 
             # Delete all team data
-            self.db.teams.delete_one({"team_number": team_number})
-            self.db.assignments.delete_many({"team_number": team_number})
+            await self.async_db.teams.delete_one({"team_number": team_number})
+            await self.async_db.assignments.delete_many({"team_number": team_number})
+            _reschedule_reminders(team_number=team_number)
 
             # Update all team members to remove team number
             for member_id in team_members:
-                self.db.users.update_one(
+                await self.async_db.users.update_one(
                     {"_id": ObjectId(member_id)}, {"$set": {"teamNumber": None}}
                 )
+            invalidate_user(*team_members)
+            await asyncio.to_thread(sync_scouter_fields, self.db, team_members, scouter_team=None)
 
             return True, "Team deleted successfully"
 
@@ -516,7 +519,7 @@ class TeamManager(DatabaseManager):
             
 
             # Get the assignment
-            assignment = self.db.assignments.find_one({"_id": ObjectId(assignment_id)})
+            assignment = await self.async_db.assignments.find_one({"_id": ObjectId(assignment_id)})
             if not assignment:
                 return False, "Assignment not found"
 
@@ -530,9 +533,10 @@ class TeamManager(DatabaseManager):
                 return False, "You don't have permission to delete assignments"
 
             # Delete the assignment
-            result = self.db.assignments.delete_one({"_id": ObjectId(assignment_id)})
+            result = await self.async_db.assignments.delete_one({"_id": ObjectId(assignment_id)})
 
             if result.deleted_count > 0:
+                _reschedule_reminders(assignment_id=assignment_id)
                 return True, "Assignment deleted successfully"
             return False, "Failed to delete assignment"
 
@@ -548,7 +552,7 @@ class TeamManager(DatabaseManager):
         
         try:
             # Get the assignment and team
-            assignment = self.db.assignments.find_one({"_id": ObjectId(assignment_id)})
+            assignment = await self.async_db.assignments.find_one({"_id": ObjectId(assignment_id)})
             if not assignment:
                 return False, "Assignment not found"
 
@@ -570,11 +574,12 @@ class TeamManager(DatabaseManager):
                 "updated_by": ObjectId(user_id),
             }
 
-            result = self.db.assignments.update_one(
+            result = await self.async_db.assignments.update_one(
                 {"_id": ObjectId(assignment_id)}, {"$set": update_data}
             )
 
             if result.modified_count > 0:
+                _reschedule_reminders(assignment_id=assignment_id)
                 return True, "Assignment updated successfully"
             return False, "No changes made to assignment"
 
@@ -587,10 +592,12 @@ class TeamManager(DatabaseManager):
         """Reset user's team number to None"""
         
         try:
-            result = self.db.users.update_one(
+            result = await self.async_db.users.update_one(
                 {"_id": ObjectId(user_id)}, {"$unset": {"teamNumber": ""}}
             )
+            invalidate_user(user_id)
             if result.modified_count > 0:
+                await asyncio.to_thread(sync_scouter_fields, self.db, user_id, scouter_team=None)
                 logger.info(f"Reset team number for user {user_id}")
                 return True
             return False
@@ -632,7 +639,7 @@ class TeamManager(DatabaseManager):
             old_logo_id = team.logo_id
             
             # Update team with new logo
-            result = self.db.teams.update_one(
+            result = await self.async_db.teams.update_one(
                 {"team_number": team_number},
                 {"$set": {"logo_id": new_logo_id}}
             )
@@ -641,8 +648,8 @@ class TeamManager(DatabaseManager):
                 # Clean up old logo if it exists
                 if old_logo_id:
                     try:
-                        if get_gridfs().exists(old_logo_id):
-                            get_gridfs().delete(old_logo_id)
+                        if await asyncio.to_thread(get_gridfs().exists, old_logo_id):
+                            await asyncio.to_thread(delete_gridfs_file, old_logo_id)
                     except Exception as e:
                         logger.error(f"Error deleting old team logo: {str(e)}")
                         
@@ -680,14 +687,14 @@ class TeamManager(DatabaseManager):
             if not valid_updates:
                 return False, "No changes to update"
             
-            result = self.db.teams.update_one(
+            result = await self.async_db.teams.update_one(
                 {"team_number": team_number},
                 {"$set": valid_updates}
             )
             
             if result.modified_count > 0:
                 # Run cleanup after successful update
-                self.cleanup_gridfs()
+                await asyncio.to_thread(self.cleanup_gridfs)
                 return True, "Team information updated successfully"
             return False, "No changes made"
             
@@ -750,7 +757,7 @@ class TeamManager(DatabaseManager):
                 return False, "No users available to transfer ownership"
 
             # Update team with new owner
-            result = self.db.teams.update_one(
+            result = await self.async_db.teams.update_one(
                 {"team_number": team_number},
                 {
                     "$set": {"owner_id": ObjectId(new_owner_id)},
@@ -772,7 +779,7 @@ class TeamManager(DatabaseManager):
         
         try:
             # Find the user to get their team number
-            user_data = self.db.users.find_one({"_id": ObjectId(user_id)})
+            user_data = await self.async_db.users.find_one({"_id": ObjectId(user_id)})
             if not user_data or not user_data.get("teamNumber"):
                 return None
                 
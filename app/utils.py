@@ -2,69 +2,30 @@ import asyncio
 import contextlib
 import logging
 import os
+import threading
 import time
+import weakref
 from functools import wraps
-from io import BytesIO
 from urllib.parse import urljoin, urlparse
 from datetime import datetime
 
-from bson import ObjectId
 from dotenv import load_dotenv
-from flask import flash, jsonify, render_template, request, send_file, g, current_app
+from flask import flash, jsonify, render_template, request, g, current_app
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from gridfs import GridFS
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import AsyncMongoClient, MongoClient
 from werkzeug.utils import secure_filename
-import colorlog
 
-# Configure logging with custom format and color with colorlog and file logging
+from app import async_runtime, lifecycle
+from app.db_monitor import command_monitor, monitoring_enabled
+from app.log_pipeline import setup_logging
+from app.retry import retry, topology_watcher
+
+# Configure logging: colored console and rotating key/value log file, written
+# by a background thread (see app.log_pipeline)
 def setup_logger():
-    # Create log directory if it doesn't exist
-    log_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-    os.makedirs(log_dir, exist_ok=True)
-    
-    # Create a timestamp for the log filename
-    timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
-    log_file = os.path.join(log_dir, f'app_{timestamp}.log')
-    
-    # Set up root logger
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.INFO)
-    
-    # Clear any existing handlers (in case of app restart)
-    if root_logger.handlers:
-        root_logger.handlers.clear()
-    
-    # Console handler with colors
-    console_handler = logging.StreamHandler()
-    console_handler.setLevel(logging.INFO)
-    
-    # Color formatter for console
-    color_formatter = colorlog.ColoredFormatter(
-        '%(log_color)s%(asctime)s - %(levelname)s - %(message)s',
-        log_colors={
-            'DEBUG': 'cyan',
-            'INFO': 'green',
-            'WARNING': 'yellow',
-            'ERROR': 'red',
-            'CRITICAL': 'red,bg_white',
-        },
-        datefmt='%Y-%m-%d %H:%M:%S'
-    )
-    console_handler.setFormatter(color_formatter)
-    
-    # File handler for logging to file
-    file_handler = logging.FileHandler(log_file)
-    file_handler.setLevel(logging.INFO)
-    file_formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(pathname)s:%(lineno)d - %(message)s')
-    file_handler.setFormatter(file_formatter)
-    
-    # Add handlers to root logger
-    root_logger.addHandler(console_handler)
-    root_logger.addHandler(file_handler)
-    
+    log_file = setup_logging()
     logger = logging.getLogger(__name__)
     logger.info(f"Logging initialized. Log file: {log_file}")
     return logger
@@ -73,22 +34,58 @@ def setup_logger():
 logger = setup_logger()
 
 # File handling constants
-ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
 
 load_dotenv()
 
 # ============ Database Utilities ============
 
+MONGO_CLIENT_OPTIONS = {
+    "serverSelectionTimeoutMS": 30000,  # Increased from 10000
+    "maxPoolSize": 50,                  # Increased from 10
+    "minPoolSize": 5,                   # Increased from 1
+    "connectTimeoutMS": 10000,          # Increased from 5000
+    "socketTimeoutMS": 45000,           # Increased from 30000
+    "waitQueueTimeoutMS": 10000,        # Added wait queue timeout
+    "retryWrites": True,                # Enable retryable writes
+    "retryReads": True,                 # Enable retryable reads
+    "heartbeatFrequencyMS": 10000,      # Added heartbeat frequency
+    "maxIdleTimeMS": 60000              # Added max idle time
+}
+# Server heartbeats feed the circuit breaker, see app.retry
+MONGO_CLIENT_OPTIONS["event_listeners"] = [topology_watcher]
+if monitoring_enabled():
+    # Per-command timings and slow-query log, see app.db_monitor
+    MONGO_CLIENT_OPTIONS["event_listeners"].append(command_monitor)
+
+# Async clients are bound to one event loop and there is one loop per worker
+# thread, so each gets a share of the pool instead of its own full pool
+ASYNC_CLIENT_OVERRIDES = {
+    "maxPoolSize": 10,
+    "minPoolSize": 0,
+}
+
 class MongoDB:
     """
-    Singleton MongoDB connection manager that maintains exactly one connection
-    throughout the application lifecycle.
+    Singleton MongoDB connection manager holding one client per process.
+
+    The client is created lazily on first use in each process (PyMongo clients
+    must not be shared across fork), and a background thread pings the
+    server instead of checking it on the request path.
     """
     # Class variables for the single global connection
     _instance = None
     _client = None
     _db = None
+    _pid = None
     _initialized = False
+    _lock = threading.Lock()
+    # Event loop -> AsyncMongoClient; dropped along with their loop
+    _async_clients = weakref.WeakKeyDictionary()
+    _async_lock = threading.Lock()
+
+    # Seconds between background health pings
+    HEALTH_CHECK_INTERVAL = 30
     
     def __new__(cls, mongo_uri=None, *args, **kwargs):
         if cls._instance is None:
@@ -99,51 +96,96 @@ class MongoDB:
         # Only initialize once
         if not MongoDB._initialized:
             self.mongo_uri = mongo_uri or os.getenv("MONGO_URI")
-            self._connect()
+            self._health = {"healthy": None, "latency_ms": None, "last_error": None, "checked_at": None}
+            self._health_thread = None
+            self._health_pid = None
             MongoDB._initialized = True
     
     def _connect(self):
-        """Create the MongoDB connection"""
-        try:
-            logger.info("Creating new MongoDB connection")
-            self._client = MongoClient(
-                self.mongo_uri,
-                serverSelectionTimeoutMS=30000,  # Increased from 10000
-                maxPoolSize=50,                  # Increased from 10
-                minPoolSize=5,                   # Increased from 1
-                connectTimeoutMS=10000,          # Increased from 5000
-                socketTimeoutMS=45000,           # Increased from 30000
-                waitQueueTimeoutMS=10000,        # Added wait queue timeout
-                retryWrites=True,                # Enable retryable writes
-                retryReads=True,                 # Enable retryable reads
-                heartbeatFrequencyMS=10000,      # Added heartbeat frequency
-                maxIdleTimeMS=60000              # Added max idle time
-            )
-            
-            # Test the connection
-            self._client.server_info()
+        """Create this process's MongoDB client (connections are opened lazily by PyMongo)"""
+        with self._lock:
+            if self._client is not None and self._pid == os.getpid():
+                return
+            logger.info(f"Creating MongoDB client for process {os.getpid()}")
+            self._client = MongoClient(self.mongo_uri, **MONGO_CLIENT_OPTIONS)
             self._db = self._client.get_default_database()
-            logger.info("MongoDB connection established successfully")
-        except Exception as e:
-            logger.error(f"Failed to connect to MongoDB: {str(e)}")
-            raise
+            self._pid = os.getpid()
+        self._start_health_monitor()
+
+    def _start_health_monitor(self):
+        if self._health_thread is not None and self._health_thread.is_alive() and self._health_pid == os.getpid():
+            return
+        self._health_pid = os.getpid()
+        self._health_thread = threading.Thread(
+            target=self._health_worker, name="mongodb-health", daemon=True
+        )
+        self._health_thread.start()
+
+    def _health_worker(self):
+        """Ping the server periodically and record the result"""
+        pid = os.getpid()
+        while self._health_pid == pid:
+            client = self._client
+            if client is not None:
+                started = time.monotonic()
+                try:
+                    client.admin.command("ping")
+                    healthy, error = True, None
+                except Exception as e:
+                    healthy, error = False, str(e)
+                if healthy != self._health["healthy"]:
+                    if healthy:
+                        logger.info("MongoDB is reachable")
+                    else:
+                        logger.error(f"MongoDB health check failed: {error}")
+                self._health = {
+                    "healthy": healthy,
+                    "latency_ms": (time.monotonic() - started) * 1000,
+                    "last_error": error,
+                    "checked_at": datetime.now(),
+                }
+            time.sleep(self.HEALTH_CHECK_INTERVAL)
+
+    def get_health(self):
+        """Get the result of the last background health check"""
+        return dict(self._health)
+
+    def _reset_after_fork(self):
+        """Drop the parent's clients in a forked child; they are recreated on next use"""
+        self._client = None
+        self._db = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._health_thread = None
+        self._health_pid = None
+        MongoDB._async_clients = weakref.WeakKeyDictionary()
+        MongoDB._async_lock = threading.Lock()
     
     def get_client(self):
         """Get the MongoDB client"""
-        try:
-            if self._client is None or not self._client.is_primary:
-                self._connect()
-            return self._client
-        except Exception as e:
-            logger.error(f"Error getting MongoDB client: {str(e)}")
-            self._connect()  # Try to reconnect
-            return self._client
+        if self._client is None or self._pid != os.getpid():
+            self._connect()
+        return self._client
     
     def get_db(self):
         """Get the MongoDB database"""
-        if self._db is None:
+        if self._db is None or self._pid != os.getpid():
             self._connect()
         return self._db
+
+    def get_async_db(self):
+        """Get the async database handle for the running event loop"""
+        loop = asyncio.get_running_loop()
+        client = self._async_clients.get(loop)
+        if client is None:
+            with self._async_lock:
+                if (client := self._async_clients.get(loop)) is None:
+                    client = AsyncMongoClient(
+                        self.mongo_uri, **{**MONGO_CLIENT_OPTIONS, **ASYNC_CLIENT_OVERRIDES}
+                    )
+                    self._async_clients[loop] = client
+                    logger.info("Created async MongoDB client for event loop")
+        return client.get_default_database()
     
     def close(self):
         """Close the MongoDB connection during application shutdown"""
@@ -156,6 +198,8 @@ class MongoDB:
             finally:
                 self._client = None
                 self._db = None
+                self._health_pid = None
+                MongoDB._async_clients = weakref.WeakKeyDictionary()
                 MongoDB._initialized = False
 
 # Global instance
@@ -164,15 +208,20 @@ fs = None  # Initialize as None, will be set up when needed
 
 def get_mongodb_instance(mongo_uri=None):
     """Get the singleton MongoDB instance"""
-    global _mongodb_instance, fs
+    global _mongodb_instance
     if _mongodb_instance is None:
         _mongodb_instance = MongoDB(mongo_uri)
-        # Initialize GridFS with the singleton connection
-        fs = GridFS(_mongodb_instance.get_db())
     # Mark the database as accessed for the current request
     _mark_db_accessed()
     return _mongodb_instance
 
+@lifecycle.on_fork
+def _reset_mongodb_after_fork():
+    global fs
+    fs = None
+    if _mongodb_instance is not None:
+        _mongodb_instance._reset_after_fork()
+
 def _mark_db_accessed():
     """Mark this request as having accessed the database"""
     try:
@@ -194,9 +243,22 @@ class DBManager:
     
     def __init__(self, mongo_uri=None):
         """Initialize the database manager with the global singleton connection"""
-        mongodb = get_mongodb_instance(mongo_uri)
-        self.client = mongodb.get_client()
-        self.db = mongodb.get_db()
+        get_mongodb_instance(mongo_uri)
+
+    # Resolved on every access so managers created before a fork use the
+    # worker's own client
+    @property
+    def client(self):
+        return get_mongodb_instance().get_client()
+
+    @property
+    def db(self):
+        return get_mongodb_instance().get_db()
+
+    @property
+    def async_db(self):
+        """Async database handle for use inside coroutines (bound to the running loop)"""
+        return get_mongodb_instance().get_async_db()
 
 DatabaseManager = DBManager
 
@@ -214,24 +276,9 @@ def force_close_connection():
     close_mongodb_connection()
 
 def with_mongodb_retry(retries=3, delay=2):
-    """Decorator for retrying MongoDB operations"""
-    def decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
-            last_error = None
-            for attempt in range(retries):
-                try:
-                    return f(*args, **kwargs)
-                except (ServerSelectionTimeoutError, ConnectionFailure) as e:
-                    last_error = e
-                    if attempt < retries - 1:
-                        logger.warning(f"Attempt {attempt + 1} failed: {str(e)}")
-                        time.sleep(delay)
-                    else:
-                        logger.error(f"All {retries} attempts failed: {str(e)}")
-            raise last_error
-        return wrapper
-    return decorator
+    """Decorator for retrying MongoDB operations (sync or async) with backoff
+    and the shared circuit breaker, see app.retry"""
+    return retry(retries=retries, delay=delay)
 
 def mark_db_accessed():
     """Mark the current request as having accessed the database"""
@@ -240,10 +287,10 @@ def mark_db_accessed():
 # ============ Route Utilities ============
 
 def async_route(f):
-    """Decorator to handle async routes"""
+    """Decorator to handle async routes on the calling thread's long-lived event loop"""
     @wraps(f)
     def wrapper(*args, **kwargs):
-        return asyncio.run(f(*args, **kwargs))
+        return async_runtime.run(f(*args, **kwargs))
     return wrapper
 
 def handle_route_errors(f):
@@ -274,32 +321,25 @@ def allowed_file(filename: str) -> bool:
 
 def save_file_to_gridfs(file, db, prefix: str = '') -> str:
     """Save file to GridFS and return file ID"""
+    # Imported here: app.media builds on this module
+    from app.media.image_pipeline import store_image
+
     if file and allowed_file(file.filename):
         filename = secure_filename(f"{prefix}_{file.filename}" if prefix else file.filename)
-        file_id = get_gridfs().put(
-            file.stream.read(),
-            filename=filename,
-            content_type=file.content_type
-        )
+        try:
+            file_id = store_image(file.stream.read(), filename)
+        except ValueError as e:
+            logger.warning(f"Rejected upload {filename}: {str(e)}")
+            return None
         return str(file_id)
     return None
 
 def send_gridfs_file(file_id, db, default_path: str = None):
-    """Send file from GridFS or return default file"""
-    try:
-        if isinstance(file_id, str):
-            file_id = ObjectId(file_id)
-        file_data = get_gridfs().get(file_id)
-        return send_file(
-            BytesIO(file_data.read()),
-            mimetype=file_data.content_type,
-            download_name=file_data.filename
-        )
-    except Exception as e:
-        logger.error(f"Error retrieving file: {str(e)}")
-        if default_path:
-            return send_file(default_path)
-        return error_response("An internal error has occurred.", 500)
+    """Send file from GridFS or return default file (streamed, with ETag)"""
+    # Imported here: app.media builds on this module
+    from app.media.media_utils import serve_gridfs_file
+
+    return serve_gridfs_file(file_id, default_path)
 
 # ============ Response Utilities ============
 
@@ -343,5 +383,6 @@ def get_gridfs():
     """Get the GridFS instance"""
     global fs
     if fs is None:
-        get_mongodb_instance()  # This will initialize both MongoDB and GridFS
+        # GridFS over this process's client
+        fs = GridFS(get_mongodb_instance().get_db())
     return fs 
\ No newline at end of file
@@ -0,0 +1,111 @@
+"""Benchmark Web Push delivery against a local stand-in push service.
+
+Starts an HTTP server on localhost that accepts pushes like a push service
+would (201 after a configurable delay), then sends the same batch one push at
+a time and through ``app.notifications.push_delivery.deliver``.
+
+    python bench_push.py --pushes 40 --latency-ms 150
+"""
+
+import argparse
+import base64
+import logging
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from py_vapid import Vapid
+from pywebpush import webpush
+
+# Add parent directory to path
+sys.path.insert(0, os.getcwd())
+
+from app.notifications.push_delivery import VapidSigner, deliver, get_push_stats
+
+logging.basicConfig(level=logging.WARNING)
+
+VAPID_CLAIMS = {"sub": "mailto:bench@example.com"}
+
+
+def make_handler(latency):
+    class StandInPushService(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            self.send_response(201)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    return StandInPushService
+
+
+def b64(data):
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def make_subscription(base_url, index):
+    """A subscription as a browser would hand it out, pointing at the stand-in"""
+    public_key = ec.generate_private_key(ec.SECP256R1()).public_key().public_bytes(
+        serialization.Encoding.X962, serialization.PublicFormat.UncompressedPoint
+    )
+    return {
+        "endpoint": f"{base_url}/push/{index}",
+        "keys": {"p256dh": b64(public_key), "auth": b64(os.urandom(16))},
+    }
+
+
+def run_serial(subscriptions, vapid):
+    started = time.perf_counter()
+    for subscription in subscriptions:
+        webpush(subscription, data='{"title": "bench"}', vapid_private_key=vapid, vapid_claims=dict(VAPID_CLAIMS))
+    return time.perf_counter() - started
+
+
+def run_parallel(subscriptions, vapid):
+    messages = [(i, subscription, '{"title": "bench"}') for i, subscription in enumerate(subscriptions)]
+    started = time.perf_counter()
+    results = deliver(messages, VapidSigner(vapid, VAPID_CLAIMS))
+    elapsed = time.perf_counter() - started
+    failed = [result for result in results if not result.ok]
+    if failed:
+        print(f"  {len(failed)} pushes failed, first: {failed[0].error}")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pushes", type=int, default=40)
+    parser.add_argument("--latency-ms", type=float, default=150, help="Delay of the stand-in push service")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(args.latency_ms / 1000))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    vapid = Vapid()
+    vapid.generate_keys()
+    subscriptions = [make_subscription(base_url, i) for i in range(args.pushes)]
+
+    print(f"{args.pushes} pushes, stand-in latency {args.latency_ms:.0f}ms, PUSH_WORKERS={os.getenv('PUSH_WORKERS', 8)}")
+    serial = run_serial(subscriptions, vapid)
+    print(f"  serial:   {serial:.2f}s ({args.pushes / serial:.1f} pushes/s)")
+    parallel = run_parallel(subscriptions, vapid)
+    print(f"  parallel: {parallel:.2f}s ({args.pushes / parallel:.1f} pushes/s)")
+
+    origin_stats = next(iter(get_push_stats()["origins"].values()))
+    print(f"  per push: avg {origin_stats['avg_seconds'] * 1000:.0f}ms, max {origin_stats['max_seconds'] * 1000:.0f}ms")
+    print(f"  VAPID tokens signed: {get_push_stats()['vapid_signatures']}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
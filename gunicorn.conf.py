@@ -0,0 +1,19 @@
+"""Gunicorn settings for Castle (see Castle.service)"""
+
+import os
+
+# The app is imported once in the master and forked into the workers, so
+# background services must start in each worker, not at import time
+os.environ.setdefault("CASTLE_DEFER_SERVICES", "1")
+
+bind = "0.0.0.0:8000"
+workers = 2
+timeout = 120
+preload_app = True
+
+
+def post_fork(server, worker):
+    from app import metrics
+    from app.lifecycle import start_services
+    metrics.set_worker_threads(worker.cfg.threads)
+    start_services()
@@ -0,0 +1,217 @@
+"""
+Tests for the TTL cache policies of the API clients
+"""
+import threading
+import time
+
+import pytest
+
+from app import cache
+from app.cache import CachePolicy, SQLiteCacheBackend, ttl_cache
+
+POLICY = CachePolicy(ttl=10, stale_ttl=60, negative_ttl=5)
+
+
+class FakeClock:
+    """Stands in for the time module inside app.cache"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+class Client:
+    cache_backend = None
+
+    def __init__(self, responses=None):
+        self.calls = 0
+        self.responses = list(responses or [])
+
+    @ttl_cache(POLICY)
+    def fetch(self, key):
+        self.calls += 1
+        if self.responses:
+            return self.responses.pop(0)
+        return f"{key}-{self.calls}"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache, "time", clock)
+    return clock
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_fresh_entry_is_served_until_ttl(clock):
+    client = Client()
+    assert client.fetch("a") == "a-1"
+    clock.advance(POLICY.ttl - 1)
+    assert client.fetch("a") == "a-1"
+    assert client.calls == 1
+
+
+def test_entry_expires_after_stale_ttl(clock):
+    client = Client()
+    assert client.fetch("a") == "a-1"
+    clock.advance(POLICY.stale_ttl + 1)
+    assert client.fetch("a") == "a-2"
+    assert client.calls == 2
+
+
+def test_arguments_are_cached_separately(clock):
+    client = Client()
+    assert client.fetch("a") == "a-1"
+    assert client.fetch("b") == "b-2"
+    assert client.fetch("a") == "a-1"
+
+
+def test_stale_entry_is_served_while_refreshing_in_background(clock):
+    client = Client()
+    assert client.fetch("a") == "a-1"
+    clock.advance(POLICY.ttl + 1)
+
+    # Served at once, the new value lands from the refresh pool
+    assert client.fetch("a") == "a-1"
+    assert wait_for(lambda: client.fetch("a") == "a-2")
+    assert client.calls == 2
+
+
+def test_failed_refresh_keeps_serving_stale_value(clock):
+    client = Client(["a-1", None])
+    assert client.fetch("a") == "a-1"
+    clock.advance(POLICY.ttl + 1)
+
+    assert client.fetch("a") == "a-1"
+    assert wait_for(lambda: client.calls == 2)
+    assert client.fetch("a") == "a-1"
+    # Backed off for negative_ttl before the next refresh
+    assert client.calls == 2
+
+
+def test_none_is_cached_for_negative_ttl_only(clock):
+    client = Client([None, "a-2"])
+    assert client.fetch("a") is None
+    clock.advance(POLICY.negative_ttl - 1)
+    assert client.fetch("a") is None
+    assert client.calls == 1
+
+    clock.advance(2)
+    # Negative entries are never served stale
+    assert client.fetch("a") == "a-2"
+    assert client.calls == 2
+
+
+def test_concurrent_misses_make_one_upstream_call():
+    release = threading.Event()
+    started = threading.Event()
+    calls = []
+
+    class SlowClient:
+        cache_backend = None
+
+        @ttl_cache(POLICY)
+        def fetch(self, key):
+            calls.append(key)
+            started.set()
+            release.wait(5)
+            return f"{key}-value"
+
+    client = SlowClient()
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.fetch("a"))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(2)
+    # Give the other callers time to join the flight
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert calls == ["a"]
+    assert results == ["a-value"] * 8
+
+
+def test_collapsed_callers_share_the_error():
+    release = threading.Event()
+    started = threading.Event()
+
+    class FailingClient:
+        cache_backend = None
+
+        @ttl_cache(POLICY)
+        def fetch(self, key):
+            started.set()
+            release.wait(5)
+            raise RuntimeError("upstream down")
+
+    client = FailingClient()
+    errors = []
+
+    def call():
+        try:
+            client.fetch("a")
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=call) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(2)
+    time.sleep(0.2)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert len(errors) == 4
+
+
+def test_cache_put_replaces_the_entry(clock):
+    client = Client()
+    assert client.fetch("a") == "a-1"
+    Client.fetch.cache_put(client, "pushed", "a")
+    assert client.fetch("a") == "pushed"
+    assert client.calls == 1
+
+
+def test_cache_clear_forgets_entries(clock):
+    client = Client()
+    client.fetch("a")
+    Client.fetch.cache_clear(client)
+    assert client.fetch("a") == "a-2"
+
+
+def test_shared_backend_serves_other_instances(clock, tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "api_cache.sqlite3"))
+    first, second = Client(), Client()
+    first.cache_backend = second.cache_backend = backend
+
+    assert first.fetch("a") == "a-1"
+    assert second.fetch("a") == "a-1"
+    assert second.calls == 0
+
+
+def test_errors_are_not_shared(clock, tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / "api_cache.sqlite3"))
+    first, second = Client([None]), Client()
+    first.cache_backend = second.cache_backend = backend
+
+    assert first.fetch("a") is None
+    assert second.fetch("a") == "a-1"
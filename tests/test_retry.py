@@ -0,0 +1,268 @@
+"""
+Tests for the MongoDB retry policy and circuit breaker
+"""
+import asyncio
+
+import pytest
+from pymongo.errors import AutoReconnect
+
+from app import async_runtime, retry
+from app.retry import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError
+
+
+class FakeClock:
+    """Stands in for the time module inside app.retry"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class Description:
+    def __init__(self, readable, errors=()):
+        self.readable = readable
+        self.errors = errors
+
+    def has_readable_server(self):
+        return self.readable
+
+    def server_descriptions(self):
+        return {
+            ("localhost", 27017 + i): type("Server", (), {"error": error})()
+            for i, error in enumerate(self.errors or [None])
+        }
+
+
+class TopologyEvent:
+    def __init__(self, description):
+        self.new_description = description
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(retry, "time", clock)
+    return clock
+
+
+@pytest.fixture
+def breaker(monkeypatch, clock):
+    breaker = CircuitBreaker(threshold=3, cooldown=10)
+    monkeypatch.setattr(retry, "breaker", breaker)
+    monkeypatch.setenv("MONGO_RETRY_BASE_DELAY", "0")
+    return breaker
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.threshold):
+        breaker.record_failure()
+    assert breaker.state == OPEN
+
+
+# ============ State Machine ============
+
+def test_opens_at_threshold(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+    assert breaker.allow() == (True, False)
+
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.allow() == (False, False)
+
+
+def test_success_resets_failure_count(breaker):
+    breaker.record_failure()
+    breaker.record_failure()
+    breaker.record_success()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_half_opens_after_cooldown(breaker, clock):
+    open_breaker(breaker)
+    clock.sleep(breaker.cooldown - 1)
+    assert breaker.allow() == (False, False)
+
+    clock.sleep(1)
+    assert breaker.allow() == (True, True)
+    assert breaker.state == HALF_OPEN
+
+
+def test_half_open_lets_one_trial_through(breaker, clock):
+    open_breaker(breaker)
+    clock.sleep(breaker.cooldown)
+    assert breaker.allow() == (True, True)
+    assert breaker.allow() == (False, False)
+
+    # A trial that ended without a verdict frees the slot
+    breaker.release_trial()
+    assert breaker.allow() == (True, True)
+
+
+def test_successful_trial_closes(breaker, clock):
+    open_breaker(breaker)
+    clock.sleep(breaker.cooldown)
+    breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert breaker.allow() == (True, False)
+
+
+def test_failed_trial_reopens_for_another_cooldown(breaker, clock):
+    open_breaker(breaker)
+    clock.sleep(breaker.cooldown)
+    breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == OPEN
+    assert breaker.allow() == (False, False)
+
+    clock.sleep(breaker.cooldown)
+    assert breaker.allow() == (True, True)
+
+
+# ============ Topology Events ============
+
+def test_server_down_opens_until_server_up(breaker, clock):
+    watcher = retry.TopologyWatcher()
+    watcher.description_changed(TopologyEvent(Description(False, ["connection refused"])))
+    assert breaker.state == OPEN
+
+    # A swallowed error is not a success while the driver reports the server down
+    breaker.record_success()
+    assert breaker.state == OPEN
+    assert breaker.allow() == (False, False)
+
+    watcher.description_changed(TopologyEvent(Description(True)))
+    assert breaker.state == CLOSED
+    assert breaker.allow() == (True, False)
+
+
+def test_trial_recovers_while_marked_down(breaker, clock):
+    retry.TopologyWatcher().description_changed(TopologyEvent(Description(False, ["connection refused"])))
+
+    # A failed trial keeps the circuit open for another cooldown
+    clock.sleep(breaker.cooldown)
+    assert breaker.allow() == (True, True)
+    breaker.record_failure()
+    assert breaker.allow() == (False, False)
+
+    # No heartbeat reports the server back, but the next trial reaches it
+    clock.sleep(breaker.cooldown)
+    assert breaker.allow() == (True, True)
+    breaker.record_success()
+    assert breaker.state == CLOSED
+    assert not breaker._server_down
+    assert breaker.allow() == (True, False)
+
+
+def test_unchecked_servers_do_not_open(breaker):
+    retry.TopologyWatcher().description_changed(TopologyEvent(Description(False)))
+    assert breaker.state == CLOSED
+
+
+# ============ Decorator ============
+
+def test_retries_until_success(breaker):
+    attempts = []
+
+    @retry.retry(retries=3)
+    def operation():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise AutoReconnect("primary stepped down")
+        return "done"
+
+    assert operation() == "done"
+    assert len(attempts) == 3
+    assert breaker.state == CLOSED
+
+
+def test_open_circuit_fails_fast(breaker):
+    calls = []
+
+    @retry.retry(retries=3)
+    def operation():
+        calls.append(1)
+
+    open_breaker(breaker)
+    with pytest.raises(CircuitOpenError):
+        operation()
+    assert calls == []
+
+
+def test_other_errors_count_as_an_answer(breaker):
+    @retry.retry(retries=3)
+    def operation():
+        raise ValueError("bad document")
+
+    breaker.record_failure()
+    breaker.record_failure()
+    with pytest.raises(ValueError):
+        operation()
+    breaker.record_failure()
+    assert breaker.state == CLOSED
+
+
+def test_nested_calls_bypass_the_breaker(breaker):
+    inner_attempts = []
+
+    @retry.retry(retries=3)
+    def inner():
+        inner_attempts.append(1)
+        if len(inner_attempts) == 1:
+            raise AutoReconnect("blip")
+        return "inner"
+
+    @retry.retry(retries=3)
+    def outer():
+        # Opened while the outer call holds its slot
+        retry.breaker.server_down("monitor lost the server")
+        return inner()
+
+    assert outer() == "inner"
+    assert len(inner_attempts) == 2
+    # Only the outer call was counted, and it did not close the breaker
+    assert breaker._failures == 0
+    assert breaker.state == OPEN
+
+
+def test_async_calls_are_retried(breaker):
+    attempts = []
+
+    @retry.retry(retries=3)
+    async def operation():
+        attempts.append(1)
+        if len(attempts) < 2:
+            raise AutoReconnect("blip")
+        return "done"
+
+    assert asyncio.run(operation()) == "done"
+    assert len(attempts) == 2
+
+
+def test_spawned_tasks_are_not_nested(breaker):
+    @retry.retry(retries=1)
+    async def background():
+        return "ran"
+
+    @retry.retry(retries=1)
+    def request():
+        return async_runtime.spawn(check())
+
+    async def check():
+        nested = retry._in_operation.get()
+        retry.breaker.server_down("monitor lost the server")
+        try:
+            await background()
+        except CircuitOpenError:
+            return nested, "rejected"
+        return nested, "ran"
+
+    assert request().result(timeout=5) == (False, "rejected")
@@ -0,0 +1,145 @@
+"""
+Tests for the incrementally maintained team stats
+"""
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from app.scout import team_stats
+
+mongomock = pytest.importorskip("mongomock")
+
+TEAM = 1234
+# Fields only taken from the latest entry; removing an entry does not roll them back
+LATEST_FIELDS = ("last_climb_type", "event_name")
+
+
+@pytest.fixture
+def db(monkeypatch):
+    # pymongo 4.9+ passes the (unused) sort of ReplaceOne, mongomock does not take it
+    add_replace = mongomock.collection.BulkOperationBuilder.add_replace
+    monkeypatch.setattr(
+        mongomock.collection.BulkOperationBuilder, "add_replace",
+        lambda self, selector, doc, upsert, sort=None, **kwargs: add_replace(self, selector, doc, upsert, **kwargs),
+    )
+    return mongomock.MongoClient().castle
+
+
+class Writer:
+    """Writes team_data the way ScoutingManager does, keeping stats as it goes"""
+
+    def __init__(self, db):
+        self.db = db
+        self.clock = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+    def insert(self, **fields):
+        self.clock += timedelta(minutes=1)
+        entry = {
+            "_id": ObjectId(),
+            "scouter_id": fields.pop("scouter_id", ObjectId()),
+            "scouter_team": fields.pop("scouter_team", TEAM),
+            "event_code": "USCAFFL",
+            "team_number": 5000,
+            "created_at": self.clock,
+            **fields,
+        }
+        self.db.team_data.insert_one(entry)
+        team_stats.record_entry(self.db, entry)
+        return entry
+
+    def update(self, entry, **fields):
+        old_entry = self.db.team_data.find_one({"_id": entry["_id"]})
+        new_entry = {**old_entry, **fields}
+        self.db.team_data.replace_one({"_id": entry["_id"]}, new_entry)
+        team_stats.update_entry(self.db, old_entry, new_entry)
+        return new_entry
+
+    def delete(self, entry):
+        old_entry = self.db.team_data.find_one({"_id": entry["_id"]})
+        self.db.team_data.delete_one({"_id": entry["_id"]})
+        team_stats.remove_entry(self.db, old_entry)
+
+
+def stats_rows(db, latest=True):
+    """Stats rows by key, without zero counters or bookkeeping fields"""
+    rows = {}
+    for row in db.team_stats.find({}, {"_id": 0, "updated_at": 0}):
+        key = tuple(row.pop(field) for field in team_stats.KEY_FIELDS)
+        rows[key] = {
+            field: value for field, value in row.items()
+            if value not in (0, None, "") and (latest or field not in LATEST_FIELDS)
+        }
+    return rows
+
+
+def assert_matches_rebuild(db, latest=True):
+    incremental = stats_rows(db, latest)
+    team_stats.rebuild_team_stats(db)
+    assert incremental == stats_rows(db, latest)
+
+
+@pytest.fixture
+def writer(db):
+    return Writer(db)
+
+
+def test_inserts_match_rebuild(db, writer):
+    teamless_scouter = ObjectId()
+    writer.insert(auto_purple_classified=3, teleop_green_overflow=2, climb_type="park", climb_success=True)
+    writer.insert(auto_purple_classified=0, climb_type="complete park", climb_success=False, robot_disabled="Full")
+    writer.insert(team_number=6000, teleop_purple_classified=4, robot_disabled="Partially", event_name="Fullerton")
+    writer.insert(event_code="USCALA", auto_green_overflow=1)
+    writer.insert(scouter_team=None, scouter_id=teamless_scouter, auto_purple_classified=5)
+    # Junk and missing values count as nothing
+    writer.insert(auto_purple_classified="abc", climb_type="park")
+
+    assert_matches_rebuild(db)
+    assert (f"user:{teamless_scouter}", "USCAFFL", 5000) in stats_rows(db)
+
+
+def test_updates_match_rebuild(db, writer):
+    first = writer.insert(auto_purple_classified=3, climb_type="park", climb_success=True)
+    second = writer.insert(teleop_green_classified=2, climb_type="stacked park")
+
+    writer.update(first, auto_purple_classified=0, teleop_purple_overflow=6, climb_success=False)
+    writer.update(second, climb_type="stacked park", climb_success=True, robot_disabled="Full")
+
+    assert_matches_rebuild(db)
+
+
+def test_update_moving_an_entry_matches_rebuild(db, writer):
+    entry = writer.insert(auto_purple_classified=3)
+    writer.insert(auto_purple_classified=1)
+
+    writer.update(entry, event_code="USCALA")
+    writer.update(writer.insert(team_number=6000, teleop_green_overflow=1), team_number=5000)
+    # Detached from the team into its scouter's own scope
+    writer.update(writer.insert(auto_green_classified=2), scouter_team=None)
+
+    assert_matches_rebuild(db)
+
+
+def test_deletes_match_rebuild(db, writer):
+    writer.insert(auto_purple_classified=3, climb_type="park", climb_success=True)
+    removed = writer.insert(auto_purple_classified=2, teleop_green_overflow=4, robot_disabled="Partially")
+    only = writer.insert(team_number=6000, auto_green_overflow=1)
+
+    writer.delete(removed)
+    writer.delete(only)
+
+    assert_matches_rebuild(db, latest=False)
+    rows = stats_rows(db)
+    assert (TEAM, "USCAFFL", 6000) not in rows
+    assert rows[(TEAM, "USCAFFL", 5000)]["count"] == 1
+
+
+def test_rebuild_of_some_scopes_keeps_the_others(db, writer):
+    writer.insert(auto_purple_classified=3)
+    writer.insert(scouter_team=4321, auto_purple_classified=1)
+    before = stats_rows(db)
+
+    db.team_stats.update_one({"scope": TEAM}, {"$inc": {"count": 5}})
+    team_stats.rebuild_team_stats(db, [TEAM])
+
+    assert stats_rows(db) == before